@@ -73,44 +73,56 @@ a = Entrypoint('koris', 'console_scripts', 'koris',
                       (octavia.egg_info, 'python_octaviaclient-%s.dist-info' % octavia.parsed_version.base_version),
                       (munch.egg_info, 'munch-%s.dist-info' % munch.parsed_version.base_version),
                       ],
+               # only modules which are loaded dynamically and thus can't be
+               # found by the analysis: the client versions and the keystone
+               # auth plugins, which are loaded via entry points
                hiddenimports=['novaclient.v2', 'cinderclient.v3',
-                              'keystoneauth1', 'keystoneclient',
                               'keystoneauth1.loading._plugins',
                               'keystoneauth1.loading._plugins.identity',
-                              'keystoneauth1.loading._plugins.identity.generic',
-                              'keystoneauth1.identity',
-                              'os_service_types',
-                              'openstacksdk',
-                              'openstack',
-                              'octaviaclient.api',
-                              'munch'])
+                              'keystoneauth1.loading._plugins.identity.generic'],
+               excludes=['tkinter', 'neutronclient.osc'])
 
 
 pyz = PYZ(a.pure, a.zipped_data,
           cipher=block_cipher)
 
 
-exe = EXE(pyz,
-          a.scripts,
-          a.binaries,
-          a.zipfiles,
-          a.datas,
-          [],
-          name='koris',
-          debug=False,
-          bootloader_ignore_signals=False,
-          strip=False,
-          upx=True,
-          runtime_tmpdir=None,
-          console=True)
-
-
-coll = COLLECT(
-    exe,
-    a.binaries,
-    a.zipfiles,
-    a.datas,
-    name='koris-dir',
-    strip=False,
-    upx=True
-)
+# By default the single file dist/koris is built, which unpacks itself to
+# a temporary directory on every start. KORIS_BUNDLE=onedir builds
+# dist/koris/koris instead, which starts right away.
+if os.environ.get('KORIS_BUNDLE', 'onefile') == 'onefile':
+    exe = EXE(pyz,
+              a.scripts,
+              a.binaries,
+              a.zipfiles,
+              a.datas,
+              [],
+              name='koris',
+              debug=False,
+              bootloader_ignore_signals=False,
+              strip=False,
+              upx=True,
+              runtime_tmpdir=None,
+              console=True)
+else:
+    exe = EXE(pyz,
+              a.scripts,
+              [],
+              exclude_binaries=True,
+              name='koris',
+              debug=False,
+              bootloader_ignore_signals=False,
+              strip=False,
+              # UPX compressed libraries are decompressed on every start
+              upx=False,
+              console=True)
+
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.zipfiles,
+        a.datas,
+        name='koris',
+        strip=False,
+        upx=False
+    )
@@ -1,8 +1,12 @@
 # pylint: disable=missing-docstring
 try:
-    import pkg_resources
-    __version__ = pkg_resources.get_distribution('koris').version
-except pkg_resources.DistributionNotFound:
+    from importlib.metadata import version, PackageNotFoundError
+except ImportError:  # python < 3.8
+    from importlib_metadata import version, PackageNotFoundError
+
+try:
+    __version__ = version('koris')
+except PackageNotFoundError:
     __version__ = '1.3.4'
 
 # Defining some constants
@@ -10,3 +14,4 @@ MASTER_PREFIX = "master"
 MASTER_LISTENER_NAME = f"{MASTER_PREFIX}-listener"
 MASTER_POOL_NAME = f"{MASTER_PREFIX}-pool"
 KUBERNETES_BASE_VERSION = "1.14.1"
+CLUSTER_TAG_KEY = "koris-cluster"
@@ -9,11 +9,11 @@ Don't use directly
 """
 import asyncio
 
-from cinderclient.exceptions import BadRequest, NotFound
-
-from koris.cloud.openstack import OSClusterInfo, LoadBalancer
+from koris.cloud.inventory import ClusterInventory
+from koris.cloud.state import ClusterState
+from koris.cloud.openstack import LoadBalancer, get_engine, delete_server
 from .util.hue import que, bold  # pylint: disable=no-name-in-module
-from .util.util import get_kubeconfig_yaml
+from .util.util import get_kubeconfig_yaml, host_names, TaskGraph
 from .util.logger import Logger
 
 
@@ -50,48 +50,103 @@ def write_kubeconfig(cluster_name, lb_ip, lb_port, ca_cert,
     return path
 
 
-# pylint: disable=too-many-locals
-def remove_cluster(config, nova, neutron, cinder, conn):
-    """Delete a cluster from OpenStack"""
-
-    cluster_info = OSClusterInfo(nova, neutron, cinder, config, conn)
-    masters = cluster_info.get_instances("node")
-    workers = cluster_info.get_instances("master")
-
-    tasks = [host.delete(neutron) for host in masters if host]
-    tasks += [host.delete(neutron) for host in workers if host]
-    if tasks:
-        LOGGER.debug("Deleting Instances ...")
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(asyncio.wait(tasks))
-        loop.close()
-
-    LoadBalancer(config, conn).delete()
-
-    sg_name = '%s-sec-group' % config['cluster-name']
-    secg = conn.list_security_groups({"name": sg_name})
-    if secg:
+def _list_ports(conn, inventory, sg_name):
+    """list the ports of the cluster and of its security group"""
+    # router interfaces are removed together with the router
+    ports = {port.id: port for port in inventory.ports
+             if not port.device_owner.startswith('network:')}
+    for sg in conn.network.security_groups(name=sg_name):
+        for port in conn.network.ports(security_group_ids=[sg.id]):
+            ports[port.id] = port
+    return list(ports.values())
+
+
+def _list_volumes(conn, config, inventory):
+    """list the volumes of the cluster"""
+    cluster_name = config['cluster-name']
+    volumes = {vol.id: vol for vol in inventory.volumes}
+    # volumes are named like their server, servers which failed to
+    # boot might be missing, so the expected names are checked too
+    names = {srv.name for srv in inventory.servers}
+    names.update(host_names("master", config['n-masters'], cluster_name))
+    names.update(host_names("node", config['n-nodes'], cluster_name))
+    for name in names:
+        for vol in conn.block_storage.volumes(name=name):
+            volumes[vol.id] = vol
+    return list(volumes.values())
+
+
+def _removal_graph(config, nova, neutron, conn):
+    """the tasks deleting the resources of a cluster, see remove_cluster"""
+    cluster_name = config['cluster-name']
+    sg_name = '%s-sec-group' % cluster_name
+    engine = get_engine(config.get('max-api-concurrency'))
+
+    async def fetch_inventory():
+        return await ClusterInventory(conn, cluster_name).refresh()
+
+    async def delete_instances(inventory):
+        if inventory.servers:
+            LOGGER.debug("Deleting Instances ...")
+            await asyncio.gather(*[delete_server(srv, nova, neutron)
+                                   for srv in inventory.servers])
+
+    async def delete_loadbalancer():
+        await engine.run(LoadBalancer(config, conn).delete)
+
+    async def delete_ports(inventory, _):
+        ports = await engine.run(_list_ports, conn, inventory, sg_name)
+        await asyncio.gather(*[
+            engine.run(conn.network.delete_port, port, ignore_missing=True)
+            for port in ports])
+
+    async def delete_secgroup(_, __):
         LOGGER.debug("Deleting SecurityGroup %s ...", sg_name)
-        for sg in secg:
-            for rule in sg.security_group_rules:
-                conn.delete_security_group_rule(rule['id'])
-
-            for port in conn.list_ports():
-                if sg.id in port.security_groups:
-                    conn.delete_port(port.id)
-    conn.delete_security_group(sg_name)
-
-    # This needs to be replaced with OpenStackAPI in the future
-    for vol in cinder.volumes.list():
-        try:
-            if config['cluster-name'] in vol.name and vol.status != 'in-use':
-                try:
-                    vol.delete()
-                except (BadRequest, NotFound):
-                    pass
-
-        except TypeError:
-            continue
-
-    # delete the cluster key pair
-    conn.delete_keypair(config['cluster-name'])
+        # neutron removes the rules together with the group
+        await engine.run(conn.delete_security_group, sg_name)
+
+    async def delete_volumes(inventory, _):
+        volumes = await engine.run(_list_volumes, conn, config, inventory)
+        await asyncio.gather(*[
+            engine.run(conn.block_storage.delete_volume, vol, ignore_missing=True)
+            for vol in volumes if vol.status != 'in-use'])
+
+    async def delete_keypair():
+        await engine.run(conn.delete_keypair, cluster_name)
+
+    graph = TaskGraph()
+    graph.add("inventory", fetch_inventory)
+    graph.add("instances", delete_instances, requires=("inventory",))
+    graph.add("loadbalancer", delete_loadbalancer)
+    graph.add("ports", delete_ports, requires=("inventory", "instances"))
+    # the LoadBalancer's port is in the security group
+    graph.add("secgroup", delete_secgroup, requires=("ports", "loadbalancer"))
+    graph.add("volumes", delete_volumes, requires=("inventory", "instances"))
+    graph.add("keypair", delete_keypair)
+    return graph
+
+
+def remove_cluster(config, nova, neutron, conn):
+    """Delete a cluster from OpenStack
+
+    The resources are deleted concurrently where possible. A resource is
+    only waited for, if another one depends on it:
+
+        - the ports of the security group are deleted after the servers
+        - the security group is deleted after the ports and the
+          LoadBalancer
+        - the volumes are deleted after the servers, i.e. when they are
+          detached
+
+    The resources are found by their cluster tag, see
+    :class:`koris.cloud.inventory.ClusterInventory`. Clusters created before
+    resources were tagged are still found by the names of their ports'
+    security group and their volumes. All lookups are filtered by
+    OpenStack, so the cost of a deletion depends on the size of the cluster
+    and not of the project.
+    """
+    graph = _removal_graph(config, nova, neutron, conn)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(graph.run())
+
+    ClusterState(config['cluster-name']).remove()
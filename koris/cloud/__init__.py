@@ -5,3 +5,7 @@ Currently we interface only with openstack, in the future we might add vSphere
 and AWS.
 """
 import openstack as OpenStackAPI  # noqa
+
+
+class BuilderError(Exception):
+    """Raise a custom error if the build fails"""
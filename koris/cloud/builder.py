@@ -10,25 +10,34 @@ import string
 import sys
 import time
 import urllib
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 import openstack
 from cryptography.hazmat.primitives import serialization
 
 from koris import KUBERNETES_BASE_VERSION
 from koris.cli import write_kubeconfig
-from koris.deploy.k8s import K8S, add_ingress_listeners
+from koris.deploy.k8s import K8S, READY_TIMEOUT, add_ingress_listeners
 from koris.provision.cloud_init import FirstMasterInit, NthMasterInit, NodeInit
-from koris.ssl import create_key, create_ca, CertBundle
+from koris.ssl import (create_key, create_ca, CertBundle, load_key,
+                       serialized_key, DEFAULT_KEY_ALGORITHM)
 from koris.ssl import discovery_hash as get_discovery_hash
 from koris.deploy.dex import (create_dex, create_oauth2, DexSSL,
                               create_dex_conf, ValidationError)
 from koris.util.logger import Logger
 from koris.ssl import b64_cert, b64_key
-from .openstack import (Instance, OSCloudConfig, LoadBalancer, InstanceExists)
+from koris.util.util import TaskGraph, WaitTimeout
+from .lbspec import api_server_listener, ingress_listeners
+from .openstack import (Instance, OSCloudConfig, LoadBalancer, InstanceExists,
+                        BuilderError, get_engine)
 
 
 LOGGER = Logger(__name__)
 
+# kubeadm accepts only RSA and ECDSA keys for the cluster CA
+CLUSTER_KEY_ALGORITHMS = ("RSA", "ECDSA")
+
 
 def get_server_range(servers, cluster_name, role, amount):
     """
@@ -58,6 +67,8 @@ class NodeBuilder:
         self.config = config
         self._info = osinfo
         self.cloud_config = cloud_config
+        self.instances = []
+        get_engine(config.get('max-api-concurrency'))
 
     def create_new_nodes(self,
                          role='node',
@@ -79,7 +90,7 @@ class NodeBuilder:
                            'class': self._info.storage_class},
                           flavor
                           ) for n in
-                 get_server_range(self._info.compute_client.servers.list(),
+                 get_server_range(self._info.servers_by_role(role),
                                   self.config['cluster-name'],
                                   role,
                                   amount)]
@@ -190,6 +201,7 @@ class NodeBuilder:
         """
         loop = asyncio.get_event_loop()
         tasks = []
+        self.instances = nodes
 
         for node in nodes:
             if node.exists:
@@ -228,6 +240,8 @@ class ControlPlaneBuilder:  # pylint: disable=too-many-locals,too-many-arguments
         self._config = config
         self._info = osinfo
         self.cloud_config = cloud_config
+        self.instances = []
+        get_engine(config.get('max-api-concurrency'))
 
     def get_masters(self):
         """
@@ -254,6 +268,7 @@ class ControlPlaneBuilder:  # pylint: disable=too-many-locals,too-many-arguments
 
         loop = asyncio.get_event_loop()
         tasks = []
+        self.instances = masters
 
         for index, master in enumerate(masters):
             if master.exists:
@@ -308,7 +323,7 @@ class ControlPlaneBuilder:  # pylint: disable=too-many-locals,too-many-arguments
         """
         role = 'master'
         master_number = next(iter(
-            get_server_range(self._info.compute_client.servers.list(),
+            get_server_range(self._info.servers_by_role(role),
                              self._config['cluster-name'],
                              role,
                              1)))
@@ -376,6 +391,91 @@ class ControlPlaneBuilder:  # pylint: disable=too-many-locals,too-many-arguments
         return task.result()
 
 
+class PKIBuilder:
+    """
+    Create the key material and certificates of a cluster.
+
+    RSA key generation is CPU bound and takes a noticeable time per key,
+    hence all keys are created in worker processes as soon as
+    :meth:`start` is called, while networking and the LoadBalancer are
+    created. :meth:`create` then signs the Kubernetes and Dex
+    certificates with these keys.
+
+    Args:
+        cert_dir (str): The directory where the Dex certificates are saved.
+        dex (bool): Whether the Dex CA and client keys are needed.
+        algorithm (str): The algorithm of the certificate keys, see
+            :data:`koris.ssl.KEY_ALGORITHMS`. The SSH key is always RSA,
+            since the master bootstrap script uses the RSA host key.
+
+    Attributes:
+        ca_bundle (:class:`koris.ssl.CertBundle`): The Kubernetes CA.
+        client_bundle (:class:`koris.ssl.CertBundle`): The admin client
+            certificate of the kubeconfig.
+        dex_ssl (:class:`koris.deploy.dex.DexSSL`): The Dex certificates.
+        ssh_key: The private SSH key of the first master.
+    """
+    KEYS = ("ca", "client", "ssh")
+    DEX_KEYS = ("dex_ca", "dex_client")
+
+    def __init__(self, cert_dir, dex=False, algorithm=DEFAULT_KEY_ALGORITHM):
+        self.cert_dir = cert_dir
+        self.algorithm = algorithm
+        self.names = self.KEYS + (self.DEX_KEYS if dex else ())
+        self._executor = None
+        self._futures = {}
+        self._started = None
+
+        self.ca_bundle = None
+        self.client_bundle = None
+        self.dex_ssl = None
+        self.ssh_key = None
+
+    def start(self):
+        """Start creating the keys in the background"""
+        self._started = time.perf_counter()
+        self._executor = ProcessPoolExecutor(max_workers=len(self.names))
+        self._futures = {
+            name: self._executor.submit(
+                serialized_key,
+                algorithm="RSA" if name == "ssh" else self.algorithm)
+            for name in self.names}
+
+    def keys(self):
+        """Wait for the keys and return them by name"""
+        if not self._futures:
+            self.start()
+        keys = {name: load_key(future.result())
+                for name, future in self._futures.items()}
+        self._executor.shutdown()
+        LOGGER.debug("Created %d keys in %.2fs", len(keys),
+                     time.perf_counter() - self._started)
+        return keys
+
+    def create(self, issuer=None):
+        """
+        Create the Kubernetes CA, the admin client certificate and, if
+        requested, the Dex certificates.
+
+        Args:
+            issuer (str): The issuer of the Dex CA.
+        """
+        keys = self.keys()
+        self.ssh_key = keys["ssh"]
+        self.ca_bundle = ClusterBuilder.create_ca(keys["ca"])
+        self.client_bundle = CertBundle.create_signed(
+            self.ca_bundle, "DE", "BY", "NUE", "system:masters",
+            "system:masters", "kubernetes-admin", "", "", key=keys["client"])
+
+        if "dex_ca" in keys:
+            LOGGER.info("Setting up Dex SSL infrastructure ...")
+            LOGGER.info("Dex CA Issuer set to %s", issuer)
+            self.dex_ssl = DexSSL(self.cert_dir, issuer,
+                                  ca_key=keys["dex_ca"],
+                                  client_key=keys["dex_client"])
+            self.dex_ssl.save_certs()
+
+
 class ClusterBuilder:  # pylint: disable=too-few-public-methods
     """
     Plan and build a kubernetes cluster in the cloud
@@ -385,6 +485,12 @@ class ClusterBuilder:  # pylint: disable=too-few-public-methods
             LOGGER.error("You must have an odd number (>=1) of masters!")
             sys.exit(2)
 
+        self.key_algorithm = config.get('key_algorithm', DEFAULT_KEY_ALGORITHM)
+        if self.key_algorithm not in CLUSTER_KEY_ALGORITHMS:
+            LOGGER.error("key_algorithm must be one of %s",
+                         ", ".join(CLUSTER_KEY_ALGORITHMS))
+            sys.exit(2)
+
         self.nova, self.neutron, self.cinder = nova, neutron, cinder
         self.conn = conn
         self.info = oscinfo
@@ -414,16 +520,16 @@ class ClusterBuilder:  # pylint: disable=too-few-public-methods
         return get_discovery_hash(ca_bundle.cert)
 
     @staticmethod
-    def create_ca():
-        """create a self signed CA"""
-        _key = create_key(size=2048)
+    def create_ca(key=None):
+        """create a self signed CA, with a new key unless one is given"""
+        _key = key or create_key(size=2048)
         _ca = create_ca(_key, _key.public_key(),
                         "DE", "BY", "NUE",
                         "Kubernetes", "CDA-RT",
                         "kubernetes-ca")
         return CertBundle(_key, _ca)
 
-    def create_ssh_keypair(self):
+    def create_ssh_keypair(self, ssh_key=None):
         """Generates a keypair for the first master node.
 
         The master node needs a keypair which is uploaded to OpenStack. This
@@ -431,11 +537,14 @@ class ClusterBuilder:  # pylint: disable=too-few-public-methods
 
         This key pair is also added as a secret to the master-adder-pod.
 
+        Args:
+            ssh_key: The private key to upload, a new one is created if None.
+
         Returns:
             An OpenStack keypair.
         """
 
-        ssh_key = create_key()
+        ssh_key = ssh_key or create_key()
         pub_key_ascii = ssh_key.public_key().public_bytes(
             serialization.Encoding.OpenSSH,
             serialization.PublicFormat.OpenSSH).decode()
@@ -474,35 +583,41 @@ class ClusterBuilder:  # pylint: disable=too-few-public-methods
         LOGGER.info("Building Kubernetes %s cluster '%s'",
                     k8s_version, config['cluster-name'])
 
-        LOGGER.info("Setting up networking ...")
-        cloud_config = self.create_network()
-        # generate CA key pair for the cluster, that is used to authenticate
-        # the clients that can use kubeadm
-
-        LOGGER.info("Creating Kubernetes CA ...")
-        ca_bundle = self.create_ca()
-        ssh_key = self.create_ssh_keypair()
-        cert_dir = "-".join(("certs", config["cluster-name"]))
-
         # Check if dex has to be deployed
         if 'addons' in config and 'dex' in config['addons']:
             self.deploy_dex = True
             LOGGER.info("Addons: Dex will be configured")
 
-        # generate ssh key pair for first master node. It is used to connect
-        # to the other nodes so that they can join the cluster
-        ssh_key = self.create_ssh_keypair()
+        # the keys are created in the background while the network and the
+        # LoadBalancer are set up
+        pki = PKIBuilder("-".join(("certs", config["cluster-name"])),
+                         dex=self.deploy_dex, algorithm=self.key_algorithm)
+        pki.start()
+
+        LOGGER.info("Setting up networking ...")
+        cloud_config = self.create_network()
 
         # create a load balancer for accessing the API server of the cluster;
         # do not add a listener, since we created no machines yet.
         LOGGER.info("Creating the LoadBalancer ...")
-        lbinst = LoadBalancer(config, self.conn, self.neutron)
+        lbinst = LoadBalancer(config, self.conn)
         lb, floatingip = lbinst.get_or_create()
         lb_port = "6443"
 
         lb_dns = config.get('loadbalancer', {}).get('dnsname') or floatingip
         lb_ip = floatingip if floatingip else lb['vip_address']
 
+        # generate CA key pair for the cluster, that is used to authenticate
+        # the clients that can use kubeadm.
+        # Dex Issuer will be set to the Floating IP, or LoadBalancer DNS Name
+        LOGGER.info("Creating Kubernetes CA ...")
+        pki.create(issuer=lb_dns or lb_ip)
+        ca_bundle = pki.ca_bundle
+
+        # upload the ssh key pair of the first master node. It is used to
+        # connect to the other nodes so that they can join the cluster
+        ssh_key = self.create_ssh_keypair(pki.ssh_key)
+
         # calculate information needed for joining nodes to the cluster...
         # calculate bootstrap token
         bootstrap_token = ClusterBuilder.create_bootstrap_token()
@@ -511,18 +626,9 @@ class ClusterBuilder:  # pylint: disable=too-few-public-methods
         discovery_hash = self.calculate_discovery_hash(ca_bundle)
 
         if self.deploy_dex:
-            LOGGER.info("Setting up Dex SSL infrastructure ...")
-            # Dex Issuer will be set to the Floating IP, or LoadBalancer DNS Name
-            if lb_dns == lb_ip or lb_dns is None:
-                issuer = lb_ip
-            else:
-                issuer = lb_dns
-            LOGGER.info("Dex CA Issuer set to %s", issuer)
-            dex_ssl = DexSSL(cert_dir, issuer)
-            dex_ssl.save_certs()
-
             try:
-                self.dex_conf = create_dex_conf(config['addons']['dex'], dex_ssl)
+                self.dex_conf = create_dex_conf(config['addons']['dex'],
+                                                pki.dex_ssl)
             except (ValidationError, TypeError, KeyError) as exc:
                 LOGGER.error(f"Unable to parse dex config: {exc}")
                 LOGGER.error("Skipping Dex deployment")
@@ -531,7 +637,7 @@ class ClusterBuilder:  # pylint: disable=too-few-public-methods
 
         # create the master nodes with ssh_key (private and public key)
         # first task in returned list is task for first master node
-        LOGGER.info("Waiting for master instances to be launched...")
+        LOGGER.info("Launching master and worker instances ...")
         master_tasks = self.masters_builder.create_masters_tasks(
             ssh_key, ca_bundle, cloud_config, lb_ip, lb_port,
             bootstrap_token, lb_dns,
@@ -539,63 +645,19 @@ class ClusterBuilder:  # pylint: disable=too-few-public-methods
             config.get("pod_network", "CALICO"),
             dex=self.dex_conf,
             k8s_version=k8s_version)
-        loop = asyncio.get_event_loop()
-        master_results = loop.run_until_complete(asyncio.gather(*master_tasks))
-
-        master_ips = [x.ip_address for x in master_results if
-                      isinstance(x, Instance)]
-
-        # add a listener for the first master node, since this is the node we
-        # call kubeadm init on
-        LOGGER.info("Configuring the LoadBalancer ...")
-        first_master_ip = master_results[0].ip_address
-        configure_lb_task = loop.create_task(
-            lbinst.configure([first_master_ip]))
 
-        # create the worker nodes
-        LOGGER.info("Waiting for worker instances to be launched and the "
-                    "LoadBalancer to be configured...")
+        # the worker nodes retry joining until the API server is reachable,
+        # so they can boot at the same time as the masters
         node_tasks = self.nodes_builder.create_initial_nodes(
             cloud_config, ca_bundle, lb_ip, lb_port, bootstrap_token,
             discovery_hash, k8s_version=k8s_version,
             pod_network=config['pod_network']
         )
 
-        node_tasks.append(configure_lb_task)
-        node_results = loop.run_until_complete(asyncio.gather(*node_tasks))
-        LOGGER.debug("Finished node tasks")
-
-        node_ips = [x.ip_address for x in node_results if isinstance(x, Instance)]
-
-        if self.deploy_dex:
-            LOGGER.info("Configuring the LoadBalancer for Dex ...")
-            dex_listener = self.dex_conf['ports']['listener']
-            dex_service = self.dex_conf['ports']['service']
-            dex_members = master_ips
-            dex_task = loop.create_task(create_dex(lbinst,
-                                                   listener_port=dex_listener,
-                                                   pool_port=dex_service,
-                                                   members=dex_members))
-
-            client_listener = self.dex_conf['client']['ports']['listener']
-            client_service = self.dex_conf['client']['ports']['service']
-            client_members = node_ips
-            oauth_task = loop.create_task(create_oauth2(lbinst,
-                                                        listener_port=client_listener,
-                                                        pool_port=client_service,
-                                                        members=client_members))
-            tasks = [dex_task, oauth_task]
-            loop.run_until_complete(asyncio.gather(*tasks))
-            LOGGER.info("Finished configuring LoadBalancer for Dex")
-
         # We should no be able to query the API server for available nodes
-        # with a valid certificate from the generated CA. Hence, generate
-        # a client certificate.
-        LOGGER.info("Talking to the API server and waiting for masters to be "
-                    "online.")
-        client_cert = CertBundle.create_signed(
-            ca_bundle, "DE", "BY", "NUE", "system:masters", "system:masters",
-            "kubernetes-admin", "", "")
+        # with a valid certificate from the generated CA. Hence, the PKI
+        # contains a client certificate.
+        client_cert = pki.client_bundle
 
         # send certificates and keys to kube config
         kubeconfig = write_kubeconfig(config["cluster-name"], lb_ip,
@@ -603,34 +665,125 @@ class ClusterBuilder:  # pylint: disable=too-few-public-methods
                                       b64_cert(client_cert.cert),
                                       b64_key(client_cert.key))
 
-        # Now connect to the the API server and query which masters are
-        # available.
-        k8s = K8S(kubeconfig)
-
-        LOGGER.logger.handlers[0].terminator = ""
-        LOGGER.info("Waiting for Kubernetes API Server to become available ...")
-        while not k8s.is_ready:
-            time.sleep(2)
-            LOGGER.info(".", color=False)
-
-        LOGGER.logger.handlers[0].terminator = "\n"
-        LOGGER.info("", color=None)
-        LOGGER.success("Kubernetes API is ready!")
-        LOGGER.info("Waiting for all masters to become Ready ...")
-        lb_masters = [{"name": x.name,
-                       "address": x.ip_address,
-                       "protocol_port": 6443,
-                       "monitor_port": 6443} for x in master_results if
-                      isinstance(x, Instance)]
-        lb_nodes = [{"name": x.name,
-                     "address": x.ip_address,
-                     } for x in node_results if isinstance(x, Instance)]
-        if not lbinst.bulk_update_members(lb_masters):
-            k8s.add_all_masters_to_loadbalancer(config['cluster-name'],
-                                                len(master_tasks), lbinst)
-        k8s.apply_addons(config)
-        add_ingress_listeners(k8s.nginx_ingress_ports, lbinst,
-                              lb_masters + lb_nodes)
-        LOGGER.success("Configured LoadBalancer to use all API servers")
+        graph = self.build_graph(config, lbinst, master_tasks, node_tasks,
+                                 kubeconfig)
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(graph.run())
         LOGGER.success("Kubernetes cluster is ready to use !")
         loop.close()
+
+    # pylint: disable=too-many-arguments
+    def build_graph(self, config, lbinst, master_tasks, node_tasks, kubeconfig):
+        """
+        Describe the steps after launching the instances as a
+        :class:`koris.util.util.TaskGraph`.
+
+        Each step starts as soon as its inputs exist: the IP addresses of
+        the instances are known before they boot, thus the LoadBalancer is
+        configured while they boot. The ingress listeners are created early
+        and get their members once the ingress NodePorts are known.
+        """
+        cluster_name = config['cluster-name']
+        engine = get_engine()
+        master_ips = [master.ip_address for master in self.masters_builder.instances]
+        graph = TaskGraph()
+
+        async def boot(tasks):
+            results = await asyncio.gather(*tasks)
+            return [x for x in results if isinstance(x, Instance)]
+
+        graph.add("masters", partial(boot, master_tasks))
+        graph.add("nodes", partial(boot, node_tasks))
+
+        # add a listener for the first master node, since this is the node
+        # we call kubeadm init on
+        graph.add("lb_api", partial(lbinst.configure, master_ips[:1]))
+        graph.add("ingress_listeners",
+                  partial(engine.run, lbinst.apply,
+                          ingress_listeners(cluster_name)),
+                  requires=("lb_api",))
+
+        if self.deploy_dex:
+            self._add_dex_tasks(graph, lbinst, master_ips)
+
+        self._add_readiness_tasks(graph, kubeconfig)
+
+        async def lb_masters(_):
+            await engine.run(lbinst.apply,
+                             [api_server_listener(cluster_name, master_ips)])
+            LOGGER.success("Configured LoadBalancer to use all API servers")
+
+        async def addons(k8s):
+            await engine.run(k8s.apply_addons, config)
+            return k8s
+
+        async def ingress_members(k8s, master_results, node_results, _):
+            hosts = [{"name": x.name, "address": x.ip_address} for x in
+                     master_results + node_results]
+            ports = await engine.run(lambda: k8s.nginx_ingress_ports)
+            await engine.run(add_ingress_listeners, ports, lbinst, hosts)
+
+        graph.add("lb_masters", lb_masters, requires=("api_ready",))
+        graph.add("addons", addons, requires=("api_ready",))
+        graph.add("ingress_members", ingress_members,
+                  requires=("addons", "masters", "nodes", "ingress_listeners"))
+        return graph
+
+    def _add_dex_tasks(self, graph, lbinst, master_ips):
+        """Add the tasks configuring the LoadBalancer for Dex and OAuth2"""
+        dex_ports = self.dex_conf['ports']
+        client_ports = self.dex_conf['client']['ports']
+        nodes = self.nodes_builder.instances
+
+        async def dex(_):
+            LOGGER.info("Configuring the LoadBalancer for Dex ...")
+            await create_dex(lbinst,
+                             listener_port=dex_ports['listener'],
+                             pool_port=dex_ports['service'],
+                             members=master_ips)
+            LOGGER.info("Finished configuring LoadBalancer for Dex")
+
+        async def oauth2(_):
+            await create_oauth2(lbinst,
+                                listener_port=client_ports['listener'],
+                                pool_port=client_ports['service'],
+                                members=[node.ip_address for node in nodes])
+            LOGGER.info("Finished configuring LoadBalancer for OAuth2")
+
+        graph.add("dex", dex, requires=("lb_api",))
+        graph.add("oauth2", oauth2, requires=("lb_api",))
+
+    def _add_readiness_tasks(self, graph, kubeconfig):
+        """Add the tasks waiting for the API server and all nodes to be ready
+
+        The task ``api_ready`` returns a :class:`koris.deploy.k8s.K8S` for
+        the following tasks.
+        """
+        engine = get_engine()
+        masters = self.masters_builder.instances
+        nodes = self.nodes_builder.instances
+        deadline = time.monotonic() + READY_TIMEOUT
+
+        async def api_ready(*_):
+            # Now connect to the the API server and query which masters are
+            # available.
+            LOGGER.info("Waiting for Kubernetes API Server to become available ...")
+            k8s = K8S(kubeconfig)
+            try:
+                await engine.run(k8s.wait_for_api, deadline)
+            except WaitTimeout as err:
+                raise BuilderError(str(err))
+            LOGGER.success("Kubernetes API is ready!")
+            return k8s
+
+        async def nodes_ready(k8s, *_):
+            LOGGER.info("Waiting for all masters and nodes to become Ready ...")
+            try:
+                await engine.run(k8s.wait_for_nodes, len(masters), len(nodes),
+                                 deadline)
+            except WaitTimeout as err:
+                raise BuilderError(str(err))
+
+        graph.add("api_ready", api_ready, requires=("lb_api", "masters"))
+        graph.add("nodes_ready", nodes_ready,
+                  requires=("api_ready", "masters", "nodes"))
@@ -0,0 +1,112 @@
+"""
+inventory.py
+============
+
+Fetch all OpenStack resources of a cluster with a few list calls.
+
+koris tags every resource it creates with the name of the cluster, see
+:func:`koris.cloud.openstack.cluster_tag` and
+:func:`koris.cloud.openstack.cluster_metadata`. The inventory lists each
+resource type once, filtered by OpenStack, instead of looking up every
+resource by its name.
+"""
+import asyncio
+import re
+
+from koris.cloud.openstack import (get_engine, cluster_tag, cluster_metadata)
+from koris.util.logger import Logger
+
+LOGGER = Logger(__name__)
+
+
+class ClusterInventory:  # pylint: disable=too-many-instance-attributes
+    """All OpenStack resources of a cluster.
+
+    Servers, ports, networks, subnets, routers, security groups and
+    loadbalancers are filtered by their tag, volumes by their metadata.
+    Servers are also matched by an anchored name pattern, since clusters
+    created before koris tagged servers may have untagged ones.
+
+    Example:
+        >>> inventory = ClusterInventory(conn, "test")
+        >>> await inventory.refresh()
+        >>> inventory.server("test-node-1")
+
+    Args:
+        conn: An OpenStack Connection object.
+        cluster_name (str): The name of the cluster.
+    """
+
+    def __init__(self, conn, cluster_name):
+        self.conn = conn
+        self.cluster_name = cluster_name
+        self.servers = []
+        self.volumes = []
+        self.ports = []
+        self.networks = []
+        self.subnets = []
+        self.routers = []
+        self.security_groups = []
+        self.loadbalancers = []
+
+    @property
+    def server_pattern(self):
+        """the pattern matching the names of masters and nodes"""
+        return r"^%s-(master|node)-[0-9]+$" % self.cluster_name
+
+    def _list_servers(self):
+        servers = {srv.id: srv for srv in self.conn.compute.servers(
+            details=True, tags=cluster_tag(self.cluster_name))}
+        # servers of clusters created before koris tagged servers, also
+        # after new, tagged servers were added to such a cluster
+        for srv in self.conn.compute.servers(details=True,
+                                             name=self.server_pattern):
+            if re.match(self.server_pattern, srv.name):
+                servers.setdefault(srv.id, srv)
+        return list(servers.values())
+
+    def _list_volumes(self):
+        # cinder evaluates the metadata filter as a python literal
+        metadata = str(cluster_metadata(self.cluster_name))
+        return list(self.conn.block_storage.volumes(details=True,
+                                                    properties=metadata))
+
+    async def refresh(self):
+        """List all resources of the cluster concurrently.
+
+        Returns:
+            The inventory itself.
+        """
+        engine = get_engine()
+        tag = cluster_tag(self.cluster_name)
+
+        def tagged(list_func):
+            return engine.run(lambda: list(list_func(tags=tag)))
+
+        (self.servers, self.volumes, self.ports, self.networks, self.subnets,
+         self.routers, self.security_groups,
+         self.loadbalancers) = await asyncio.gather(
+             engine.run(self._list_servers),
+             engine.run(self._list_volumes),
+             tagged(self.conn.network.ports),
+             tagged(self.conn.network.networks),
+             tagged(self.conn.network.subnets),
+             tagged(self.conn.network.routers),
+             tagged(self.conn.network.security_groups),
+             tagged(self.conn.load_balancer.load_balancers))
+
+        LOGGER.debug("Found %d servers, %d volumes and %d ports of cluster %s",
+                     len(self.servers), len(self.volumes), len(self.ports),
+                     self.cluster_name)
+        return self
+
+    def server(self, name):
+        """Return the server with the given name, or None"""
+        for srv in self.servers:
+            if srv.name == name:
+                return srv
+        return None
+
+    def server_ports(self, server):
+        """Return the ports attached to a server"""
+        return [port for port in self.ports if port.device_id == server.id]
@@ -0,0 +1,300 @@
+"""
+lbspec.py
+=========
+
+A declarative description of the listeners, pools, members and health
+monitors of the cluster LoadBalancer.
+
+Instead of creating each part of the LoadBalancer with its own request and
+waiting for the LoadBalancer to become ACTIVE after every one of them, the
+desired state is described with :class:`ListenerSpec`, :class:`PoolSpec`
+and :class:`MemberSpec`. :class:`LoadBalancerPlanner` compares it with the
+current state and applies the difference with as few requests as possible:
+
+* a missing LoadBalancer is created together with all listeners, pools,
+  members and health monitors in one request,
+* a missing listener is created together with its pool, members and
+  health monitor in one request,
+* the members of an existing pool are replaced with one batch update,
+* a listener with another protocol or port is deleted with its pool and
+  created again.
+
+Listeners and pools which are not part of the spec are left untouched.
+
+Example:
+    >>> spec = [api_server_listener("test", ["10.0.0.1", "10.0.0.2"])]
+    >>> LoadBalancerPlanner(lbinst, spec).apply()
+"""
+from collections import namedtuple
+
+from openstack.exceptions import ConflictException as OSConflict
+
+from koris import MASTER_LISTENER_NAME, MASTER_POOL_NAME
+from koris.cloud import BuilderError
+from koris.util.util import retry
+from koris.util.logger import Logger
+
+LOGGER = Logger(__name__)
+
+HEALTH_MONITOR = {'type': 'TCP', 'delay': 5, 'timeout': 3, 'max_retries': 4}
+
+Step = namedtuple("Step", ["action", "listener", "target"])
+
+
+class MemberSpec:
+    """A member of a pool.
+
+    Args:
+        address (str): The IP address of the member.
+        protocol_port (int): The port traffic is sent to.
+        name (str): The name of the member, usually the host name.
+        monitor_port (int): The port checked by the health monitor, if it
+            differs from the protocol_port.
+    """
+
+    def __init__(self, address, protocol_port, name=None, monitor_port=None):
+        self.address = address
+        self.protocol_port = protocol_port
+        self.name = name
+        self.monitor_port = monitor_port
+
+    @property
+    def key(self):
+        """The attributes which identify a member in a pool"""
+        return (self.address, self.protocol_port)
+
+    def to_api(self, subnet_id=None):
+        """Return the member as expected by the Octavia API"""
+        out = {'address': self.address, 'protocol_port': self.protocol_port}
+        if self.name:
+            out['name'] = self.name
+        if self.monitor_port:
+            out['monitor_port'] = self.monitor_port
+        if subnet_id:
+            out['subnet_id'] = subnet_id
+        return out
+
+
+class PoolSpec:  # pylint: disable=too-few-public-methods
+    """A pool with its members and health monitor.
+
+    Args:
+        name (str): The name of the pool.
+        protocol (str): The protocol used to talk to the members.
+        lb_algorithm (str): The load balancing algorithm.
+        members (list): A list of :class:`MemberSpec`.
+        monitor (bool): Whether the pool gets a TCP health monitor.
+    """
+
+    def __init__(self, name, protocol="HTTPS", lb_algorithm="SOURCE_IP",
+                 members=(), monitor=True):
+        self.name = name
+        self.protocol = protocol
+        self.lb_algorithm = lb_algorithm
+        self.members = list(members)
+        self.monitor = monitor
+
+    def to_api(self, subnet_id=None):
+        """Return the pool, including members and monitor, for the Octavia API"""
+        out = {'name': self.name,
+               'protocol': self.protocol,
+               'lb_algorithm': self.lb_algorithm,
+               'members': [m.to_api(subnet_id) for m in self.members]}
+        if self.monitor:
+            out['healthmonitor'] = dict(HEALTH_MONITOR,
+                                        name=f"{self.name}-health")
+        return out
+
+
+class ListenerSpec:  # pylint: disable=too-few-public-methods
+    """A listener and its default pool.
+
+    Args:
+        name (str): The name of the listener.
+        protocol (str): The protocol the listener accepts.
+        protocol_port (int): The port the listener listens on.
+        pool (PoolSpec): The default pool of the listener.
+    """
+
+    def __init__(self, name, protocol, protocol_port, pool):
+        self.name = name
+        self.protocol = protocol
+        self.protocol_port = protocol_port
+        self.pool = pool
+
+    def to_api(self, subnet_id=None):
+        """Return the listener, including its pool, for the Octavia API"""
+        return {'name': self.name,
+                'protocol': self.protocol,
+                'protocol_port': self.protocol_port,
+                'admin_state_up': True,
+                'default_pool': self.pool.to_api(subnet_id)}
+
+
+def api_server_listener(cluster_name, master_ips, port=6443):
+    """The listener of the Kubernetes API servers
+
+    Args:
+        cluster_name (str): The name of the cluster.
+        master_ips (list): The IP addresses of the masters.
+        port (int): The port of the API server.
+    """
+    members = [MemberSpec(ip, port, monitor_port=port) for ip in master_ips]
+    return ListenerSpec('-'.join((MASTER_LISTENER_NAME, cluster_name)),
+                        "HTTPS", port,
+                        PoolSpec('-'.join((MASTER_POOL_NAME, cluster_name)),
+                                 "HTTPS", members=members))
+
+
+def ingress_listeners(cluster_name, node_ports=None, hosts=()):
+    """The HTTP and HTTPS listeners of the nginx ingress controller
+
+    Without node_ports, the listeners and pools are described without
+    members, so they can be created before the ingress service exists.
+
+    Args:
+        cluster_name (str): The name of the cluster.
+        node_ports (dict): The ports of the ingress service by protocol, see
+            :attr:`koris.deploy.k8s.K8S.nginx_ingress_ports`.
+        hosts (list): dicts with the ``name`` and ``address`` of the members.
+    """
+    listeners = []
+    for key, port in {'Ingress-HTTP': 80, 'Ingress-HTTPS': 443}.items():
+        protocol = key.split("-")[-1]
+        name = '-'.join((key, cluster_name))
+        members = []
+        if node_ports:
+            node_port = node_ports[protocol].node_port
+            members = [MemberSpec(host['address'], node_port,
+                                  name=host.get('name'))
+                       for host in hosts]
+        # the ingress pools have no health monitor
+        listeners.append(ListenerSpec(name, protocol, port,
+                                      PoolSpec(name, protocol, members=members,
+                                               monitor=False)))
+    return listeners
+
+
+def _check_response(response, what):
+    if response.status_code == 409:
+        # raising this exception causes retry
+        raise OSConflict(response.reason)
+    if response.status_code >= 400:
+        raise BuilderError("Unable to create %s: %s %s" % (
+            what, response.status_code, response.text))
+    return response.json()
+
+
+class LoadBalancerPlanner:
+    """Apply a list of :class:`ListenerSpec` to a LoadBalancer.
+
+    Args:
+        lb (:class:`koris.cloud.openstack.LoadBalancer`): The LoadBalancer.
+        listeners (list): The desired :class:`ListenerSpec`.
+    """
+
+    def __init__(self, lb, listeners):
+        self.lb = lb
+        self.listeners = list(listeners)
+
+    @property
+    def octavia(self):
+        """The Octavia proxy of the LoadBalancer's connection"""
+        return self.lb.conn.load_balancer
+
+    def plan(self):
+        """Compare the spec with the current state of the LoadBalancer.
+
+        Returns:
+            A list of :class:`Step`, which are needed to reach the spec.
+        """
+        if not self.lb.id and not self.lb.get():
+            return [Step("create_loadbalancer", None, None)]
+
+        current = {listener.name: listener for listener in
+                   self.octavia.listeners(load_balancer_id=self.lb.id)}
+        steps = []
+        for spec in self.listeners:
+            listener = current.get(spec.name)
+            if listener is None:
+                steps.append(Step("create_listener", spec, None))
+                continue
+            # Octavia can't change the protocol or port of a listener
+            if (listener.protocol, listener.protocol_port) != (
+                    spec.protocol, spec.protocol_port):
+                steps.append(Step("replace_listener", spec, listener))
+                continue
+            if not listener.default_pool_id:
+                steps.append(Step("create_pool", spec, listener.id))
+                continue
+
+            pool = self.octavia.get_pool(listener.default_pool_id)
+            members = {(m.address, m.protocol_port) for m in
+                       self.octavia.members(pool.id)}
+            if members != {m.key for m in spec.pool.members}:
+                steps.append(Step("update_members", spec, pool.id))
+            if spec.pool.monitor and not pool.health_monitor_id:
+                steps.append(Step("create_health_monitor", spec, pool.id))
+        return steps
+
+    def apply(self):
+        """Apply the spec to the LoadBalancer.
+
+        The LoadBalancer's lock is held while planning and applying, see
+        :func:`koris.cloud.openstack.get_lb_lock`.
+
+        Returns:
+            The list of :class:`Step` which were applied.
+        """
+        # no other thread may change the LoadBalancer between the plan
+        # and its steps
+        with self.lb.lock:
+            steps = self.plan()
+            for step in steps:
+                LOGGER.debug("LoadBalancer %s: %s %s", self.lb.name,
+                             step.action,
+                             step.listener.name if step.listener else "")
+                self._apply(step)
+        self.lb.invalidate()
+        return steps
+
+    @retry(exceptions=OSConflict, tries=5, delay=1, backoff=2,
+           logger=LOGGER.debug)
+    def _apply(self, step):
+        if step.action == "create_loadbalancer":
+            self.lb.create(listeners=self.listeners)
+            return
+
+        self.lb.wait_until_active()
+        getattr(self, "_" + step.action)(step)
+
+    def _create_listener(self, step):
+        body = step.listener.to_api(self.lb.subnet_id)
+        body['loadbalancer_id'] = self.lb.id
+        _check_response(self.octavia.post('/lbaas/listeners',
+                                          json={'listener': body}),
+                        "listener %s" % step.listener.name)
+
+    def _replace_listener(self, step):
+        listener = step.target
+        # deleting the pool deletes its members and health monitor, too
+        if listener.default_pool_id:
+            self.octavia.delete_pool(listener.default_pool_id)
+            self.lb.wait_until_active()
+        self.octavia.delete_listener(listener.id)
+        self.lb.wait_until_active()
+        self._create_listener(step)
+
+    def _create_pool(self, step):
+        body = step.listener.pool.to_api(self.lb.subnet_id)
+        body['listener_id'] = step.target
+        _check_response(self.octavia.post('/lbaas/pools', json={'pool': body}),
+                        "pool %s" % step.listener.pool.name)
+
+    def _update_members(self, step):
+        members = [m.to_api() for m in step.listener.pool.members]
+        self.lb.bulk_update_members(members, step.target)
+
+    def _create_health_monitor(self, step):
+        self.lb.add_health_monitor(step.target,
+                                   f"{step.listener.pool.name}-health")
@@ -3,14 +3,22 @@ functions and classes to interact with openstack
 """
 # pylint: disable=too-many-lines
 import asyncio
+import atexit
 import base64
 import copy
+import hashlib
 import json
 import os
+import re
 import sys
 import textwrap
+import threading
+import time
 
-from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+
+import requests
 
 from netaddr import IPNetwork, valid_ipv4, valid_ipv6
 from novaclient import client as nvclient
@@ -20,31 +28,161 @@ from cinderclient import client as cclient
 from neutronclient.v2_0 import client as ntclient
 from neutronclient.common.exceptions import (Conflict as NeutronConflict,
                                              StateInvalidClient, NotFound,
-                                             BadRequest)
-from octaviaclient.api.v2.octavia import OctaviaAPI
+                                             BadRequest, NeutronClientException)
 
 from openstack.exceptions import ConflictException as OSConflict
 from openstack.exceptions import ResourceNotFound as OSNotFound
+from openstack.network.v2.network import Network
 
-from keystoneauth1 import identity
-from keystoneauth1 import session
+from keystoneauth1.exceptions import OptionError
 
-from koris.cloud import OpenStackAPI
-from koris.util.util import (host_names, retry)
+from koris.cloud import OpenStackAPI, BuilderError
+from koris.cloud.lbspec import LoadBalancerPlanner, api_server_listener
+from koris.util.util import (host_names, retry, wait_for, wait_until,
+                             get_cache_dir, Backoff, WaitTimeout)
 from koris.util.logger import Logger
-from koris import MASTER_LISTENER_NAME, MASTER_POOL_NAME
+from koris import MASTER_LISTENER_NAME, CLUSTER_TAG_KEY
 
 
 LOGGER = Logger(__name__)
 
+# Server tags and the tags filter of the server list need 2.26. Only
+# these calls use it, all other nova calls stay on 2.1, see
+# :func:`nova_tags_client`.
+NOVA_TAGS_API_VERSION = '2.26'
+
 
 # OpenStack clients. Initialized at time of calling get_clients. You should not
 # use these directly bur rather call get_clients to ensure those variables
 # get initialized correctly.
 NOVA, NEUTRON, CINDER, OCTAVIA = None, None, None, None
 
+# The number of blocking OpenStack API calls which are allowed to run at the
+# same time. This can be overridden with ``max-api-concurrency`` in the
+# koris configuration.
+API_CONCURRENCY = 16
+
+# The provisioning engine. Initialized at time of calling get_engine.
+ENGINE = None
+
+# The status pollers for servers and volumes, one per resource type and
+# cluster. Initialized at time of calling get_poller.
+POLLERS = {}
+
+# One lock per LoadBalancer name. Octavia rejects changes while an earlier
+# one is pending, so engine threads changing the same LoadBalancer hold its
+# lock from waiting for ACTIVE until the change was sent.
+LB_LOCKS = {}
+
+
+# The cloud configuration, from clouds.yaml or the environment. Initialized at
+# time of calling get_cloud_region.
+CLOUD = None
+
+# The keystone session shared by all clients and connections. Initialized at
+# time of calling get_session.
+SESSION = None
+
+# Set this environment variable to 0 to disable caching tokens on disk.
+TOKEN_CACHE_ENV = "KORIS_TOKEN_CACHE"
+
+
+def _token_cache_path(auth_vars):
+    """return the token cache file for a set of credentials"""
+    identity_keys = ('auth_url', 'username', 'user_id', 'user_domain_name',
+                     'project_name', 'project_id', 'project_domain_name',
+                     'project_domain_id')
+    key = json.dumps([auth_vars.get(k) for k in identity_keys])
+    digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+    return os.path.join(get_cache_dir(), "token-%s.json" % digest)
+
+
+def _load_auth_state(auth, path):
+    """restore a cached token, keystoneauth ignores it once it expired"""
+    try:
+        with open(path) as fh:
+            auth.set_auth_state(fh.read())
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError) as err:
+        LOGGER.debug("Ignoring token cache %s: %s", path, err)
+
+
+def _save_auth_state(auth, path, cached):
+    """write the current token to the cache, readable only by the user"""
+    state = auth.get_auth_state()
+    if not state or state == cached:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        fd = os.open(path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as fh:
+            fh.write(state)
+        os.replace(path + ".tmp", path)
+    except OSError as err:
+        LOGGER.debug("Could not write token cache %s: %s", path, err)
+
 
-# pylint: disable=redefined-outer-name, global-statement
+# pylint: disable=global-statement
+def get_cloud_region():
+    """
+    get the configuration of the OpenStack cloud koris talks to
+
+    Like the ``openstack`` client, koris reads the cloud named by
+    ``OS_CLOUD`` from ``clouds.yaml`` or, without it, the ``OS_*``
+    variables of a sourced RC file.
+
+    This function will exit with error code 1 in case the configuration is
+    incomplete.
+    """
+    global CLOUD
+    if CLOUD is None:
+        try:
+            CLOUD = OpenStackAPI.config.get_cloud_region()
+        except (OpenStackAPI.exceptions.ConfigException, OptionError) as exc:
+            LOGGER.error("unable to read the OpenStack configuration:")
+            LOGGER.error("%s - have you sourced your OpenStack RC file or "
+                         "set OS_CLOUD?", exc)
+            sys.exit(1)
+
+    return CLOUD
+
+
+def get_session():
+    """
+    get the keystone session shared by all OpenStack clients
+
+    The session is created from the cloud returned by
+    :func:`get_cloud_region`.
+
+    The session authenticates once per token lifetime: the token is cached
+    in ``~/.cache/koris`` and reused by the following koris invocations
+    until it expires. Set the environment variable ``KORIS_TOKEN_CACHE=0``
+    to disable the cache.
+
+    All clients share one HTTP connection pool, which is large enough for
+    the concurrent calls of the provisioning engine.
+    """
+    global SESSION
+    if SESSION is None:
+        cloud = get_cloud_region()
+        sess = cloud.get_session()
+        if os.environ.get(TOKEN_CACHE_ENV, "1") != "0":
+            path = _token_cache_path(cloud.get_auth_args())
+            _load_auth_state(sess.auth, path)
+            atexit.register(_save_auth_state, sess.auth, path,
+                            sess.auth.get_auth_state())
+
+        adapter = requests.adapters.HTTPAdapter(pool_connections=8,
+                                                pool_maxsize=API_CONCURRENCY)
+        sess.session.mount("https://", adapter)
+        sess.session.mount("http://", adapter)
+        SESSION = sess
+
+    return SESSION
+
+
+# pylint: disable=redefined-outer-name
 def get_clients(with_octavia=False):
     """
     get openstack low level clients
@@ -54,30 +192,200 @@ def get_clients(with_octavia=False):
     global NOVA, NEUTRON, CINDER, OCTAVIA
     if(not NOVA or not NEUTRON or not CINDER):
         # at least one client has not already been initialized
-        try:
-            auth = identity.Password(**read_os_auth_variables())
-            sess = session.Session(auth=auth)
-            NOVA = nvclient.Client('2.1', session=sess)
-            NEUTRON = ntclient.Client(session=sess)
-            CINDER = cclient.Client('3.0', session=sess)
-            if with_octavia:
-                endpoint = os.environ.get("OCTAVIA_ENDPOINT",
-                                          "https://de-nbg6-1.noris.cloud:9876/v2.0/")
-                OCTAVIA = OctaviaAPI(session=sess, endpoint=endpoint)
+        sess = get_session()
+        NOVA = nvclient.Client('2.1', session=sess)
+        NEUTRON = ntclient.Client(session=sess)
+        CINDER = cclient.Client('3.0', session=sess)
+        if with_octavia:
+            # pylint: disable=import-outside-toplevel
+            from octaviaclient.api.v2.octavia import OctaviaAPI
+
+            endpoint = os.environ.get("OCTAVIA_ENDPOINT",
+                                      "https://de-nbg6-1.noris.cloud:9876/v2.0/")
+            OCTAVIA = OctaviaAPI(session=sess, endpoint=endpoint)
 
-        except TypeError:
-            LOGGER.error("Did you source your OS rc file in v3?")
-            LOGGER.error("If your file has the key OS_ENDPOINT_TYPE it's the"
-                         " wrong one!")
-            sys.exit(1)
-        except KeyError:
-            LOGGER.error("Did you source your OS rc file?")
-            sys.exit(1)
     if with_octavia:
         return NOVA, NEUTRON, CINDER, OCTAVIA
     return NOVA, NEUTRON, CINDER
 
 
+class ProvisioningEngine:
+    """Run blocking OpenStack API calls without blocking the event loop.
+
+    The nova, cinder and neutron clients are synchronous. Calling them
+    directly inside a coroutine blocks the event loop, hence all coroutines
+    gathered by the builder would effectively run one after another.
+    Instead, the calls are handed to a bounded thread pool, so the time
+    it takes to build a cluster grows with the slowest instance and not with
+    the sum of all instances.
+
+    Example:
+        >>> engine = ProvisioningEngine(max_workers=4)
+        >>> server = await engine.run(nova.servers.get, server_id)
+
+    Args:
+        max_workers (int): The maximal number of API calls in flight.
+    """
+
+    def __init__(self, max_workers=API_CONCURRENCY):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="koris-api")
+
+    async def run(self, func, *args, **kwargs):
+        """Execute ``func(*args, **kwargs)`` in the thread pool.
+
+        Returns:
+            The return value of ``func``.
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor,
+                                          partial(func, *args, **kwargs))
+
+    def shutdown(self, wait=True):
+        """Stop the thread pool, waiting for running calls by default."""
+        self._executor.shutdown(wait=wait)
+
+
+def get_engine(max_workers=None):
+    """
+    get the provisioning engine shared by all instances
+
+    Args:
+        max_workers (int): if given and different from the current engine's
+            limit, a new engine with this limit replaces the current one.
+    """
+    global ENGINE
+    if ENGINE is None or (max_workers and ENGINE.max_workers != max_workers):
+        if ENGINE is not None:
+            ENGINE.shutdown(wait=False)
+        ENGINE = ProvisioningEngine(max_workers or API_CONCURRENCY)
+    return ENGINE
+
+
+class StatusPoller:  # pylint: disable=too-few-public-methods
+    """Wait for many OpenStack resources with a single list call per tick.
+
+    Instead of every coroutine polling the API for its own resource, the
+    coroutines register the ID of the resource they are waiting for. As
+    long as there are pending resources, the poller refreshes all of them
+    with one list call and wakes up the coroutines whose resources are ready.
+    Hence, the number of API requests does not grow with the cluster size.
+
+    Example:
+        >>> poller = StatusPoller(nova.servers.list, "instance")
+        >>> server = await poller.wait(server.id, lambda s: s.status != 'BUILD')
+
+    Args:
+        list_func: A callable returning a list of resources. Each resource
+            must have the attributes ``id`` and ``status``.
+        what (str): A description of the resource type used for messages.
+        error_states (tuple): If a resource enters one of these states
+            the waiting coroutine receives a BuilderError.
+        delay (float): The first interval between two list calls.
+        max_delay (float): The maximal interval between two list calls.
+    """
+
+    def __init__(self, list_func, what="resource", error_states=('ERROR', 'error'),
+                 delay=1, max_delay=5):
+        self.what = what
+        self.error_states = error_states
+        self._list = list_func
+        self._delay = delay
+        self._max_delay = max_delay
+        self._waiters = {}
+        self._task = None
+
+    async def wait(self, resource_id, ready, timeout=None):
+        """Wait until a resource is ready.
+
+        Args:
+            resource_id (str): The ID of the resource.
+            ready: A callable which receives the refreshed resource and
+                returns True if it's ready.
+            timeout (float): Seconds to wait before giving up.
+
+        Returns:
+            The refreshed resource.
+
+        Raises:
+            WaitTimeout if the resource isn't ready before timeout.
+            BuilderError if the resource entered an error state.
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        waiter = (future, ready)
+        self._waiters.setdefault(resource_id, []).append(waiter)
+
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._poll())
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise WaitTimeout("timed out waiting for %s %s" % (self.what,
+                                                               resource_id))
+        finally:
+            waiters = self._waiters.get(resource_id, [])
+            if waiter in waiters:
+                waiters.remove(waiter)
+            if not waiters:
+                self._waiters.pop(resource_id, None)
+            if not self._waiters and self._task is not None:
+                # the cancellation is only processed later, so a waiter
+                # which registers before must start a new task
+                self._task.cancel()
+                self._task = None
+
+    async def _poll(self):
+        backoff = Backoff(delay=self._delay, max_delay=self._max_delay)
+        while self._waiters:
+            await asyncio.sleep(next(backoff))
+            try:
+                resources = await get_engine().run(self._list)
+            except Exception as err:  # pylint: disable=broad-except
+                LOGGER.debug("Listing %ss failed: %s", self.what, err)
+                continue
+
+            for resource in resources:
+                for future, ready in list(self._waiters.get(resource.id, [])):
+                    if future.done():
+                        continue
+                    if resource.status in self.error_states:
+                        future.set_exception(BuilderError(
+                            "%s %s is in state %s" % (self.what, resource.id,
+                                                      resource.status)))
+                    elif ready(resource):
+                        future.set_result(resource)
+
+
+def get_poller(kind, client, cluster_name):
+    """
+    get the status poller for the servers or volumes of a cluster
+
+    Servers are listed with a name filter and volumes with a metadata
+    filter, thus only the resources of the cluster are transferred.
+
+    Args:
+        kind (str): either 'servers' or 'volumes'
+        client: the nova client for servers or cinder client for volumes
+        cluster_name (str): the name of the cluster
+    """
+    key = (kind, cluster_name)
+    if key not in POLLERS:
+        if kind == 'servers':
+            list_func = partial(client.servers.list, detailed=True,
+                                search_opts={'name': '^%s-' % cluster_name})
+            POLLERS[key] = StatusPoller(list_func, "instance",
+                                        delay=2, max_delay=10)
+        else:
+            list_func = partial(client.volumes.list, detailed=True,
+                                search_opts={'metadata': cluster_metadata(cluster_name)})
+            POLLERS[key] = StatusPoller(list_func, "volume")
+
+    return POLLERS[key]
+
+
 if getattr(sys, 'frozen', False):  # pragma: nocoverage
     def monkey_patch():
         """monkey patch get available versions, because the original
@@ -97,12 +405,17 @@ def get_connection():
     This function will exit with error code 1 in case a connection could not be
     established.
 
+    The connection uses the session returned by :func:`get_session`, thus
+    it shares the token and the HTTP connection pool with the clients
+    returned by :func:`get_clients`.
+
     Returns:
         conn (OpenStackAPI.Connection): an OpenStack Connection Object.
     """
 
     try:
-        conn = OpenStackAPI.connect()
+        get_session()
+        conn = OpenStackAPI.connection.Connection(config=get_cloud_region())
     except OpenStackAPI.exceptions.ConfigException as exc:
         LOGGER.error("unable to establish OpenStack Cloud connection:")
         LOGGER.error("%s - have you sourced your OpenStack RC file?", exc)
@@ -115,7 +428,7 @@ def get_connection():
     return conn
 
 
-def delete_instance(name, conn, ignore_not_found=True):
+def delete_instance(name, conn, ignore_not_found=True, inventory=None):
     """Removes a server from OpenStack.
 
     This will also remove Volumes and Network ports.
@@ -125,9 +438,15 @@ def delete_instance(name, conn, ignore_not_found=True):
         conn: An OpenStack Connection object.
         ignore_not_found (bool): If set to False, raises
             InstanceNotFound if the instance doesn't exist.
+        inventory: A refreshed :class:`koris.cloud.inventory.ClusterInventory`.
+            If given, the server and its ports are taken from it instead
+            of being looked up.
     """
 
-    srv = conn.compute.find_server(name)
+    if inventory is not None:
+        srv = inventory.server(name)
+    else:
+        srv = conn.compute.find_server(name)
     if not srv or srv is None:
         msg = f"Instance '{name}' doesn't exist, skipping deletion"
         if ignore_not_found:
@@ -139,8 +458,11 @@ def delete_instance(name, conn, ignore_not_found=True):
     # Deleting the instance and volumes
     conn.compute.delete_server(srv)
 
-    # Deleting attached network ports
-    ports = list(conn.network.ports(device_id=srv.id))
+    # Deleting attached network ports, ports created before tagging
+    # aren't in the inventory
+    ports = inventory.server_ports(srv) if inventory is not None else []
+    if not ports:
+        ports = list(conn.network.ports(device_id=srv.id))
     for port in ports:
         conn.network.delete_port(port)
 
@@ -148,8 +470,130 @@ def delete_instance(name, conn, ignore_not_found=True):
                    name)
 
 
-class BuilderError(Exception):
-    """Raise a custom error if the build fails"""
+def cluster_tag(cluster_name):
+    """the tag marking neutron and octavia resources of a cluster"""
+    return "%s=%s" % (CLUSTER_TAG_KEY, cluster_name)
+
+
+def cluster_metadata(cluster_name):
+    """the metadata marking servers and volumes of a cluster"""
+    return {CLUSTER_TAG_KEY: cluster_name}
+
+
+def tag_resource(conn, resource, cluster_name):
+    """Tag a neutron resource as part of a cluster.
+
+    Tagging is best effort, a failure is logged but not raised, since the
+    resources can still be found by their names.
+
+    Args:
+        conn: An OpenStack Connection object.
+        resource: An openstacksdk network resource.
+        cluster_name (str): The name of the cluster.
+    """
+    try:
+        conn.network.set_tags(resource, [cluster_tag(cluster_name)])
+    except Exception as err:  # pylint: disable=broad-except
+        LOGGER.warning("Could not tag %s: %s", resource.name, err)
+
+
+@lru_cache(maxsize=None)
+def _nova_client(version, sess):
+    return nvclient.Client(version, session=sess)
+
+
+def nova_tags_client(nova):
+    """
+    get a nova client on the session of nova, which can use server tags
+    """
+    return _nova_client(NOVA_TAGS_API_VERSION, nova.client.session)
+
+
+def tag_server(nova, server, cluster_name):
+    """Tag a server as part of a cluster.
+
+    Tagging is best effort, like :func:`tag_resource`.
+
+    Args:
+        nova: A nova client.
+        server: A novaclient server.
+        cluster_name (str): The name of the cluster.
+    """
+    try:
+        nova_tags_client(nova).servers.add_tag(server, cluster_tag(cluster_name))
+    except Exception as err:  # pylint: disable=broad-except
+        LOGGER.warning("Could not tag %s: %s", server.name, err)
+
+
+def list_cluster_servers(nova, cluster_name):
+    """List the master and worker servers of a cluster.
+
+    The servers are listed by their tag and by an anchored pattern of their
+    names, both filtered on the server side. Servers of clusters created
+    before koris tagged servers are only found by their names, e.g. the
+    older servers of such a cluster after ``koris add``. They are tagged on
+    the way.
+
+    Args:
+        nova: A nova client.
+        cluster_name (str): The name of the cluster.
+
+    Returns:
+        A list of novaclient servers.
+    """
+    # limit=-1 makes novaclient follow all pages
+    servers = nova_tags_client(nova).servers.list(
+        detailed=True, limit=-1, search_opts={'tags': cluster_tag(cluster_name)})
+    tagged = {srv.id for srv in servers}
+
+    pattern = r"^%s-(master|node)-[0-9]+$" % cluster_name
+    # nova only treats the filter as a regular expression on some backends
+    for srv in nova.servers.list(detailed=True, limit=-1,
+                                 search_opts={'name': pattern}):
+        if srv.id not in tagged and re.match(pattern, srv.name):
+            tag_server(nova, srv, cluster_name)
+            servers.append(srv)
+    return servers
+
+
+async def delete_server(server, nova, netclient, timeout=300):
+    """Delete a server and its ports.
+
+    The coroutine returns once the server is gone, thus its volume is
+    detached.
+
+    Args:
+        server: A novaclient or openstacksdk server.
+        nova: A nova client.
+        netclient: A neutron client.
+        timeout (int): Seconds to wait for the server to disappear.
+    """
+    engine = get_engine()
+    try:
+        nics = await engine.run(nova.servers.interface_list, server.id)
+        await engine.run(nova.servers.delete, server.id)
+    except NovaNotFound:
+        return
+
+    async def is_gone():
+        try:
+            await engine.run(nova.servers.get, server.id)
+        except NovaNotFound:
+            return True
+        return False
+
+    try:
+        await wait_for(is_gone, Backoff(delay=2, timeout=timeout),
+                       "deletion of instance %s" % server.name)
+    except WaitTimeout as err:
+        LOGGER.warning(str(err))
+
+    for nic in nics:
+        try:
+            await engine.run(netclient.delete_port, nic.id)
+        except NotFound:
+            pass
+    LOGGER.success("Instance '%s' deleted successfully", server.name)
 
 
 class InstanceExists(Exception):
@@ -163,7 +607,22 @@ class InstanceNotFound(Exception):
 class Instance:  # pylint: disable=too-many-arguments
     """
     Create an Openstack Server with an attached volume
+
+    Attributes:
+        VOLUME_TIMEOUT (int): Seconds to wait for the volume to become
+            available.
+        BOOT_TIMEOUT (int): Seconds to wait for the server to leave the
+            BUILD state.
+        CREATE_DEADLINE (int): Seconds after which the creation of the
+            volume and the server is aborted, regardless of the timeouts
+            above.
+        DELETE_TIMEOUT (int): Seconds to wait for a deleted server to
+            disappear.
     """
+    VOLUME_TIMEOUT = 300
+    BOOT_TIMEOUT = 600
+    CREATE_DEADLINE = 900
+    DELETE_TIMEOUT = 300
 
     def __init__(self, cinder, nova, name, network, zone, role,
                  volume_config, flavor):
@@ -200,9 +659,48 @@ class Instance:  # pylint: disable=too-many-arguments
         port = netclient.create_port({"port": {"admin_state_up": True,
                                                "network_id": net,
                                                "security_groups": secgroups}})
+        try:
+            netclient.add_tag('ports', port['port']['id'],
+                              cluster_tag(self.cluster_name))
+        except NeutronClientException as err:
+            LOGGER.warning("Could not tag port of %s: %s", self.name, err)
         self.ports.append(port)
 
-    async def _create_volume(self):  # pragma: no coverage
+    @property
+    def cluster_name(self):
+        """the name of the cluster, derived from the host name
+
+        See :func:`koris.util.util.host_names` for the naming scheme.
+        """
+        return self.name.rsplit('-', 2)[0]
+
+    @staticmethod
+    def _timeout(timeout, deadline):
+        """return the timeout, shortened if the deadline comes first"""
+        if deadline is None:
+            return timeout
+        return max(min(timeout, deadline - time.monotonic()), 0)
+
+    async def _wait_for_volume(self, vol, deadline, ready=None):  # pragma: no coverage
+        """wait until the volume is ready, by default until it's available"""
+        if ready is None:
+            ready = lambda v: v.status == 'available'  # noqa: E731
+
+        if ready(vol):
+            return vol
+
+        poller = get_poller('volumes', self.cinder, self.cluster_name)
+        return await poller.wait(vol.id, ready,
+                                 self._timeout(self.VOLUME_TIMEOUT, deadline))
+
+    async def _wait_for_server(self, instance, deadline):  # pragma: no coverage
+        """wait until the server left the BUILD state"""
+        poller = get_poller('servers', self.nova, self.cluster_name)
+        return await poller.wait(instance.id, lambda s: s.status != 'BUILD',
+                                 self._timeout(self.BOOT_TIMEOUT, deadline))
+
+    async def _create_volume(self, deadline=None):  # pragma: no coverage
+        engine = get_engine()
         bdm_v2 = {
             "boot_index": 0,
             "source_type": "volume",
@@ -210,22 +708,22 @@ class Instance:  # pylint: disable=too-many-arguments
             "destination_type": "volume",
             "delete_on_termination": True}
 
-        vol = self.cinder.volumes.create(self.volume_config.get('size', 25),
-                                         name=self.name,
-                                         imageRef=self.volume_config.get('image').id,
-                                         availability_zone=self.zone,
-                                         volume_type=self.volume_config.get('class'))
+        vol = await engine.run(self.cinder.volumes.create,
+                               self.volume_config.get('size', 25),
+                               name=self.name,
+                               imageRef=self.volume_config.get('image').id,
+                               availability_zone=self.zone,
+                               volume_type=self.volume_config.get('class'),
+                               metadata=cluster_metadata(self.cluster_name))
 
-        while vol.status != 'available':
-            await asyncio.sleep(1)
-            vol = self.cinder.volumes.get(vol.id)
+        vol = await self._wait_for_volume(vol, deadline)
 
         LOGGER.debug("created volume %s %s", vol, vol.volume_type)
 
         if vol.bootable != 'true':
-            vol.update(bootable=True)
-            # wait for mark as bootable
-            await asyncio.sleep(2)
+            await engine.run(vol.update, bootable=True)
+            await self._wait_for_volume(vol, deadline,
+                                        lambda v: v.bootable == 'true')
 
         volume_data = copy.deepcopy(bdm_v2)
         volume_data['uuid'] = vol.id
@@ -240,11 +738,18 @@ class Instance:  # pylint: disable=too-many-arguments
         if self.exists:
             return self
 
-        volume_data = await self._create_volume()
+        engine = get_engine()
+        deadline = time.monotonic() + self.CREATE_DEADLINE
+
+        try:
+            volume_data = await self._create_volume(deadline)
+        except WaitTimeout as err:
+            raise BuilderError(str(err))
 
         try:
             LOGGER.info("Creating instance %s... ", self.name)
-            instance = self.nova.servers.create(
+            instance = await engine.run(
+                self.nova.servers.create,
                 name=self.name,
                 availability_zone=self.zone,
                 image=None,
@@ -252,8 +757,11 @@ class Instance:  # pylint: disable=too-many-arguments
                 flavor=flavor,
                 nics=self.nics, security_groups=secgroups,
                 block_device_mapping_v2=[volume_data],
-                userdata=userdata
+                userdata=userdata,
+                meta=cluster_metadata(self.cluster_name)
             )
+            await engine.run(tag_server, self.nova, instance,
+                             self.cluster_name)
         except (Exception) as err:
             LOGGER.error("Something weired happend, I so I didn't create %s" %
                          self.name)
@@ -261,21 +769,18 @@ class Instance:  # pylint: disable=too-many-arguments
             LOGGER.info(f"Exception: {err}")
             raise BuilderError(str(err))
 
-        inst_status = instance.status
-        LOGGER.debug("Waiting 5 seconds for machine to be launched ... ")
-        await asyncio.sleep(5)
-
-        while inst_status == 'BUILD':
-            LOGGER.debug(
-                "Instance: %s is in in %s state, sleeping for 5 more seconds",
-                instance.name, inst_status)
-            await asyncio.sleep(5)
-            instance = self.nova.servers.get(instance.id)
-            inst_status = instance.status
+        try:
+            instance = await self._wait_for_server(instance, deadline)
+        except WaitTimeout as err:
+            raise BuilderError(str(err))
 
+        inst_status = instance.status
         LOGGER.debug(f"Instance '{instance.name} is in state: {inst_status}")
+        if inst_status == 'ERROR':
+            raise BuilderError("instance %s is in state ERROR" % self.name)
 
-        self._ip_address = instance.interface_list()[0].fixed_ips[0]['ip_address']
+        interfaces = await engine.run(instance.interface_list)
+        self._ip_address = interfaces[0].fixed_ips[0]['ip_address']
         LOGGER.success(
             "Instance '%s' booted successfully. Status: %s, IP: %s",
             self.name, instance.status, self._ip_address)
@@ -284,15 +789,28 @@ class Instance:  # pylint: disable=too-many-arguments
         return self
 
     async def delete(self, netclient):
-        """stop and terminate an instance"""
+        """stop and terminate an instance
+
+        The coroutine returns once the server is gone, thus its volume is
+        detached and its ports were removed.
+        """
         try:
-            server = self.nova.servers.find(name=self.name)
-            nics = list(server.interface_list())
-            server.delete()
-            list(netclient.delete_port(nic.id) for nic in nics)
-            LOGGER.success("Instance '%s' deleted successfully", server.name)
+            server = await get_engine().run(self.nova.servers.find, name=self.name)
         except NovaNotFound:
-            pass
+            return
+
+        await delete_server(server, self.nova, netclient, self.DELETE_TIMEOUT)
+
+
+def get_lb_lock(name):
+    """
+    get the lock serializing the changes to the LoadBalancer name
+
+    The lock is reentrant, so a locked change may call other locked
+    changes, e.g. applying a spec updates the members of a pool.
+    """
+    # setdefault is atomic, thus two threads always get the same lock
+    return LB_LOCKS.setdefault(name, threading.RLock())
 
 
 class LoadBalancer:
@@ -303,12 +821,14 @@ class LoadBalancer:
     of the LoadBalancer, is then stored in the SSL certificates.
     During the boot of the machines, we configure the LoadBalancer.
     """
-    members_uri = '/v2.0/lbaas/pools/%s/members'
+    members_uri = '/lbaas/pools/%s/members'
+    TOPOLOGY_TTL = 30
+    ACTIVE_TIMEOUT = 600
 
-    def __init__(self, config, conn, neutron=None):
+    def __init__(self, config, conn, state=None):
         self.config = config
         self.name = "%s-lb" % config['cluster-name']
-        self.neutron = neutron
+        self.state = state
 
         try:
             self.subnet_name = config.get('private_net')['subnet'].get('name', self.name)
@@ -320,11 +840,13 @@ class LoadBalancer:
         self._subnet_id = None
         self._data = None
         self._existing_floating_ip = None
+        self._master_listener = None
+        self._master_listener_at = 0
         self.conn = conn
 
         self.floatingip = config.get('loadbalancer', {}).get('floatingip', None)
 
-    def check_floating_ip_availability(self, fip):
+    def _check_floating_ip_availability(self, fip):
         """
         Find if a floating ip exists in the pool and
         if it's available for assignement.
@@ -352,6 +874,9 @@ class LoadBalancer:
     def master_listener(self):
         """Returns the listener of name MASTER_LISTENER_NAME, including additional info.
 
+        The result is cached for :attr:`TOPOLOGY_TTL` seconds, or until the
+        members are changed by this instance.
+
         Returns:
             A dict containing all necessary information of the master listener::
 
@@ -374,6 +899,10 @@ class LoadBalancer:
                 }
         """
 
+        age = time.monotonic() - self._master_listener_at
+        if self._master_listener is not None and age < self.TOPOLOGY_TTL:
+            return self._master_listener
+
         listener = self._get_master_listener()
         if not listener:
             return None
@@ -392,9 +921,13 @@ class LoadBalancer:
         out['id'] = listener.id
         out['pool'] = pool
 
+        if pool is not None:
+            self._master_listener = out
+            self._master_listener_at = time.monotonic()
+
         return out
 
-    def _get_master_listener(self):  # pylint: disable=too-many-return-statements
+    def _get_master_listener(self):
         """Returns the Listener with name MASTER_LISTENER_NAME associated to the LB."""
 
         # LB isn't configured yet
@@ -402,36 +935,15 @@ class LoadBalancer:
             LOGGER.error("LoadBalancer not configured yet")
             return None
 
-        # Get our LB from OpenStack
-        lb = self.conn.load_balancer.find_load_balancer(self._id)
-        if not lb:
-            LOGGER.error("Unable to find LoadBalancer '%s' (%s)", self.name, self._id)
-            return None
-
-        # Check if LB has listeners
-        if not lb.listeners:
-            LOGGER.error("LoadBalancer '%s' (%s) has no listeners", self.name, self._id)
-            return None
-
-        # Iterate over Listeners associated with LB...
-        master_listeners = []
+        # A single request returns the listeners of our LB with that name
         listener_name = '-'.join((MASTER_LISTENER_NAME,
                                   self.config['cluster-name']))
-        for li in lb.listeners:
-            # Check if single Listener has name MASTER_LISTENER_NAME
-            try:
-                listener = self.conn.load_balancer.find_listener(li['id'])
-            except (TypeError, KeyError) as exc:
-                LOGGER.error("Unable to access LoadBalancer.listeners: %s", exc)
-                return None
-
-            # Not this one, check next
-            if not listener:
-                continue
-
-            # This one is good, append to list
-            if listener.name == listener_name:
-                master_listeners.append(listener)
+        try:
+            master_listeners = list(self.conn.load_balancer.listeners(
+                load_balancer_id=self._id, name=listener_name))
+        except OSNotFound:
+            LOGGER.error("Unable to find LoadBalancer '%s' (%s)", self.name, self._id)
+            return None
 
         if not master_listeners:
             LOGGER.error("Unable to find Listener with name '%s'",
@@ -448,9 +960,10 @@ class LoadBalancer:
     def _pool_info(self, pool_id):
         """A list with Pool Information of a Listener.
 
+        The members are fetched with a single request.
+
         Args:
-            listener (:class:`OpenStackAPI.network.Listener`): An OpenStack Listener
-                Object
+            pool_id (str): The ID of the pool.
 
         Returns:
             A dict which is of the following structure:
@@ -474,22 +987,10 @@ class LoadBalancer:
             LOGGER.debug("Unable to find pool '%s'", pool_id)
             return None
 
-        # Get information about every member in the pool
-        members = []
-        for mem in pool.members:
-            mem_id = mem['id']
-
-            member = self.conn.load_balancer.find_member(mem_id, pool)
-            if not member:
-                LOGGER.debug("Unable to find member '%s' in pool '%s' (%s)",
-                             mem_id, pool.name, pool_id)
-                continue
-
-            members.append({
-                'id': mem_id,
-                'name': member.name,
-                'address': member.address
-            })
+        members = [{'id': member.id,
+                    'name': member.name,
+                    'address': member.address}
+                   for member in self.conn.load_balancer.members(pool)]
 
         pool = {
             'name': pool.name,
@@ -499,47 +1000,84 @@ class LoadBalancer:
 
         return pool
 
+    @property
+    def lock(self):
+        """The lock serializing changes to this LoadBalancer, see :func:`get_lb_lock`"""
+        return get_lb_lock(self.name)
+
+    def invalidate(self):
+        """Forget the cached master listener, e.g. after changing members"""
+        self._master_listener = None
+        self._master_listener_at = 0
+
+    def wait_until_active(self, timeout=None):
+        """Wait until the LoadBalancer accepts the next change.
+
+        Octavia rejects changes while the LoadBalancer is in one of the
+        PENDING_* states. Instead of retrying the change after a fixed
+        delay, the ``provisioning_status`` is polled with short, growing
+        intervals.
+
+        Raises:
+            BuilderError if the LoadBalancer is in state ERROR or doesn't
+            become ACTIVE before timeout.
+        """
+
+        def is_active():
+            lb = self.conn.load_balancer.get_load_balancer(self._id)
+            if lb.provisioning_status == 'ERROR':
+                raise BuilderError("LoadBalancer %s is in state ERROR" % self.name)
+            return lb.provisioning_status == 'ACTIVE'
+
+        backoff = Backoff(delay=0.5, max_delay=5, timeout=timeout or self.ACTIVE_TIMEOUT)
+        try:
+            wait_until(is_active, backoff, "LoadBalancer %s" % self.name)
+        except WaitTimeout as err:
+            raise BuilderError(str(err))
+
     async def configure(self, master_ips):
         """Configure a load balancer created in earlier step
 
+        Adds the API server listener with the given masters, see
+        :func:`koris.cloud.lbspec.api_server_listener`. Existing members of
+        the pool which are not in master_ips are removed.
+
+        The configuration waits for the LoadBalancer between the steps, so
+        it runs in the provisioning engine instead of blocking the event loop.
+
         Args:
             master_ips (list): A list of the master IP addresses
         """
+        spec = api_server_listener(self.config['cluster-name'], master_ips)
+        await get_engine().run(self.apply, [spec])
 
-        # If not present, add listener
-        if not self._data.listeners:
-            listener = self.add_listener(
-                name='-'.join((MASTER_LISTENER_NAME, self.config['cluster-name'])))  # noqa
-            listener_id = listener.id
-        else:
-            LOGGER.debug("Reusing listener %s", self._data.listeners[0].id)
-            listener_id = self._data.listeners[0].id
+    def apply(self, listeners):
+        """Bring the listeners of the LoadBalancer in line with a spec
 
-        if not self._data.pools:
-            pool = self.add_pool(
-                listener_id,
-                name='-'.join((MASTER_POOL_NAME, self.config['cluster-name'])))
-        else:
-            LOGGER.debug("Reusing pool, removing all members ...")
-            # (aknipping) This should be handled differently. If there are multiple
-            # pools present, we want to specify which it should be added too. Maybe with a
-            # default pool name that is independent of the cluster name?
-            pool = self.conn.network.find_pool(self._data.pools[0]['id'])
-            for member_id in [list(x.values())[0] for x in pool.members]:
-                self.del_member(member_id, pool.id)
-
-        for member in master_ips:
-            LOGGER.debug("Adding member %s ...", member)
-            self.add_member(pool.id, member)
-        if pool.get('healthmonitor_id'):
-            LOGGER.debug("Reusing existing health monitor")
-        else:
-            self.add_health_monitor(pool.id)
+        Args:
+            listeners (list): A list of :class:`koris.cloud.lbspec.ListenerSpec`.
+
+        Returns:
+            The list of applied :class:`koris.cloud.lbspec.Step`.
+        """
+        return LoadBalancerPlanner(self, listeners).apply()
 
     def get(self):
-        """Retrieve LoadBalancer information"""
+        """Retrieve LoadBalancer information
+
+        If the LoadBalancer has a :class:`koris.cloud.state.ClusterState`,
+        it is fetched by its cached ID.
+        """
+
+        def find():
+            return self.conn.load_balancer.find_load_balancer(self.name)
 
-        lb = self.conn.load_balancer.find_load_balancer(self.name)
+        if self.state is not None:
+            lb = self.state.resolve("loadbalancer",
+                                    self.conn.load_balancer.get_load_balancer,
+                                    find)
+        else:
+            lb = find()
         if lb:
             self._id = lb.id
             self._subnet_id = lb.vip_subnet_id
@@ -557,7 +1095,7 @@ class LoadBalancer:
         else:
             LOGGER.debug("Reusing existing LoadBalancer ...")
             self._existing_floating_ip = None
-            self.check_floating_ip_availability(self.floatingip)
+            self._check_floating_ip_availability(self.floatingip)
             fip_addr = self._floating_ip_address(lb)
             LOGGER.success("Loadbalancer IP: %s", fip_addr)
             self._id = lb.id
@@ -566,6 +1104,16 @@ class LoadBalancer:
 
         return lb, fip_addr
 
+    @property
+    def id(self):  # pylint: disable=invalid-name
+        """The ID of the LoadBalancer, once it was found or created"""
+        return self._id
+
+    @property
+    def subnet_id(self):
+        """The ID of the subnet of the LoadBalancer's VIP"""
+        return self._subnet_id
+
     @property
     def ip_address(self):
         """Return the LoadBalancer's IP or Floating IP address"""
@@ -598,13 +1146,20 @@ class LoadBalancer:
             fip_addr = self._existing_floating_ip
         else:
             if isinstance(self.floatingip, str):
-                fip_addr = self.associate_floating_ip(lb)
+                fip_addr = self._associate_floating_ip(lb)
             else:
                 fip_addr = None
         return fip_addr
 
-    def create(self):
-        """Provision a minimally configured LoadBalancer in OpenStack
+    def create(self, listeners=None):
+        """Provision a LoadBalancer in OpenStack
+
+        Without listeners, the LoadBalancer is minimally configured. Otherwise
+        it is created with the listeners, their pools, members and health
+        monitors in a single request.
+
+        Args:
+            listeners (list): A list of :class:`koris.cloud.lbspec.ListenerSpec`.
 
         Return:
             tuple (dict, str) - the dict is the load balancer information, if
@@ -622,9 +1177,15 @@ class LoadBalancer:
             subnets = list(self.conn.network.subnets(network_id=network.id))
             subnet_id = subnets[0].id
 
+        graph = {}
+        if listeners:
+            graph['listeners'] = [spec.to_api(subnet_id) for spec in listeners]
+
         lb = self.conn.load_balancer.create_load_balancer(
             vip_subnet_id=subnet_id,
-            name=f"{self.name}"
+            name=f"{self.name}",
+            tags=[cluster_tag(self.config['cluster-name'])],
+            **graph
         )
 
         self._id = lb.id
@@ -639,7 +1200,7 @@ class LoadBalancer:
         # Only associate floatingip if it's set to a value in config
         # (aknipping) for now, setting it to 'true' will not do anything
         if isinstance(self.floatingip, str):
-            fip_addr = self.associate_floating_ip(lb)
+            fip_addr = self._associate_floating_ip(lb)
         return lb, fip_addr
 
     @retry(exceptions=(NeutronConflict, NotFound, BadRequest, OSConflict), backoff=1,
@@ -666,7 +1227,7 @@ class LoadBalancer:
             LOGGER.debug("Deleting LoadBalancer %s ...", self.name)
             self._del_loadbalancer()
 
-    def associate_floating_ip(self, loadbalancer):
+    def _associate_floating_ip(self, loadbalancer):
         """Associates a Floating IP with the LoadBalancer"""
         valid_ip = valid_ipv4(self.floatingip) or valid_ipv6(self.floatingip)
         if not valid_ip:
@@ -689,8 +1250,8 @@ class LoadBalancer:
 
         return fip.floating_ip_address
 
-    @retry(exceptions=(StateInvalidClient, OSConflict), tries=20, delay=30,
-           backoff=1, logger=LOGGER.debug)
+    @retry(exceptions=(StateInvalidClient, OSConflict), tries=5, delay=1,
+           backoff=2, logger=LOGGER.debug)
     def add_listener(self, name=None, protocol="HTTPS",
                      protocol_port=6443):
         """Adds a custom listener to the LoadBalancer"""
@@ -698,11 +1259,11 @@ class LoadBalancer:
         if name is None:
             name = self.name
 
-        listener = self.conn.network.create_listener(load_balancer_id=self._id,
-                                                     protocol=protocol,
-                                                     protocol_port=protocol_port,
-                                                     is_admin_state_up=True,
-                                                     name=name)
+        with self.lock:
+            self.wait_until_active()
+            listener = self.conn.network.create_listener(
+                load_balancer_id=self._id, protocol=protocol,
+                protocol_port=protocol_port, is_admin_state_up=True, name=name)
 
         if not listener:
             LOGGER.error("Unable to add listener '%s' to LoadBalancer %s",
@@ -713,7 +1274,7 @@ class LoadBalancer:
                      protocol, name, listener.id, protocol_port, self._id)
         return listener
 
-    @retry(exceptions=(StateInvalidClient, OSConflict), tries=30, delay=5, backoff=1,
+    @retry(exceptions=(StateInvalidClient, OSConflict), tries=5, delay=1, backoff=2,
            logger=LOGGER.debug)
     def add_pool(self, listener_id, lb_algorithm="SOURCE_IP", protocol="HTTPS",
                  name=None):
@@ -722,11 +1283,13 @@ class LoadBalancer:
         if name is None:
             name = f"{self.name}-pool"
 
-        pool = self.conn.network.create_pool(listener_id=listener_id,
-                                             load_balancer_id=self._id,
-                                             protocol=protocol,
-                                             lb_algorithm=lb_algorithm,
-                                             name=name)
+        with self.lock:
+            self.wait_until_active()
+            pool = self.conn.network.create_pool(listener_id=listener_id,
+                                                 load_balancer_id=self._id,
+                                                 protocol=protocol,
+                                                 lb_algorithm=lb_algorithm,
+                                                 name=name)
 
         if not pool:
             LOGGER.error("Unable to add pool '%s' to listener %s", name, listener_id)
@@ -736,21 +1299,23 @@ class LoadBalancer:
                      protocol, name, pool.id, lb_algorithm, listener_id)
         return pool
 
-    @retry(exceptions=(StateInvalidClient, OSConflict), tries=24, delay=10,
-           backoff=0.8, logger=LOGGER.debug)
+    @retry(exceptions=(StateInvalidClient, OSConflict), tries=5, delay=1,
+           backoff=2, logger=LOGGER.debug)
     def add_health_monitor(self, pool_id, name=None):
         """Adds a Healthmonitor to a Pool"""
 
         if name is None:
             name = f"{self.name}-health"
 
-        hm = self.conn.network.create_health_monitor(
-            delay=5,
-            timeout=3,
-            max_retries=4,
-            type="TCP",
-            pool_id=pool_id,
-            name=name)
+        with self.lock:
+            self.wait_until_active()
+            hm = self.conn.network.create_health_monitor(
+                delay=5,
+                timeout=3,
+                max_retries=4,
+                type="TCP",
+                pool_id=pool_id,
+                name=name)
 
         if not hm:
             LOGGER.error("Unable to add health monitor '%s' to pool %s", name, pool_id)
@@ -760,16 +1325,19 @@ class LoadBalancer:
                      pool_id)
         return hm
 
-    @retry(exceptions=(StateInvalidClient, OSConflict, BadRequest), tries=24,
-           delay=5, backoff=1, logger=LOGGER.debug)
+    @retry(exceptions=(StateInvalidClient, OSConflict, BadRequest), tries=5,
+           delay=1, backoff=2, logger=LOGGER.debug)
     def add_member(self, pool_id, ip_addr, protocol_port=6443):
         """Adds a Listener to a Pool."""
 
-        member = self.conn.network.create_pool_member(
-            pool=pool_id,
-            subnet_id=self._subnet_id,
-            protocol_port=protocol_port,
-            address=ip_addr)
+        self.invalidate()
+        with self.lock:
+            self.wait_until_active()
+            member = self.conn.network.create_pool_member(
+                pool=pool_id,
+                subnet_id=self._subnet_id,
+                protocol_port=protocol_port,
+                address=ip_addr)
 
         if not member:
             LOGGER.error("Unable to add member '%s' to pool %s", ip_addr, pool_id)
@@ -793,7 +1361,7 @@ class LoadBalancer:
         except OSNotFound:
             LOGGER.debug("Could not find  LoadBalancer %s", self._id)
 
-    @retry(exceptions=(StateInvalidClient, OSConflict), backoff=1, tries=5, delay=5,
+    @retry(exceptions=(StateInvalidClient, OSConflict), backoff=2, tries=5, delay=1,
            logger=LOGGER.debug)
     def del_member(self, member_id, pool_id):  # pylint: disable=no-self-use
         """Deletes a member from the LoadBalancer.
@@ -803,44 +1371,68 @@ class LoadBalancer:
             pool_id (str): The ID of the pool where the member is located.
         """
 
-        try:
-            self.conn.network.delete_pool_member(member_id, pool_id, ignore_missing=False)
-            LOGGER.debug("Deleted member %s from pool %s", member_id, pool_id)
-        except OSNotFound:
-            LOGGER.debug("Member %s not found in pool %s", member_id, pool_id)
+        self.invalidate()
+        with self.lock:
+            self.wait_until_active()
+            try:
+                self.conn.network.delete_pool_member(member_id, pool_id,
+                                                     ignore_missing=False)
+                LOGGER.debug("Deleted member %s from pool %s", member_id, pool_id)
+            except OSNotFound:
+                LOGGER.debug("Member %s not found in pool %s", member_id, pool_id)
 
-    @retry(exceptions=(OSConflict), backoff=1, tries=5, delay=5,
-           logger=LOGGER.debug)
-    def bulk_update_members(self, members, pool_id=None):
-        """bulk update members of a listener
+    def bulk_update_members(self, members, pool_id=None, timeout=None):
+        """Replace the members of a pool with a single request
 
-        Using this method, a Health Monitor is automatically added by openstack.
+        This uses the batch update of the Octavia v2 API: members which are
+        not in the list are removed, all others are created or updated.
+        While the LoadBalancer is busy with an earlier change, the update
+        is sent again as soon as it is ACTIVE.
 
         Args:
             members (list): list containing member information
             pool_id (str):  the Id of the pool
+            timeout (int): Seconds to wait for the LoadBalancer, by default
+                :attr:`ACTIVE_TIMEOUT`.
 
         Return:
-            bool: indicates whether the operation succeeded or not
+            bool: True, once the update was accepted
+
+        Raises:
+            BuilderError if Octavia rejects the update or it isn't accepted
+            before timeout.
         """
 
         if not pool_id:
-            pool_id = self.default_pool
+            pool_id = self._default_pool
+        self.invalidate()
         # [{"name": "foo", "address": "10.0.0.38", "protocol_port": "6443"},
         #  {"name": "bar", "address": "10.0.0.29", "protocol_port": "6443"},
         # ]
-        response, _ = self.neutron.httpclient.do_request(
-            self.members_uri % pool_id, 'PUT',
-            body=json.dumps({"members": members}))
-        if response.status_code in list(range(200, 207)):
+
+        def update():
+            with self.lock:
+                self.wait_until_active()
+                response = self.conn.load_balancer.put(
+                    self.members_uri % pool_id, json={"members": members})
+            if response.status_code == 409:
+                LOGGER.debug("LoadBalancer %s is busy, updating members of "
+                             "pool %s later", self.name, pool_id)
+                return False
+            if response.status_code >= 400:
+                raise BuilderError("Unable to update members of pool %s: %s %s" % (
+                    pool_id, response.status_code, response.text))
             return True
-        if response.status_code == 409:
-            # raising this exception causes retry
-            raise OSConflict(response.reason)
-        return False
+
+        backoff = Backoff(delay=0.5, max_delay=5,
+                          timeout=timeout or self.ACTIVE_TIMEOUT)
+        try:
+            return wait_until(update, backoff, "members of pool %s" % pool_id)
+        except WaitTimeout as err:
+            raise BuilderError(str(err))
 
     @property
-    def default_pool(self):
+    def _default_pool(self):
         """get the default pool"""
         return self.conn.load_balancer.find_load_balancer(self.name).pools[0]['id']
 
@@ -859,6 +1451,7 @@ class SecurityGroup:
 
     def __init__(self, name, conn, subnet):
         self.name = f"{name}-sec-group"
+        self.cluster_name = name
         self.conn = conn
         self.subnet = subnet
         self.id = None
@@ -909,6 +1502,7 @@ class SecurityGroup:
         else:
             LOGGER.info(f"Creating SecurityGroup [{self.name}] ...")
             secgroup = self.conn.network.create_security_group(name=self.name)
+            tag_resource(self.conn, secgroup, self.cluster_name)
 
         self.id = secgroup.id
         LOGGER.debug("Created SecurityGroup: %s", secgroup)
@@ -1012,6 +1606,10 @@ class OSNetwork:  # pylint: disable=too-few-public-methods
             LOGGER.info("Creating network [%s] ... " % self.name)
             network = self.conn.create_network(name=self.name,
                                                admin_state_up=True)
+            # the cloud layer returns a munch, tagging needs a resource
+            tag_resource(self.conn,
+                         Network.existing(id=network['id'], name=network['name']),
+                         self.config['cluster-name'])
 
         if 'private_net' in self.config:
             self.config['private_net'].update(network)
@@ -1134,6 +1732,7 @@ class OSSubnet:  # pylint: disable=too-few-public-methods
             network_id=subnet['network_id'],
             cidr=subnet['cidr']
         )
+        tag_resource(self.conn, out, self.config['cluster-name'])
 
         self.config['private_net']['subnet'] = subnet
         LOGGER.debug("Subnet: %s", out)
@@ -1154,18 +1753,20 @@ class OSRouter:  # pylint: disable=too-few-public-methods
         self.subnet = subnet
         self.config = config
         self.conn = conn
-        self.name = self._name()
+        self.name = self.name_in(config)
         self.ext_net = self._get_ext_net()
 
-    def _name(self):
-        """Returns the name of the default Router."""
+    @staticmethod
+    def name_in(config):
+        """Returns the name of the Router in the config.
+
+        Unlike creating an OSRouter, this doesn't query OpenStack.
+        """
 
-        if 'router' in self.config.get('private_net',
-                                       {}).get('subnet', {}):
-            router_name = self.config.get(
-                'private_net')['subnet']['router']['name']
+        if 'router' in config.get('private_net', {}).get('subnet', {}):
+            router_name = config.get('private_net')['subnet']['router']['name']
         else:
-            router_name = "%s-rt" % self.config['cluster-name']
+            router_name = "%s-rt" % config['cluster-name']
 
         return router_name
 
@@ -1214,6 +1815,7 @@ class OSRouter:  # pylint: disable=too-few-public-methods
             LOGGER.debug("Setting up Router ...")
             router = self.conn.network.create_router(name=self.name,
                                                      admin_state_up=True)
+            tag_resource(self.conn, router, self.config['cluster-name'])
             LOGGER.debug(router)
 
             LOGGER.debug("Creating new Port for Router ...")
@@ -1226,6 +1828,7 @@ class OSRouter:  # pylint: disable=too-few-public-methods
                                                  network_id=self.net_id,
                                                  admin_state_up=True,
                                                  fixed_ips=fixed_ips)
+            tag_resource(self.conn, port, self.config['cluster-name'])
             LOGGER.debug("Created Port: %s", port)
 
             LOGGER.debug("Attaching Port to Router as interface ...")
@@ -1321,38 +1924,60 @@ class OSClusterInfo:  # pylint: disable=too-many-instance-attributes
     It is the responsibility of the client to check if the resources are
     available and set them up, if necessary.
 
+    In snapshot mode all servers of the cluster are loaded with a single
+    paginated list call the first time an instance is looked up. Instances
+    are then resolved from this snapshot instead of looking up each host
+    and its interfaces. Call :meth:`.refresh` to reload it.
+
     Args:
         nova_client: An OpenStack NOVA Client
         neutron_client: An OpenStack NEUTRON Client
         cinder_client: An OpenStack CINDER Client
         config (dict): A dictionary containing koris config parameters.
         conn: An OpenStack Connection Object.
+        snapshot (bool): Resolve instances from a snapshot of the cluster.
+        state (:class:`koris.cloud.state.ClusterState`): If given, the
+            flavors and networking resources are fetched by their cached
+            IDs, and the IDs found by name are added to it.
     """
     def __init__(self, nova_client, neutron_client,
                  cinder_client,
                  config,
-                 conn):
+                 conn,
+                 snapshot=False,
+                 state=None):
 
         self.conn = conn
+        self.state = state
         self.keypair = nova_client.keypairs.get(config['keypair'])
-        self.node_flavor = nova_client.flavors.find(name=config['node_flavor'])
-        self.master_flavor = nova_client.flavors.find(
-            name=config['master_flavor'])
-
+        self.node_flavor = self._resolve(
+            "node_flavor:%s" % config['node_flavor'], nova_client.flavors.get,
+            partial(nova_client.flavors.find, name=config['node_flavor']))
+        self.master_flavor = self._resolve(
+            "master_flavor:%s" % config['master_flavor'], nova_client.flavors.get,
+            partial(nova_client.flavors.find, name=config['master_flavor']))
+
+        # like the flavors, the networking resources are cached by their
+        # names, so a renamed resource in the config is looked up again
         try:
-            self.net = OSNetwork(config, self.conn).get()
-            self.subnet = OSSubnet(self.net['id'],
-                                   config,
-                                   self.conn).get()
-            self.router = OSRouter(self.net['id'],
-                                   self.subnet,
-                                   config,
-                                   self.conn).get()
+            network = OSNetwork(config, self.conn)
+            self.net = self._resolve("network:%s" % network.name,
+                                     conn.network.get_network, network.get)
+            subnet = OSSubnet(self.net['id'], config, self.conn)
+            self.subnet = self._resolve("subnet:%s" % subnet.name,
+                                        conn.network.get_subnet, subnet.get)
+            self.router = self._resolve(
+                "router:%s" % OSRouter.name_in(config), conn.network.get_router,
+                lambda: OSRouter(self.net['id'], self.subnet, config,
+                                 self.conn).get())
             self.subnet_id = self.subnet['id']
             self.secgroup = SecurityGroup(config['cluster-name'],
                                           self.conn,
                                           subnet=self.subnet)
-            sg = self.secgroup.get()
+            sg = self._resolve("secgroup:%s" % self.secgroup.name,
+                               conn.network.get_security_group,
+                               self.secgroup.get)
+            self.secgroup.id = sg.id
             self.secgroups = [sg.id]
         except (TypeError, KeyError, AttributeError):
             self.net = None
@@ -1373,6 +1998,14 @@ class OSClusterInfo:  # pylint: disable=too-many-instance-attributes
         self._neutron = neutron_client
         self._cinder = cinder_client
         self.config = config
+        self.snapshot = snapshot
+        self._servers = None
+
+    def _resolve(self, key, get_by_id, lookup):
+        """Fetch a resource by its cached ID, or look it up"""
+        if self.state is None:
+            return lookup()
+        return self.state.resolve(key, get_by_id, lookup)
 
     def setup_networking(self, config=None):
         """Creates Network, Subnet, Router and Security Group if necessary.
@@ -1421,6 +2054,21 @@ class OSClusterInfo:  # pylint: disable=too-many-instance-attributes
             sg = self.secgroup.get_or_create()
             self.secgroups = [sg.id]
 
+        self._cache_networking()
+
+    def _cache_networking(self):
+        """Add the IDs of the networking resources to the state"""
+        if self.state is None:
+            return
+
+        for key, resource_id in (
+                ("network:%s" % self.net['name'], self.net['id']),
+                ("subnet:%s" % self.subnet['name'], self.subnet['id']),
+                ("router:%s" % self.router['name'], self.router['id']),
+                ("secgroup:%s" % self.secgroup.name, self.secgroups[0])):
+            if self.state.get(key) != resource_id:
+                self.state.set(key, resource_id)
+
     @property
     def image(self):
         """Find the koris image in OpenStack
@@ -1443,13 +2091,61 @@ class OSClusterInfo:  # pylint: disable=too-many-instance-attributes
 
         return self._image
 
+    def refresh(self):
+        """Load the servers of the cluster in one call and index them.
+
+        Returns:
+            A dictionary of all servers of the cluster by their name.
+        """
+        self._servers = {srv.name: srv for srv in
+                         list_cluster_servers(self._nova, self.name)}
+        LOGGER.debug("Loaded %d servers of cluster %s", len(self._servers),
+                     self.name)
+        return self._servers
+
+    @property
+    def servers(self):
+        """All servers of the cluster by their name, from the snapshot"""
+        if self._servers is None:
+            self.refresh()
+        return self._servers
+
+    def servers_by_role(self, role):
+        """All servers of the cluster with a role, from the snapshot"""
+        prefix = "%s-%s-" % (self.name, role)
+        return [srv for name, srv in sorted(self.servers.items())
+                if name.startswith(prefix)]
+
+    def _snapshot_port(self, server):
+        """Build a port from the fixed address of a server in the snapshot"""
+        addresses = server.addresses
+        if self.net and self.net.get('name') in addresses:
+            addresses = {self.net['name']: addresses[self.net['name']]}
+
+        for addrs in addresses.values():
+            for addr in addrs:
+                if addr.get('OS-EXT-IPS:type', 'fixed') == 'fixed':
+                    return {'port': {'fixed_ips': [{'ip_address': addr['addr']}]}}
+
+        raise IndexError("no fixed address")
+
+    def _find_server(self, hostname):
+        """Find a server by name, in the snapshot if enabled."""
+        if not self.snapshot:
+            return self._nova.servers.find(name=hostname)
+
+        try:
+            return self.servers[hostname]
+        except KeyError:
+            raise NovaNotFound(404, "No Server matching %s" % hostname)
+
     def _get(self, hostname, zone, role):
         """Retrieves an Instance from OpenStack."""
 
         volume_config = {'image': self._image, 'class': self.storage_class}
         inst = None
         try:
-            _server = self._nova.servers.find(name=hostname)
+            _server = self._find_server(hostname)
             LOGGER.debug("Found instance %s", hostname)
             inst = Instance(self._cinder,
                             self._nova,
@@ -1460,7 +2156,10 @@ class OSClusterInfo:  # pylint: disable=too-many-instance-attributes
                             volume_config,
                             _server.flavor)
             try:
-                inst.ports.append(_server.interface_list()[0])
+                if self.snapshot:
+                    inst.ports.append(self._snapshot_port(_server))
+                else:
+                    inst.ports.append(_server.interface_list()[0])
             except IndexError:
                 LOGGER.warning("No network found for %s", hostname)
 
@@ -0,0 +1,126 @@
+"""
+state.py
+========
+
+A local cache of the OpenStack resource IDs of a cluster.
+
+Looking up resources by their name is expensive, since OpenStack has to
+list and filter them. The IDs found by one koris run are written to a state
+file next to the ``certs-<cluster-name>`` directory, thus the next run can
+fetch each resource with a single GET. Every ID is revalidated by a lookup
+by name after :attr:`ClusterState.TTL` seconds.
+"""
+import json
+import os
+import time
+
+from koris.util.logger import Logger
+
+LOGGER = Logger(__name__)
+
+
+class ClusterState:
+    """The cached resource IDs of a cluster.
+
+    Example:
+        >>> state = ClusterState("test")
+        >>> net = state.resolve("network", conn.network.get_network,
+        ...                     lambda: conn.network.find_network("test"))
+        >>> state.save()
+
+    Args:
+        cluster_name (str): The name of the cluster.
+        path (str): The state file, by default ``koris-state-<cluster>.json``
+            in the current directory.
+        ttl (int): Seconds after which a cached ID is looked up again.
+    """
+    TTL = 3600
+    VERSION = 1
+
+    def __init__(self, cluster_name, path=None, ttl=None):
+        self.cluster_name = cluster_name
+        self.path = path or "koris-state-%s.json" % cluster_name
+        self.ttl = self.TTL if ttl is None else ttl
+        self._resources = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as err:
+            LOGGER.debug("Ignoring state file %s: %s", self.path, err)
+            return
+
+        if data.get('version') == self.VERSION:
+            self._resources = data.get('resources', {})
+
+    def get(self, key):
+        """Return the cached ID of a resource, or None if it's expired"""
+        entry = self._resources.get(key)
+        if entry and time.time() - entry['at'] < self.ttl:
+            return entry['id']
+        return None
+
+    def set(self, key, resource_id):
+        """Cache the ID of a resource"""
+        self._resources[key] = {'id': resource_id, 'at': time.time()}
+        self._dirty = True
+
+    def invalidate(self, key):
+        """Remove the ID of a resource from the cache"""
+        if self._resources.pop(key, None) is not None:
+            self._dirty = True
+
+    def resolve(self, key, get_by_id, lookup):
+        """Return a resource, fetched by its cached ID if possible.
+
+        Args:
+            key (str): The key of the resource in the cache.
+            get_by_id: A callable fetching the resource by its ID. It may
+                return None or raise an exception if it's not found.
+            lookup: A callable finding the resource without its ID, e.g. by
+                its name. It may return None.
+
+        Returns:
+            The resource, or None if it doesn't exist.
+        """
+        resource_id = self.get(key)
+        if resource_id:
+            try:
+                resource = get_by_id(resource_id)
+            except Exception as err:  # pylint: disable=broad-except
+                LOGGER.debug("Cached %s %s is gone: %s", key, resource_id, err)
+                resource = None
+            if resource:
+                return resource
+            self.invalidate(key)
+
+        resource = lookup()
+        if resource:
+            self.set(key, resource.id)
+        return resource
+
+    def save(self):
+        """Write the state file, if anything changed"""
+        if not self._dirty:
+            return
+
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as fh:
+            json.dump({'version': self.VERSION, 'cluster': self.cluster_name,
+                       'resources': self._resources}, fh, indent=2)
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+    def remove(self):
+        """Remove the state file, e.g. when the cluster is deleted"""
+        self._resources = {}
+        self._dirty = False
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -42,7 +42,8 @@ Example:
 
 from netaddr import valid_ipv4, valid_ipv6
 
-from koris.cloud.openstack import LoadBalancer
+from koris.cloud.lbspec import ListenerSpec, MemberSpec, PoolSpec
+from koris.cloud.openstack import LoadBalancer, get_engine
 from koris.ssl import create_key, create_ca, CertBundle
 
 
@@ -175,7 +176,7 @@ class Pool:
         self.pool = pool
 
     def add_members(self, lb: LoadBalancer):
-        """Adds Members to a Pool.
+        """Adds Members to a Pool with a single batch update.
 
         Args:
             lb (LoadBalancer): An OSLoadBalancer instance.
@@ -185,8 +186,15 @@ class Pool:
             raise ValidationError("need pool id to add members")
         self.verify()
 
-        for ip in self.members:
-            lb.add_member(self.id, ip, self.port)
+        members = [m.to_api() for m in self.to_spec().members]
+        lb.bulk_update_members(members, self.id)
+
+    def to_spec(self):
+        """Return the Pool as :class:`koris.cloud.lbspec.PoolSpec`"""
+
+        self.verify()
+        return PoolSpec(self.name, self.protocol, self.algorithm,
+                        [MemberSpec(ip, self.port) for ip in self.members])
 
     def add_health_monitor(self, lb: LoadBalancer):
         """Adds a Health monitor to a Pool with default settings
@@ -315,6 +323,22 @@ class Listener:
         self.create()
         self.create_pool()
 
+    def to_spec(self):
+        """Return the Listener and its Pool as :class:`koris.cloud.lbspec.ListenerSpec`"""
+
+        self.verify()
+        return ListenerSpec(self.name, self.protocol, self.port,
+                            self.pool.to_spec())
+
+    async def apply(self):
+        """Create the Listener, Pool, Members and Health monitor.
+
+        Unlike ``all``, this doesn't block the event loop and creates
+        everything with a single request, if the Listener doesn't exist yet.
+        """
+
+        await get_engine().run(self.loadbalancer.apply, [self.to_spec()])
+
 
 class DexSSL:
     """Class managing the dex TLS infrastrucutre.
@@ -341,6 +365,9 @@ class DexSSL:
             file name. This will then be passed as an argument to the
             kube-apiserver so it can use the certificate's public key
             to verify an incoming token.
+        ca_key: The private key of the Dex CA, a new one is created if None.
+        client_key: The private key of the client certificate, a new one is
+            created if None.
 
     Attributes:
         ca_bundle (:class:`koris.ssl.CertBundle`): An SSL Certificate Bundle
@@ -352,11 +379,15 @@ class DexSSL:
     def __init__(self,
                  cert_dir: str,
                  issuer: str,
-                 k8s_ca_path="/etc/ssl/certs/oidc-ca.pem"):
+                 k8s_ca_path="/etc/ssl/certs/oidc-ca.pem",
+                 ca_key=None,
+                 client_key=None):
 
         self.cert_dir = cert_dir
         self.k8s_ca_path = k8s_ca_path
         self.issuer = issuer
+        self._ca_key = ca_key
+        self._client_key = client_key
 
         self.ca_bundle: CertBundle = None
         self.client_bundle: CertBundle = None
@@ -379,7 +410,7 @@ class DexSSL:
         if not self.issuer:
             raise ValidationError("dex certificates needs an issuer")
 
-        dex_ca_key = create_key()
+        dex_ca_key = self._ca_key or create_key()
         key_usage = [False, False, False, False, False, False, False, False, False]
         dex_ca = create_ca(dex_ca_key, dex_ca_key.public_key(),
                            "DE", "BY", "NUE", "Kubernetes", "dex", "kube-ca",
@@ -397,7 +428,8 @@ class DexSSL:
                                                      "DE", "BY", "NUE", "Kubernetes",
                                                      "dex-client", "kube-ca",
                                                      hosts=hosts, ips=ips,
-                                                     key_usage=key_usage)
+                                                     key_usage=key_usage,
+                                                     key=self._client_key)
 
         self.ca_bundle = dex_ca_bundle
         self.client_bundle = dex_client_bundle
@@ -430,7 +462,8 @@ async def create_dex(lb: LoadBalancer, name="dex",
     This will take an existing LoadBalancer in OpenStack and adds a new Listener
     with Pool and members to it, so Dex can be reached inside the cluster.
 
-    Will first create a :class:`.Pool`, then a :class:`.Listener` from that pool.
+    Will first create a :class:`.Pool`, then a :class:`.Listener` from that pool,
+    and apply both in the provisioning engine, see :meth:`.Listener.apply`.
 
     Args:
         lb (LoadBalancer): The used LoadBalancer.
@@ -444,7 +477,7 @@ async def create_dex(lb: LoadBalancer, name="dex",
 
     pool = Pool(f"{name}-pool", protocol, pool_port, algo, members)
     listener = Listener(lb, f"{name}-listener", listener_port, pool)
-    listener.all()
+    await listener.apply()
 
 
 async def create_oauth2(lb: LoadBalancer, name="oauth2",
@@ -469,7 +502,7 @@ async def create_oauth2(lb: LoadBalancer, name="oauth2",
 
     pool = Pool(f"{name}-pool", protocol, pool_port, algo, members)
     listener = Listener(lb, f"{name}-listener", listener_port, pool)
-    listener.all()
+    await listener.apply()
 
 
 # pylint: disable=too-many-branches
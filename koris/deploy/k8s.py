@@ -4,7 +4,6 @@ deploy cluster service to kubernetes via the API server
 import base64
 from datetime import datetime, timedelta
 import getpass
-import logging
 import os
 import random
 import re
@@ -12,12 +11,16 @@ import socket
 import string
 import subprocess as sp
 import sys
+import threading
+import time
+import urllib.parse
 import urllib3
 
 from pkg_resources import resource_filename, Requirement
 from netaddr import valid_ipv4
 
 from kubernetes import client as k8sclient
+from kubernetes import watch
 from kubernetes.stream import stream
 from kubernetes.client import api_client
 from kubernetes.client.configuration import Configuration
@@ -27,11 +30,11 @@ from kubernetes.utils import create_from_yaml
 
 import yaml
 
+from koris.cloud.lbspec import ingress_listeners
 from koris.ssl import read_cert
 from koris.ssl import discovery_hash as ssl_discovery_hash
-from koris.util.util import retry
+from koris.util.util import Backoff, WaitTimeout, retry, wait_until
 from koris.util.logger import Logger
-from koris import MASTER_LISTENER_NAME
 
 if getattr(sys, 'frozen', False):
     MANIFESTSPATH = os.path.join(
@@ -43,6 +46,9 @@ else:
 
 LOGGER = Logger(__name__)
 
+MASTER_ROLE_LABEL = "node-role.kubernetes.io/master"
+READY_TIMEOUT = 1800
+PROBE_TIMEOUT = 5
 
 ETCDCTL_BASE = ("ETCDCTL_API=3 etcdctl "
                 "--key /etc/kubernetes/pki/etcd/server.key "
@@ -62,6 +68,17 @@ def _get_node_addr(addresses, addr_type):
     return [i.address for i in addresses if i.type == addr_type][0]
 
 
+def _node_ready(node):
+    """
+    Check if the Ready condition of a node is True
+
+    Args:
+        node (object) - a node returned from the k8s API
+    """
+    return any(c.type == 'Ready' and c.status == 'True' for c in
+               node.status.conditions or [])
+
+
 def rand_string(num):
     """
     generate a random string of len num
@@ -119,9 +136,43 @@ def parse_etcd_response(resp):
     return out
 
 
+class ClusterCredentials:
+    """The data derived from the cluster CA, which new hosts need to join.
+
+    The CA is read and parsed once. The bootstrap token is created on first
+    use and then shared by all hosts added by one command.
+
+    Args:
+        k8s (:class:`K8S`): The cluster.
+    """
+
+    def __init__(self, k8s):
+        self._k8s = k8s
+        self.ca_cert = read_cert(k8s.api.api_client.configuration.ssl_ca_cert)
+        self.discovery_hash = ssl_discovery_hash(self.ca_cert)
+        self._bootstrap_token = None
+        self._lock = threading.Lock()
+
+    @property
+    def ca_info(self):
+        """Return a dict with the read ca and the discovery hash"""
+        return {"ca_cert": self.ca_cert, "discovery_hash": self.discovery_hash}
+
+    @property
+    def bootstrap_token(self):
+        """A bootstrap token, created once"""
+        with self._lock:
+            if self._bootstrap_token is None:
+                self._bootstrap_token = self._k8s.get_bootstrap_token()
+        return self._bootstrap_token
+
+
 class K8SConfigurator:  # pylint: disable=no-member
     """apply plugins and post install setup"""
 
+    _credentials = None
+    _ready_path = "/readyz"
+
     def apply_plugins(self, plugins):
         """apply all plugins in the list"""
 
@@ -159,10 +210,17 @@ class K8SConfigurator:  # pylint: disable=no-member
         """Retrieve the host or loadbalancer info"""
         return self.api.api_client.configuration.host
 
+    @property
+    def credentials(self):
+        """The :class:`ClusterCredentials` of the cluster, computed once"""
+        if self._credentials is None:
+            self._credentials = ClusterCredentials(self)
+        return self._credentials
+
     @property
     def ca_info(self):
         """Return a dict with the read ca and the discovery hash"""
-        return {"ca_cert": self.ca_cert, "discovery_hash": self.discovery_hash}
+        return self.credentials.ca_info
 
     @property
     def ca_cert(self):
@@ -171,7 +229,7 @@ class K8SConfigurator:  # pylint: disable=no-member
         Returns:
             The CA encoded as base64.
         """
-        return read_cert(self.api.api_client.configuration.ssl_ca_cert)
+        return self.credentials.ca_cert
 
     @property
     def discovery_hash(self):
@@ -182,24 +240,152 @@ class K8SConfigurator:  # pylint: disable=no-member
         Returns:
             A discovery hash encoded in Hex.
         """
-        return ssl_discovery_hash(self.ca_cert)
+        return self.credentials.discovery_hash
 
-    @property
-    def is_ready(self):
-        """Check if the API server is already available.
+    def _api_ready(self):
+        """Probe the ready endpoint of the API server.
 
-        Returns:
-            True if it's reachable.
+        The probe goes through the pooled client of the API, so the
+        connection is kept alive between probes, and is authenticated like
+        all other calls. API servers before 1.16 have no ``/readyz``, for
+        them ``/healthz`` is used.
+
+        An API server which rejects the credentials answers, thus it
+        counts as ready. The next call with the same credentials fails
+        with the actual error, instead of the probe waiting until the
+        deadline.
         """
-        logging.getLogger("urllib3").setLevel(logging.ERROR)
         try:
-            k8sclient.apis.core_api.CoreApi().get_api_versions()
-            logging.getLogger("urllib3").setLevel(logging.WARNING)
+            self.api.api_client.call_api(self._ready_path, "GET",
+                                         auth_settings=['BearerToken'],
+                                         _request_timeout=PROBE_TIMEOUT)
+            return True
+        except ApiException as exc:
+            if exc.status == 404 and self._ready_path == "/readyz":
+                self._ready_path = "/healthz"
+                return self._api_ready()
+            if exc.status in (401, 403):
+                LOGGER.debug("%s answered %s to %s", self.host, exc.status,
+                             self._ready_path)
+                return True
+            return False
+        except urllib3.exceptions.HTTPError:
+            return False
+
+    def _endpoint_reachable(self):
+        """Check if a TCP connection to the API server can be opened"""
+        uri = urllib.parse.urlparse(self.host)
+        try:
+            socket.create_connection((uri.hostname, uri.port or 443),
+                                     timeout=PROBE_TIMEOUT).close()
             return True
-        except urllib3.exceptions.MaxRetryError:
-            logging.getLogger("urllib3").setLevel(logging.WARNING)
+        except OSError:
             return False
 
+    def wait_for_api(self, deadline):
+        """Wait until the API server is reachable and ready.
+
+        First the LoadBalancer is probed with a plain TCP connection, which
+        is cheap and doesn't produce errors in the logs, then the ready
+        endpoint of the API server.
+
+        Args:
+            deadline (float): The point in time (as returned by
+                ``time.monotonic``) after which the wait fails.
+
+        Raises:
+            WaitTimeout if the API server isn't ready before deadline.
+        """
+        wait_until(self._endpoint_reachable, Backoff(delay=1, max_delay=5,
+                                                     deadline=deadline),
+                   "the API server at %s" % self.host)
+        LOGGER.debug("API server endpoint %s is reachable", self.host)
+        wait_until(self._api_ready, Backoff(delay=1, max_delay=5,
+                                            deadline=deadline),
+                   "the API server to become ready")
+
+    def _watch_nodes(self, deadline, label_selector=""):
+        """Yield the existing nodes, and then every change to them.
+
+        The nodes are listed once and then watched from the resource
+        version of the list. If that version expired, the nodes are listed
+        again. The generator yields tuples of the event type and the node,
+        until it's closed or the deadline is reached.
+
+        Raises:
+            WaitTimeout once the deadline is reached.
+            ApiException if the watch fails for another reason.
+        """
+        resource_version = None
+        while True:
+            remaining = int(deadline - time.monotonic())
+            if remaining <= 0:
+                raise WaitTimeout("timed out waiting for nodes")
+
+            if resource_version is None:
+                nodes = self.api.list_node(label_selector=label_selector)
+                resource_version = nodes.metadata.resource_version
+                for node in nodes.items:
+                    yield 'ADDED', node
+                continue
+
+            watcher = watch.Watch()
+            try:
+                for event in watcher.stream(self.api.list_node,
+                                            label_selector=label_selector,
+                                            resource_version=resource_version,
+                                            timeout_seconds=min(remaining, 60)):
+                    if event['type'] == 'ERROR':
+                        # the object of an error is a Status, not a node
+                        status = event.get('raw_object') or {}
+                        if status.get('code') != 410:
+                            raise ApiException(status=status.get('code'),
+                                               reason=status.get('message'))
+                        # the resource version is too old, list the nodes
+                        # again
+                        resource_version = None
+                        break
+                    node = event['object']
+                    resource_version = node.metadata.resource_version
+                    yield event['type'], node
+            except ApiException as exc:
+                # the resource version is too old, list the nodes again
+                if exc.status != 410:
+                    raise
+                resource_version = None
+            finally:
+                watcher.stop()
+
+    def wait_for_nodes(self, n_masters, n_nodes, deadline):
+        """Wait until the expected number of masters and nodes is Ready.
+
+        Args:
+            n_masters (int): The number of masters.
+            n_nodes (int): The number of worker nodes.
+            deadline (float): The point in time (as returned by
+                ``time.monotonic``) after which the wait fails.
+
+        Raises:
+            WaitTimeout if the nodes aren't Ready before deadline.
+        """
+        ready = {}
+        progress = None
+        for event, node in self._watch_nodes(deadline):
+            labels = node.metadata.labels or {}
+            if event != 'DELETED' and _node_ready(node):
+                ready[node.metadata.name] = MASTER_ROLE_LABEL in labels
+            else:
+                ready.pop(node.metadata.name, None)
+
+            masters = sum(ready.values())
+            nodes = len(ready) - masters
+            if (masters, nodes) != progress:
+                progress = (masters, nodes)
+                LOGGER.info("%d/%d masters and %d/%d nodes are Ready",
+                            masters, n_masters, nodes, n_nodes)
+            if masters >= n_masters and nodes >= n_nodes:
+                return
+
     def get_random_master(self):
         """Returns a name and IP of a random master server in the cluster.
 
@@ -220,6 +406,17 @@ class K8SConfigurator:  # pylint: disable=no-member
 
         return master_name, master_ip
 
+    def get_masters(self):
+        """Returns the names and IPs of all masters in the cluster.
+
+        Returns:
+            List of tuples of name and IP, sorted by name.
+        """
+        nodes = self.api.list_node(label_selector=MASTER_ROLE_LABEL)
+        return sorted((_get_node_addr(node.status.addresses, "Hostname"),
+                       _get_node_addr(node.status.addresses, "InternalIP"))
+                      for node in nodes.items)
+
     @retry(ValueError)
     def etcd_cluster_status(self):
         """Checks the current etcd cluster state.
@@ -265,48 +462,6 @@ class K8SConfigurator:  # pylint: disable=no-member
 
         return etcd_cluster
 
-    def add_all_masters_to_loadbalancer(self, cluster_name, n_masters, lb_inst):
-        """Adds all master nodes to the LoadBalancer listener.
-
-        If the number of members in the master listener pool of the LoadBalancer
-        is less than expected number of masters this function will add them to
-        the pool as soon as they have node status "Ready".
-
-        Args:
-            cluster_name (string): the name of the cluster
-            n_master (int): Number of desired master nodes.
-            lb_inst (:class:`.cloud.openstack.LoadBalancer`):
-                A configured LoadBalancer instance.
-        """
-        cond = {'Ready': 'True'}
-        master_listener = lb_inst.master_listener
-        listener_name = '-'.join((MASTER_LISTENER_NAME,
-                                  cluster_name))
-        if not master_listener:
-            LOGGER.error(f"No {listener_name} found, aborting")
-            sys.exit(1)
-
-        try:
-            listener_name = master_listener['name']
-            mem = master_listener['pool']['members']  # noqa #  pylint: disable=unused-variable
-            pool_id = master_listener['pool']['id']
-        except KeyError as exc:
-            LOGGER.error(f"Unable to extract info of {listener_name}: {exc}")
-            sys.exit(1)
-
-        while len(lb_inst.master_listener['pool']['members']) < n_masters:
-            for item in self.api.list_node(pretty=True).items:
-                if cond in [{c.type: c.status} for c in item.status.conditions]:
-                    if 'master' in item.metadata.name:
-                        addr_to_add = item.status.addresses[0].address
-                        addr_present = [x['address'] for x in
-                                        lb_inst.master_listener['pool']['members']]
-                        if addr_to_add not in addr_present:
-                            LOGGER.debug("Adding %s to pool '%s' (%s) ...", addr_to_add,
-                                         listener_name, pool_id)
-                            lb_inst.add_member(pool_id,
-                                               addr_to_add)
-
     def apply_addons(self, koris_config, apply_func=create_from_yaml):
         """apply all addons to the cluster
 
@@ -627,32 +782,17 @@ def add_ingress_listeners(nginx_ingress_ports, lbinst, lb_masters):
     Reconfigure the Openstack LoadBalancer - add an HTTP and HTTPS listener
     for nginx ingress controller
 
+    Each listener is created together with its pool and members, see
+    :func:`koris.cloud.lbspec.ingress_listeners`.
+
     Args:
+        nginx_ingress_ports (dict): The ports of the ingress service.
         lbinst (:class:`.cloud.openstack.LoadBalancer`): A configured
             LoadBalancer instance.
-        members (list): list containining memebr information
+        lb_masters (list): list containining member information
     """
-    # [{"name": "foo", "address": "10.0.0.38", "protocol_port": "6443"},
-    #  {"name": "bar", "address": "10.0.0.29", "protocol_port": "6443"},
+    # [{"name": "foo", "address": "10.0.0.38"},
+    #  {"name": "bar", "address": "10.0.0.29"},
     # ]
-
-    for key, port in {'Ingress-HTTP': 80, 'Ingress-HTTPS': 443}.items():
-        protocol = key.split("-")[-1]
-        name = '-'.join((key, lbinst.config['cluster-name']))
-        listener = lbinst.add_listener(
-            name=name,
-            protocol=protocol,
-            protocol_port=port)
-
-        pool = lbinst.add_pool(listener.id, protocol=protocol, name=name)
-        updated_masters = lb_masters.copy()
-
-        for master in updated_masters:
-            master['protocol_port'] = nginx_ingress_ports[protocol].node_port
-            master["monitor_port"] = nginx_ingress_ports[protocol].node_port
-
-        if not lbinst.bulk_update_members(updated_masters, pool['id']):
-            LOGGER.debug("Bulk update failed, falling back to serial update")
-            for master in lb_masters:
-                lbinst.add_member(pool.id, master['address'],
-                                  protocol_port=nginx_ingress_ports[protocol].node_port)  # noqa
+    lbinst.apply(ingress_listeners(lbinst.config['cluster-name'],
+                                   nginx_ingress_ports, lb_masters))
@@ -0,0 +1,323 @@
+"""
+rotate.py
+=========
+
+Re-issue the certificates of the control plane and roll them out to the
+masters.
+
+The certificates are signed with the CAs which already exist on the masters,
+hence kubelets, nodes and kubeconfigs keep working. For every master:
+
+* the CAs and the current certificates are fetched in one SSH call,
+* new certificates with the same subject and alternative names are signed
+  locally, with keys from a :class:`koris.ssl.KeyPool`,
+* the PKI directory is backed up and the new files are written in one SSH
+  call. If that fails on any master, the backups are restored on all
+  masters.
+
+All masters are handled in parallel, each through one multiplexed SSH
+connection (OpenSSH ControlMaster). Then etcd and the API server are
+restarted one master at a time, so the cluster keeps its quorum.
+
+Example:
+    >>> rotation = CertRotation(k8s.get_masters(), user="ubuntu")
+    >>> rotation.run()
+"""
+import io
+import os
+import shutil
+import subprocess as sp
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+
+from koris.ssl import (CertBundle, KeyPool, DEFAULT_KEY_ALGORITHM, pem_cert,
+                       pem_key, reissue)
+from koris.util.logger import Logger
+
+LOGGER = Logger(__name__)
+
+PKI_DIR = "/etc/kubernetes/pki"
+MANIFESTS_DIR = "/etc/kubernetes/manifests"
+
+# the certificates kubeadm creates for the control plane and their CA
+CONTROL_PLANE_CERTS = (
+    ("apiserver", "ca"),
+    ("apiserver-kubelet-client", "ca"),
+    ("front-proxy-client", "front-proxy-ca"),
+    ("apiserver-etcd-client", "etcd/ca"),
+    ("etcd/server", "etcd/ca"),
+    ("etcd/peer", "etcd/ca"),
+    ("etcd/healthcheck-client", "etcd/ca"),
+)
+
+# the static pods which read the certificates, in the order of the restart
+RESTART_PODS = ("etcd", "kube-apiserver")
+
+# kubelet checks the manifests directory every 20 seconds
+RESTART_SCRIPT = """
+set -e
+for pod in {pods}; do
+    mv {manifests}/$pod.yaml /etc/kubernetes/$pod.yaml
+    sleep {grace}
+    mv /etc/kubernetes/$pod.yaml {manifests}/$pod.yaml
+    sleep {grace}
+done
+for i in $(seq {timeout}); do
+    curl -skf https://127.0.0.1:6443/healthz > /dev/null && exit 0
+    sleep 1
+done
+echo "kube-apiserver didn't become healthy" >&2
+exit 1
+"""
+
+
+class SSHChannel:
+    """Run commands on a host through one multiplexed SSH connection.
+
+    The first command opens a master connection, all later commands reuse
+    it, so they don't pay for the TCP and SSH handshakes again.
+
+    Args:
+        host (str): The address of the host.
+        user (str): The SSH user.
+        jump_host (str): An SSH jump host, e.g. ``ubuntu@bastion``.
+        control_dir (str): The directory for the control sockets.
+        connect_timeout (int): The timeout of opening the connection.
+    """
+
+    def __init__(self, host, user="ubuntu", jump_host=None, control_dir=None,
+                 connect_timeout=30):
+        self.host = host
+        self.target = "%s@%s" % (user, host)
+        self.jump_host = jump_host
+        self.control_dir = control_dir or tempfile.gettempdir()
+        self.connect_timeout = connect_timeout
+
+    @property
+    def options(self):
+        """The options of the ssh command"""
+        opts = ["-o", "ControlMaster=auto",
+                "-o", "ControlPath=%s" % os.path.join(self.control_dir, "%C"),
+                "-o", "ControlPersist=300",
+                "-o", "BatchMode=yes",
+                # trust a master on first use, but never a changed key
+                "-o", "StrictHostKeyChecking=accept-new",
+                "-o", "ConnectTimeout=%d" % self.connect_timeout]
+        if self.jump_host:
+            opts += ["-J", self.jump_host]
+        return opts
+
+    def run(self, command, data=None, timeout=600):
+        """Run command on the host.
+
+        Args:
+            command (str): The shell command.
+            data (bytes): The standard input of the command.
+            timeout (int): The time in seconds the command may take.
+
+        Returns:
+            The standard output of the command as bytes.
+
+        Raises:
+            RuntimeError if the command fails.
+        """
+        cmd = ["ssh"] + self.options + [self.target, command]
+        try:
+            proc = sp.run(cmd, input=data, stdout=sp.PIPE, stderr=sp.PIPE,
+                          check=True, timeout=timeout)
+        except sp.CalledProcessError as exc:
+            raise RuntimeError("error calling '%s' on %s: %s" % (
+                command, self.host, exc.stderr.decode(errors="replace")))
+        except sp.TimeoutExpired:
+            raise RuntimeError("calling '%s' on %s timed out" % (command,
+                                                                 self.host))
+        return proc.stdout
+
+    def close(self):
+        """Close the master connection"""
+        # the master connection may have exited already
+        sp.run(["ssh"] + self.options + ["-O", "exit", self.target],
+               stdout=sp.DEVNULL, stderr=sp.DEVNULL, check=False)
+
+
+def _pack(files):
+    """create a tar archive of files, a dict of paths and contents"""
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for path, content in sorted(files.items()):
+            info = tarfile.TarInfo(path)
+            info.size = len(content)
+            info.mode = 0o600 if path.endswith(".key") else 0o644
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(content))
+    return buf.getvalue()
+
+
+def _unpack(data):
+    """read a tar archive into a dict of paths and contents"""
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        return {member.name: tar.extractfile(member).read()
+                for member in tar.getmembers() if member.isfile()}
+
+
+class CertRotation:
+    """Re-issue the control plane certificates of all masters.
+
+    Args:
+        masters (list): Tuples of name and IP of the masters, see
+            :meth:`koris.deploy.k8s.K8SConfigurator.get_masters`.
+        user (str): The SSH user on the masters.
+        jump_host (str): An SSH jump host to reach the masters.
+        algorithm (str): The algorithm of the new keys.
+        grace (int): The seconds kubelet gets to stop and start a pod.
+    """
+
+    def __init__(self, masters, user="ubuntu", jump_host=None,
+                 algorithm=DEFAULT_KEY_ALGORITHM, grace=20):
+        self.masters = list(masters)
+        self.algorithm = algorithm
+        self.grace = grace
+        self._control_dir = tempfile.mkdtemp(prefix="koris-ssh-")
+        self.channels = {name: SSHChannel(ip, user, jump_host,
+                                          self._control_dir)
+                         for name, ip in self.masters}
+        self.timings = {name: {} for name, _ in self.masters}
+        self.backups = {}
+
+    def _timed(self, name, step, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.timings[name][step] = time.perf_counter() - start
+
+    def fetch(self, name):
+        """Fetch the CAs and the current certificates of a master"""
+        paths = set()
+        for cert, ca_name in CONTROL_PLANE_CERTS:
+            paths.update((cert + ".crt", ca_name + ".crt", ca_name + ".key"))
+        data = self.channels[name].run("sudo tar -c -C %s %s" % (
+            PKI_DIR, " ".join(sorted(paths))))
+        return _unpack(data)
+
+    @staticmethod
+    def issue(files, key_pool):
+        """Sign new certificates for the files of one master.
+
+        Returns:
+            A dict of the paths and contents of the new keys and
+            certificates.
+        """
+        new = {}
+        for cert, ca_name in CONTROL_PLANE_CERTS:
+            ca_bundle = CertBundle.from_pem(files[ca_name + ".key"],
+                                            files[ca_name + ".crt"])
+            current = x509.load_pem_x509_certificate(files[cert + ".crt"],
+                                                     default_backend())
+            bundle = reissue(current, ca_bundle, key=key_pool.get())
+            new[cert + ".key"] = pem_key(bundle.key)
+            new[cert + ".crt"] = pem_cert(bundle.cert)
+        return new
+
+    def push(self, name, files):
+        """Back up the PKI directory of a master and write the new files"""
+        backup = "%s.bak-%s" % (PKI_DIR, time.strftime("%Y%m%d%H%M%S"))
+        # recorded before, since the call may fail after the backup was made
+        self.backups[name] = backup
+        # the backup only gets its name once the copy is complete, so a
+        # restore never replaces the PKI directory with a partial copy
+        self.channels[name].run(
+            "sudo cp -a {pki} {backup}.tmp && sudo mv {backup}.tmp {backup} && "
+            "sudo tar -x -C {pki}".format(pki=PKI_DIR, backup=backup),
+            data=_pack(files))
+        LOGGER.debug("%s: backed up %s to %s", name, PKI_DIR, backup)
+
+    def restore(self, name):
+        """Replace the PKI directory of a master with its backup"""
+        command = ("if sudo test -d {backup}; then sudo rm -rf {pki} && "
+                   "sudo mv {backup} {pki}; fi; sudo rm -rf {backup}.tmp")
+        self.channels[name].run(command.format(pki=PKI_DIR,
+                                               backup=self.backups[name]))
+
+    def rollback(self, pool):
+        """Restore the backups of all masters which received files.
+
+        Backups which can't be restored are logged, so they can be restored
+        by hand.
+        """
+        restores = {name: pool.submit(self.restore, name)
+                    for name in self.backups}
+        for name, future in restores.items():
+            try:
+                future.result()
+                LOGGER.info("%s: restored %s", name, PKI_DIR)
+            except RuntimeError as exc:
+                LOGGER.error("%s: could not restore %s from %s: %s", name,
+                             PKI_DIR, self.backups[name], exc)
+
+    def restart(self, name, timeout=300):
+        """Restart etcd and the API server of a master"""
+        script = RESTART_SCRIPT.format(pods=" ".join(RESTART_PODS),
+                                       manifests=MANIFESTS_DIR,
+                                       grace=self.grace, timeout=timeout)
+        self.channels[name].run("sudo sh -s", data=script.encode(),
+                                timeout=timeout + 4 * self.grace + 60)
+
+    def run(self):
+        """Rotate the certificates and report the time each step took.
+
+        Raises:
+            RuntimeError if a command on a master fails. If the new files
+            can't be written to all masters, the backups are restored first.
+        """
+        start = time.perf_counter()
+        names = [name for name, _ in self.masters]
+        try:
+            with ThreadPoolExecutor(max_workers=len(names)) as pool:
+                LOGGER.info("Fetching the PKI of %d masters ...", len(names))
+                fetched = dict(zip(names, pool.map(
+                    lambda name: self._timed(name, "fetch", self.fetch, name),
+                    names)))
+
+                LOGGER.info("Issuing new certificates ...")
+                with KeyPool(capacity=len(CONTROL_PLANE_CERTS),
+                             algorithm=self.algorithm) as key_pool:
+                    issued = {name: self._timed(name, "issue", self.issue,
+                                                fetched[name], key_pool)
+                              for name in names}
+
+                LOGGER.info("Distributing the certificates ...")
+                pushes = {name: pool.submit(self._timed, name, "push",
+                                            self.push, name, issued[name])
+                          for name in names}
+                errors = [str(future.exception()) for future in
+                          pushes.values() if future.exception()]
+                if errors:
+                    self.rollback(pool)
+                    raise RuntimeError("; ".join(errors))
+
+            for name in names:
+                LOGGER.info("Restarting the control plane of %s ...", name)
+                self._timed(name, "restart", self.restart, name)
+        finally:
+            for channel in self.channels.values():
+                channel.close()
+            shutil.rmtree(self._control_dir, ignore_errors=True)
+
+        self.report(time.perf_counter() - start)
+
+    def report(self, total):
+        """Log the time each step took on each master"""
+        steps = ("fetch", "issue", "push", "restart")
+        LOGGER.info("%-30s %s", "master", " ".join("%9s" % s for s in steps))
+        for name, timings in self.timings.items():
+            LOGGER.info("%-30s %s", name, " ".join(
+                "%8.2fs" % timings[s] if s in timings else "%9s" % "-"
+                for s in steps))
+        LOGGER.info("Rotated the certificates of %d masters in %.2fs",
+                    len(self.masters), total)
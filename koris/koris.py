@@ -8,27 +8,22 @@ It automatically creates an executable in your path.
 
 """
 import argparse
+import multiprocessing
 import os
-import shutil
 import ssl
 import sys
-import urllib
-from urllib.request import urlopen
-from urllib.error import URLError, HTTPError
-import yaml
 
 from mach import mach1
 
-from koris.util.util import KorisVersionCheck
+from koris.util.util import check_latest_version
 
 from . import __version__, KUBERNETES_BASE_VERSION
-from .cli import remove_cluster, confirm
-from .deploy.k8s import K8S
 from .util.logger import Logger
-from .cloud.builder import ClusterBuilder, NodeBuilder, ControlPlaneBuilder
-from .cloud.openstack import (OSCloudConfig, BuilderError, InstanceExists,
-                              delete_instance, OSClusterInfo, get_connection,
-                              LoadBalancer, get_clients, InstanceNotFound)
+
+# The OpenStack and Kubernetes clients and cryptography take most of the
+# start up time of koris. They are imported by the commands which need
+# them, so ``koris --help`` doesn't pay for them.
+# pylint: disable=import-outside-toplevel
 
 # pylint: disable=protected-access
 ssl._create_default_https_context = ssl._create_unverified_context
@@ -37,8 +32,18 @@ KORIS_DOC_URL = "https://pi.docs.noris.net/koris/"
 LOGGER = Logger(__name__)
 
 
+def load_config(config):
+    """read the cluster configuration file"""
+    import yaml
+
+    with open(config, 'r') as stream:
+        return yaml.safe_load(stream)
+
+
 def update_config(config_dict, config, amount, role='nodes'):
     """update the cluster configuration file"""
+    import yaml
+
     key = "n-%s" % role
     config_dict[key] = config_dict[key] + amount
     updated_name = config.split(".")
@@ -76,6 +81,8 @@ def add_node(cloud_config,
         config_dict (dict): the koris configuration yaml as ``dict``
 
     """
+    from .cloud.builder import NodeBuilder
+
     node_builder = NodeBuilder(
         config_dict,
         os_cluster_info,
@@ -88,7 +95,7 @@ def add_node(cloud_config,
         config_dict.update({"version": {"k8s": k8s_version}})
 
     tasks = node_builder.create_nodes_tasks(k8s.host,
-                                            k8s.get_bootstrap_token(),
+                                            k8s.credentials.bootstrap_token,
                                             k8s.ca_info,
                                             role=role,
                                             zone=zone,
@@ -103,7 +110,8 @@ def add_master(builder,
                flavor,
                config,
                config_dict,
-               k8s):
+               k8s,
+               state=None):
     """Add a new master to OpenStack and the Kubernetes cluster.
 
     Will add a new node to OpenStack, adjust the config, bootstrap the master
@@ -119,7 +127,9 @@ def add_master(builder,
         os_cluster_info (:class:`.cloud.openstack.OSClusterInfo`): A
             OSClusterInfo instance.
         k8s (:class:`.deploy.K8S`): A K8S instance.
+        state (:class:`.cloud.state.ClusterState`): The cached resource IDs.
     """
+    import urllib.parse
 
     if 'version' in config_dict and 'k8s' in config_dict['version']:
         k8s_version = config_dict['version']['k8s']
@@ -131,7 +141,7 @@ def add_master(builder,
     loc, port = uri.netloc.split(":")
     master = builder.add_master(
         zone, flavor, k8s_version=k8s_version, k8s_conf=k8s.config,
-        koris_env={'bootstrap_token': k8s.get_bootstrap_token(),
+        koris_env={'bootstrap_token': k8s.credentials.bootstrap_token,
                    'lb_dns': loc,
                    'lb_ip': loc,
                    'lb_port': port,
@@ -139,9 +149,20 @@ def add_master(builder,
                    'auto_join': 1})
     update_config(config_dict, config, 1, role='masters')
 
-    # Adding master to LB
-    conn = get_connection()
-    lb = LoadBalancer(config_dict, conn)
+    add_to_master_pool(config_dict, master.ip_address, state=state)
+
+
+def add_to_master_pool(config_dict, address, state=None):
+    """Add a master to the API server pool of the cluster's LoadBalancer.
+
+    Args:
+        config_dict (dict): The parsed koris config.
+        address (str): The IP address of the master.
+        state (:class:`.cloud.state.ClusterState`): The cached resource IDs.
+    """
+    from .cloud.openstack import get_connection, LoadBalancer
+
+    lb = LoadBalancer(config_dict, get_connection(), state=state)
     if not lb.get():
         LOGGER.error("No LoadBalancer found")
         sys.exit(1)
@@ -151,7 +172,42 @@ def add_master(builder,
         LOGGER.error(f"Unable to obtain master-pool: {exc}")
         sys.exit(1)
     LOGGER.info("Adding new master to LoadBalancer ...")
-    lb.add_member(master_pool, master.ip_address)
+    lb.add_member(master_pool, address)
+
+
+def remove_from_master_pool(lb, inventory, name):
+    """Remove a master from the API server pool of the LoadBalancer.
+
+    Args:
+        lb (:class:`.cloud.openstack.LoadBalancer`): The cluster's
+            LoadBalancer.
+        inventory (:class:`.cloud.inventory.ClusterInventory`): The
+            resources of the cluster.
+        name (str): The name of the master.
+
+    Raises:
+        ValueError if the master isn't found or has no IP.
+    """
+    # Get IP of node to be deleted
+    srv = inventory.server(name)
+    if not srv:
+        raise ValueError(f"instance '{name}' not found")
+    ip = [addr['addr'] for addrs in srv.addresses.values() for addr in addrs]
+    if not ip:
+        raise ValueError(f"instance '{name}' has no IP")
+
+    # Get member ID of node to be ledeted
+    mems = lb.master_listener['pool']['members']
+    mem_id = [x['id'] for x in mems if x['address'] == ip[0]]
+    if mem_id:
+        # Delete member from LoadBalancer master pool
+        pool_id = lb.master_listener['pool']['id']
+        lb.del_member(mem_id[0], pool_id)
+        LOGGER.success("Removed instance '%s' from LoadBalancer '%s'", name,
+                       lb.name)
+    else:
+        LOGGER.debug("Members: %s", mems)
+        LOGGER.error("instance '%s' not part of LoadBalancer", name)
 
 
 # pylint: disable=no-member
@@ -172,11 +228,20 @@ def delete_node(config_dict, name):
     if not name or name is None:
         raise ValueError("name can't be empty")
 
+    import asyncio
+
+    from .cloud.inventory import ClusterInventory
+    from .cloud.openstack import delete_instance, get_connection, LoadBalancer
+    from .cloud.state import ClusterState
+    from .deploy.k8s import K8S
+
     conn = get_connection()
+    state = ClusterState(config_dict['cluster-name'])
 
     # Get our LoadBalancer
-    lb = LoadBalancer(config_dict, conn)
+    lb = LoadBalancer(config_dict, conn, state=state)
     lbinst = lb.get()
+    state.save()
     if not lbinst:
         raise ValueError("no LoadBalancer found")
 
@@ -186,38 +251,21 @@ def delete_node(config_dict, name):
     if not k8s.validate_context(conn):
         raise ValueError("cluster not part of your sourced OpenStack tenant")
 
+    inventory = asyncio.get_event_loop().run_until_complete(
+        ClusterInventory(conn, config_dict['cluster-name']).refresh())
+
     # Drain the node first
     k8s.drain_node(name)
 
     # If master, remove member from etcd cluster and LoadBalancer
     if 'master' in name:
         k8s.remove_from_etcd(name)
-
-        # Get IP of node to be deleted
-        srv = conn.compute.find_server(name)
-        if not srv:
-            raise ValueError(f"instance '{name}' not found")
-        ip = list(conn.compute.server_ips(srv))
-        if not ip:
-            raise ValueError(f"instance '{name}' has no IP")
-
-        # Get member ID of node to be ledeted
-        mems = lb.master_listener['pool']['members']
-        mem_id = [x['id'] for x in mems if x['address'] == ip[0].address]
-        if mem_id:
-            # Delete member from LoadBalancer master pool
-            pool_id = lb.master_listener['pool']['id']
-            lb.del_member(mem_id[0], pool_id)
-            LOGGER.success("Removed instance '%s' from LoadBalancer '%s'", name,
-                           lb.name)
-        else:
-            LOGGER.debug("Members: %s", mems)
-            LOGGER.error("instance '%s' not part of LoadBalancer", name)
+        remove_from_master_pool(lb, inventory, name)
     # Delete the node from Kubernetes
     k8s.delete_node(name)
 
     # Delete the instance from OpenStack
-    delete_instance(name, conn, ignore_not_found=False)
+    delete_instance(name, conn, ignore_not_found=False, inventory=inventory)
 
 
 @mach1()
@@ -247,12 +295,7 @@ class Koris:  # pylint: disable=no-self-use,too-many-locals
                                  type=str,
                                  default=3)
 
-        try:
-            html_string = str(urlopen(KORIS_DOC_URL, timeout=1.5).read())
-        except (HTTPError, URLError):
-            html_string = ""
-
-        KorisVersionCheck(html_string).check_is_latest(__version__)
+        check_latest_version(__version__, KORIS_DOC_URL)
 
     def _get_version(self):
         print("%s version: %s" % (self.__class__.__name__, __version__))
@@ -266,13 +309,21 @@ class Koris:  # pylint: disable=no-self-use,too-many-locals
 
         config - configuration file
         """
-        with open(config, 'r') as stream:
-            config = yaml.safe_load(stream)
+        from .cli import remove_cluster
+        from .cloud.builder import ClusterBuilder
+        from .cloud.openstack import (BuilderError, InstanceExists, OSClusterInfo,
+                                      get_clients, get_connection)
+        from .cloud.state import ClusterState
+
+        config = load_config(config)
 
         nova, neutron, cinder = get_clients()
         conn = get_connection()
-        oscinfo = OSClusterInfo(nova, neutron, cinder, config, conn)
+        state = ClusterState(config['cluster-name'])
+        oscinfo = OSClusterInfo(nova, neutron, cinder, config, conn,
+                                snapshot=True, state=state)
         oscinfo.setup_networking(config)
+        state.save()
         builder = ClusterBuilder(config, oscinfo, nova, neutron, cinder, conn)
 
         try:
@@ -281,16 +332,20 @@ class Koris:  # pylint: disable=no-self-use,too-many-locals
             pass
         except BuilderError as err:
             LOGGER.error(f"Error: {err}")
-            remove_cluster(config, nova, neutron, cinder, conn)
+            remove_cluster(config, nova, neutron, conn)
 
     def destroy(self, config: str, force: bool = False):
         """
         Delete the complete cluster stack
         """
-        with open(config, 'r') as stream:
-            config = yaml.safe_load(stream)
+        import shutil
 
-        nova, neutron, cinder = get_clients()
+        from .cli import remove_cluster, confirm
+        from .cloud.openstack import get_clients, get_connection
+
+        config = load_config(config)
+
+        nova, neutron, _ = get_clients()
         if not force:
             LOGGER.question(
                 "Deleting cluster '{}'".format(
@@ -303,7 +358,7 @@ class Koris:  # pylint: disable=no-self-use,too-many-locals
             LOGGER.warn("Deleting cluster '{}'".format(config['cluster-name']))
 
         conn = get_connection()
-        remove_cluster(config, nova, neutron, cinder, conn)
+        remove_cluster(config, nova, neutron, conn)
 
         certs_location = 'certs-' + config['cluster-name']
         try:
@@ -324,9 +379,10 @@ class Koris:  # pylint: disable=no-self-use,too-many-locals
         name - the name of the resource to delete.
         force - Force deletion of resource.
         """
+        from .cli import confirm
+        from .cloud.openstack import InstanceNotFound
 
-        with open(config, 'r') as stream:
-            config_dict = yaml.safe_load(stream)
+        config_dict = load_config(config)
 
         allowed_resource = ["node", "cluster"]
         if resource not in allowed_resource:
@@ -383,16 +439,22 @@ class Koris:  # pylint: disable=no-self-use,too-many-locals
         If you specify a name and IP address the program will only try to join
         it to the cluster without trying to create the host in the cloud first.
         """
+        from .cloud.builder import ControlPlaneBuilder
+        from .cloud.openstack import (OSCloudConfig, OSClusterInfo, get_clients,
+                                      get_connection)
+        from .cloud.state import ClusterState
+        from .deploy.k8s import K8S
 
-        with open(config, 'r') as stream:
-            config_dict = yaml.safe_load(stream)
+        config_dict = load_config(config)
 
         nova, neutron, cinder = get_clients()
         conn = get_connection()
+        state = ClusterState(config_dict['cluster-name'])
 
         k8s = K8S(os.getenv("KUBECONFIG"))
         os_cluster_info = OSClusterInfo(nova, neutron, cinder,
-                                        config_dict, conn)
+                                        config_dict, conn, snapshot=True,
+                                        state=state)
 
         if not k8s.validate_context(os_cluster_info.conn):
             LOGGER.error(("Error: cluster not part of your sourced "
@@ -418,7 +480,7 @@ class Koris:  # pylint: disable=no-self-use,too-many-locals
                                           cloud_config)
             try:
                 add_master(builder, zone, flavor, config,
-                           config_dict, k8s)
+                           config_dict, k8s, state=state)
             except (RuntimeError, ValueError) as exc:
                 LOGGER.error(f"Error: {exc}")
                 sys.exit(1)
@@ -426,13 +488,54 @@ class Koris:  # pylint: disable=no-self-use,too-many-locals
         else:
             LOGGER.warn("Unknown role")
 
+        state.save()
+
         LOGGER.success("Adding new node finished successfully")
 
+    def rotate_certs(self, config: str, user: str = "ubuntu",
+                     jump: str = None):
+        """
+        Re-issue the certificates of the control plane.
+
+        config - configuration file
+        user - the SSH user on the masters
+        jump - an SSH jump host to reach the masters, e.g. ubuntu@bastion
+        ---
+        The certificates of the API server and etcd are signed again with the
+        existing CAs of the cluster in the current context of your KUBECONFIG.
+        They are copied to all masters in parallel, then etcd and the API
+        server are restarted one master at a time.
+        """
+        from .deploy.k8s import K8S
+        from .deploy.rotate import CertRotation
+        from .ssl import DEFAULT_KEY_ALGORITHM
+
+        config_dict = load_config(config)
+        k8s = K8S(os.getenv("KUBECONFIG"))
+        masters = k8s.get_masters()
+        if not masters:
+            LOGGER.error("No masters found in the cluster")
+            sys.exit(1)
+
+        rotation = CertRotation(
+            masters, user=user, jump_host=jump,
+            algorithm=config_dict.get('key_algorithm', DEFAULT_KEY_ALGORITHM))
+        try:
+            rotation.run()
+        except RuntimeError as exc:
+            LOGGER.error(f"Error: {exc}")
+            sys.exit(1)
+
+        LOGGER.success("Certificates of %d masters rotated successfully",
+                       len(masters))
+
 
 def main():
     """
     run and execute koris
     """
+    # keys are created in worker processes, which need this in the bundle
+    multiprocessing.freeze_support()
     k = Koris()
 
     # Display a little information message, at the koris --help page.
@@ -170,7 +170,7 @@ TOKEN
 fi
 
 DISCOVERY_HASH=$(openssl x509 -pubkey -in /etc/kubernetes/pki/ca.crt | \
-                 openssl rsa -pubin -outform der 2>/dev/null | \
+                 openssl pkey -pubin -outform der 2>/dev/null | \
                  openssl dgst -sha256 -hex | sed 's/^.* //')
 
 }
@@ -559,7 +559,7 @@ function main() {
 # install dependencies on each host and join the host to the cluster
 function join_all_hosts() {
    export DISCOVERY_HASH=$(openssl x509 -pubkey -in /etc/kubernetes/pki/ca.crt | \
-                           openssl rsa -pubin -outform der 2>/dev/null | \
+                           openssl pkey -pubin -outform der 2>/dev/null | \
                            openssl dgst -sha256 -hex | sed 's/^.* //')
    if [ -z ${BOOTSTRAP_TOKEN} ]; then
         export BOOTSTRAP_TOKEN=$(kubeadm token list | grep -v TOK| cut -d" " -f 1 | grep '^\S')
@@ -7,10 +7,14 @@ import base64
 import datetime
 import ipaddress
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
 from cryptography import x509
 from cryptography.x509.oid import NameOID
 from cryptography.hazmat.primitives import hashes
@@ -19,17 +23,35 @@ from koris.util.logger import Logger
 
 LOGGER = Logger(__name__)
 
+# RSA stays the default, since every client can handle it. ECDSA P-256 keys
+# are created much faster and are supported by all Kubernetes components.
+# Ed25519 isn't accepted by kubeadm, use it for other certificates only.
+KEY_ALGORITHMS = ("RSA", "ECDSA", "ED25519")
+DEFAULT_KEY_ALGORITHM = "RSA"
 
-def create_key(size=2048, public_exponent=65537):
-    """Create an RSA private key
+
+def create_key(size=2048, public_exponent=65537,
+               algorithm=DEFAULT_KEY_ALGORITHM):
+    """Create a private key
 
     Args:
-        size (int) - the key byte size
-        public_exponent (int) - the key public_exponent
+        size (int) - the key byte size, for RSA keys only
+        public_exponent (int) - the key public_exponent, for RSA keys only
+        algorithm (str) - one of :data:`KEY_ALGORITHMS`, ECDSA keys use the
+            curve P-256
 
     Return:
-        rsa key object instance
+        key object instance
     """
+    algorithm = algorithm.upper()
+    if algorithm == "ECDSA":
+        return ec.generate_private_key(ec.SECP256R1(), default_backend())
+    if algorithm == "ED25519":
+        return ed25519.Ed25519PrivateKey.generate()
+    if algorithm != "RSA":
+        raise ValueError("unsupported key algorithm %s, use one of %s" % (
+            algorithm, ", ".join(KEY_ALGORITHMS)))
+
     key = rsa.generate_private_key(
         public_exponent=public_exponent,
         key_size=size,
@@ -38,6 +60,140 @@ def create_key(size=2048, public_exponent=65537):
     return key
 
 
+def key_algorithm(key):
+    """return the name of the algorithm of a private key"""
+    if isinstance(key, ec.EllipticCurvePrivateKey):
+        return "ECDSA"
+    if isinstance(key, ed25519.Ed25519PrivateKey):
+        return "ED25519"
+    return "RSA"
+
+
+def _signature_hash(key):
+    # Ed25519 signatures include their hash, hence none may be given
+    if isinstance(key, ed25519.Ed25519PrivateKey):
+        return None
+    return hashes.SHA256()
+
+
+def _private_format(key):
+    # the traditional format has no representation of Ed25519 keys
+    if isinstance(key, ed25519.Ed25519PrivateKey):
+        return serialization.PrivateFormat.PKCS8
+    return serialization.PrivateFormat.TraditionalOpenSSL
+
+
+def serialized_key(size=2048, public_exponent=65537,
+                   algorithm=DEFAULT_KEY_ALGORITHM):
+    """Create a private key and return it DER encoded
+
+    Key objects can't be pickled, thus use this function to create keys
+    in another process, and :func:`load_key` to read them.
+
+    Args:
+        size (int) - the key byte size, for RSA keys only
+        public_exponent (int) - the key public_exponent, for RSA keys only
+        algorithm (str) - one of :data:`KEY_ALGORITHMS`
+
+    Return:
+        the private key as DER encoded bytes
+    """
+    return create_key(size, public_exponent, algorithm).private_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption())
+
+
+def load_key(data):
+    """
+    load a DER encoded private key as created by :func:`serialized_key`
+    """
+    return serialization.load_der_private_key(data, password=None,
+                                              backend=default_backend())
+
+
+class KeyPool:
+    """
+    A pool of private keys, which are created ahead of time in worker
+    processes.
+
+    Creating RSA keys is CPU bound, thus issuing many certificates one after
+    another keeps a single core busy. The pool keeps ``capacity`` keys in
+    flight and replaces every key it hands out, so the workers create keys
+    on all cores while the caller signs certificates.
+
+    Example:
+        >>> with KeyPool(capacity=8) as pool:
+        ...     certs = create_certs(config, names, ips, key_pool=pool)
+
+    Args:
+        capacity (int): The number of keys created ahead of time.
+        size (int): The key size, for RSA keys only.
+        algorithm (str): One of :data:`KEY_ALGORITHMS`.
+        max_workers (int): The number of worker processes, by default one
+            per CPU.
+    """
+
+    def __init__(self, capacity=4, size=2048, algorithm=DEFAULT_KEY_ALGORITHM,
+                 max_workers=None):
+        self.capacity = capacity
+        self.size = size
+        self.algorithm = algorithm
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers or min(capacity, os.cpu_count() or 1))
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self.issued = 0
+        self.waited = 0.0
+        self.fill()
+
+    def fill(self):
+        """Start creating keys until capacity keys are in flight"""
+        with self._lock:
+            while len(self._pending) < self.capacity:
+                self._pending.append(self._executor.submit(
+                    serialized_key, self.size, 65537, self.algorithm))
+
+    def get(self):
+        """
+        Return a new private key, waiting for it if none is ready yet.
+        """
+        with self._lock:
+            future = self._pending.popleft()
+            self._pending.append(self._executor.submit(
+                serialized_key, self.size, 65537, self.algorithm))
+
+        start = time.perf_counter()
+        key = load_key(future.result())
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.waited += waited
+            self.issued += 1
+        return key
+
+    def close(self):
+        """Cancel the keys which aren't handed out and stop the workers
+
+        Keys which are already being created can't be cancelled. close
+        doesn't wait for them, the workers exit once they are done.
+        """
+        with self._lock:
+            cancelled = sum(future.cancel() for future in self._pending)
+            running = len(self._pending) - cancelled
+            self._pending.clear()
+            issued, waited = self.issued, self.waited
+        self._executor.shutdown(wait=False)
+        LOGGER.debug("Key pool handed out %d keys, waited %.2fs for them; "
+                     "cancelled %d keys, %d were still being created",
+                     issued, waited, cancelled, running)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 # pylint: disable=dangerous-default-value
 def create_ca(private_key, public_key, country,
               state_province, locality, orga, unit, name,
@@ -113,7 +269,8 @@ def create_ca(private_key, public_key, country,
         x509.AuthorityKeyIdentifier.from_issuer_public_key(public_key),
         critical=False)
 
-    cert = cert.sign(private_key, hashes.SHA256(), default_backend())
+    cert = cert.sign(private_key, _signature_hash(private_key),
+                     default_backend())
 
     return cert
 
@@ -218,27 +375,84 @@ def create_certificate(ca_bundle, public_key, country,
             x509.SubjectAlternativeName(alt_names),
             critical=False)
 
-    cert = cert.sign(ca_bundle.key, hashes.SHA256(), default_backend())
+    cert = cert.sign(ca_bundle.key, _signature_hash(ca_bundle.key),
+                     default_backend())
 
     return cert
 
 
-def b64_key(key):
-    """encode private bytes of a key to base64"""
+def reissue(cert, ca_bundle, key=None, days=1800):
+    """
+    create a new certificate which replaces cert
 
-    bytes_args = dict(encoding=serialization.Encoding.PEM,
-                      format=serialization.PrivateFormat.TraditionalOpenSSL,
-                      encryption_algorithm=serialization.NoEncryption())
+    The subject and the extensions of cert, e.g. the alternative names and
+    the key usage, are kept. The certificate gets a new key, a new serial
+    number and a new validity period.
+
+    Args:
+        cert (inst) - the certificate to replace
+        ca_bundle (CertBundle) - the CA which signs the new certificate
+        key (inst) - the new private key, by default a new key with the
+            algorithm of the CA
+        days (int) - the number of days the certificate is valid
+
+    Return:
+        a :class:`CertBundle` with the new key and certificate
+    """
+    key = key or create_key(algorithm=key_algorithm(ca_bundle.key))
+    new = x509.CertificateBuilder().subject_name(
+        cert.subject
+    ).issuer_name(
+        ca_bundle.cert.subject
+    ).public_key(
+        key.public_key()
+    ).not_valid_before(
+        datetime.datetime.utcnow() + datetime.timedelta(minutes=-10)
+    ).serial_number(
+        x509.random_serial_number()
+    ).not_valid_after(
+        datetime.datetime.utcnow() + datetime.timedelta(days=days))
+
+    for ext in cert.extensions:
+        # the key identifiers are derived from the new keys below
+        if isinstance(ext.value, (x509.SubjectKeyIdentifier,
+                                  x509.AuthorityKeyIdentifier)):
+            continue
+        new = new.add_extension(ext.value, critical=ext.critical)
+
+    new = new.add_extension(
+        x509.SubjectKeyIdentifier.from_public_key(key.public_key()),
+        critical=False)
+    new = new.add_extension(
+        x509.AuthorityKeyIdentifier.from_issuer_public_key(
+            ca_bundle.cert.public_key()), critical=False)
+
+    new = new.sign(ca_bundle.key, _signature_hash(ca_bundle.key),
+                   default_backend())
+    return CertBundle(key, new)
 
-    key_bytes = key.private_bytes(**bytes_args)
 
-    return base64.b64encode(key_bytes).decode()
+def pem_key(key):
+    """return the PEM encoded private bytes of a key"""
+    return key.private_bytes(encoding=serialization.Encoding.PEM,
+                             format=_private_format(key),
+                             encryption_algorithm=serialization.NoEncryption())
+
+
+def pem_cert(cert):
+    """return the PEM encoded public bytes of a cert"""
+    return cert.public_bytes(serialization.Encoding.PEM)
+
+
+def b64_key(key):
+    """encode private bytes of a key to base64"""
+
+    return base64.b64encode(pem_key(key)).decode()
 
 
 def b64_cert(cert):
     """encode public bytes of a cert to base64"""
-    return base64.b64encode(
-        cert.public_bytes(serialization.Encoding.PEM)).decode()
+    return base64.b64encode(pem_cert(cert)).decode()
 
 
 def write_key(key, passwd=None, filename="key.pem"):  # pragma: no coverage
@@ -259,7 +473,7 @@ def write_key(key, passwd=None, filename="key.pem"):  # pragma: no coverage
     with open(filename, "wb") as fh:
         fh.write(key.private_bytes(
             encoding=serialization.Encoding.PEM,
-            format=serialization.PrivateFormat.TraditionalOpenSSL,
+            format=_private_format(key),
             encryption_algorithm=enc_algo,))
 
 
@@ -298,12 +512,16 @@ class CertBundle:
     def create_signed(cls, ca_bundle, country, state, locality,
                       orga, unit, name, hosts, ips,
                       key_usage=[True, False, True, False, False,
-                                 False, False, False, False]):
+                                 False, False, False, False],
+                      key=None, algorithm=None):
 
         """
-        create a sign certificate
+        create a sign certificate, with a new key unless one is given
+
+        The new key uses the given algorithm, or the one of the CA.
         """
-        key = create_key()
+        key = key or create_key(
+            algorithm=algorithm or key_algorithm(ca_bundle.key))
         cert = create_certificate(ca_bundle,
                                   key.public_key(),
                                   country,
@@ -318,6 +536,16 @@ class CertBundle:
 
         return cls(key, cert)
 
+    @classmethod
+    def from_pem(cls, key, cert):
+        """
+        load a certificate bundle from PEM encoded bytes
+        """
+        key = serialization.load_pem_private_key(key, password=None,
+                                                 backend=default_backend())
+        cert = x509.load_pem_x509_certificate(cert, default_backend())
+        return cls(key, cert)
+
     @classmethod
     def read_bundle(cls, key, cert):
         """
@@ -380,17 +608,39 @@ def read_key(key):  # pragma: no coverage
     return private_key
 
 
-def create_certs(config, names, ips, write=True, ca_bundle=None):
+def create_certs(config, names, ips, write=True, ca_bundle=None,
+                 key_pool=None):
     """
     create new certificates, useful for replacing certificates
     and later for adding nodes ...
+
+    The keys use the algorithm of the CA, which is the ``key_algorithm``
+    of the config when a new CA is created. If a :class:`KeyPool` is
+    given, the keys are taken from it, and without ``key_algorithm`` a new
+    CA uses the algorithm of the pool.
+
+    Raises:
+        ValueError if the pool creates keys of another algorithm than the
+        CA or ``key_algorithm``.
     """
+    if ca_bundle:
+        algorithm = key_algorithm(ca_bundle.key)
+    else:
+        algorithm = config.get("key_algorithm", key_pool.algorithm if key_pool
+                               else DEFAULT_KEY_ALGORITHM)
+    if key_pool and key_pool.algorithm.upper() != algorithm.upper():
+        raise ValueError("the key pool creates %s keys, but the certificates "
+                         "need %s keys" % (key_pool.algorithm, algorithm))
+
+    def new_key():
+        return key_pool.get() if key_pool else None
+
     country = "DE"
     state = "Bayern"
     location = "NUE"
 
     if not ca_bundle:
-        ca_key = create_key()
+        ca_key = new_key() or create_key(algorithm=algorithm)
         ca_cert = create_ca(ca_key, ca_key.public_key(), country,
                             state, location, "Kubernetes", "CDA-PI",
                             "kubernetes")
@@ -408,7 +658,8 @@ def create_certs(config, names, ips, write=True, ca_bundle=None):
                                           "CDA-PI",
                                           "kubernetes",
                                           names,
-                                          ips)
+                                          ips,
+                                          key=new_key())
 
     svc_accnt_bundle = CertBundle.create_signed(ca_bundle,
                                                 country,
@@ -418,7 +669,8 @@ def create_certs(config, names, ips, write=True, ca_bundle=None):
                                                 "CDA-PI",
                                                 name="service-accounts",
                                                 hosts="",
-                                                ips="")
+                                                ips="",
+                                                key=new_key())
 
     admin_bundle = CertBundle.create_signed(ca_bundle,
                                             country,
@@ -428,7 +680,8 @@ def create_certs(config, names, ips, write=True, ca_bundle=None):
                                             "CDA-PI",
                                             name="admin",
                                             hosts="",
-                                            ips=""
+                                            ips="",
+                                            key=new_key()
                                             )
 
     kubelet_bundle = CertBundle.create_signed(ca_bundle,
@@ -439,7 +692,8 @@ def create_certs(config, names, ips, write=True, ca_bundle=None):
                                               "CDA-PI",
                                               name="kubelet",
                                               hosts=names,
-                                              ips=ips
+                                              ips=ips,
+                                              key=new_key()
                                               )
 
     nodes = []
@@ -454,7 +708,8 @@ def create_certs(config, names, ips, write=True, ca_bundle=None):
                                                      "CDA-PI",
                                                      name="system:node:%s" % node,  # noqa
                                                      hosts=[node],
-                                                     ips=[node_ip]))
+                                                     ips=[node_ip],
+                                                     key=new_key()))
 
     LOGGER.debug("Done creating all certificates")
     if write:  # pragma: no coverage
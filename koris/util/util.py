@@ -1,10 +1,16 @@
 """
 General purpose utilities
 """
+import asyncio
 import base64
 import copy
+import json
 import logging
+import os
+import random
 import re
+import tempfile
+import threading
 import time
 import sys
 
@@ -12,9 +18,8 @@ import sys
 from functools import lru_cache
 from functools import wraps
 from html.parser import HTMLParser
-from pkg_resources import parse_version
 
-import yaml
+from packaging.version import parse as parse_version
 
 from koris.util.hue import red  # pylint: disable=no-name-in-module
 from koris.util.logger import Logger
@@ -68,6 +73,8 @@ def get_kubeconfig_yaml(master_uri, ca_cert, username, client_cert,
     """
     format a kube configuration file
     """
+    import yaml  # pylint: disable=import-outside-toplevel
+
     config = copy.deepcopy(KUBECONFIG_EMB)
     config['clusters'][0]['cluster']['server'] = master_uri
     config['clusters'][0]['cluster']['certificate-authority-data'] = ca_cert
@@ -173,6 +180,221 @@ def retry(exceptions, tries=4, delay=3, backoff=2, logger=None):
     return deco_retry
 
 
+class WaitTimeout(Exception):
+    """Raised if a resource did not reach the expected state in time"""
+
+
+class Backoff:
+    """
+    Produce delays for polling a resource, which grow exponentially up to
+    a maximum and are randomized a bit, so many waiters started at the same
+    time do not hit the API at the same time.
+
+    Iterating over a Backoff yields the delays until the timeout or the
+    deadline, whichever comes first, is reached.
+
+    Example:
+        >>> backoff = Backoff(delay=1, max_delay=8, factor=2, jitter=0)
+        >>> list(itertools.islice(backoff, 5))
+        [1, 2, 4, 8, 8]
+
+    Args:
+        delay (float): The first delay in seconds.
+        max_delay (float): The maximal delay in seconds.
+        factor (float): The multiplier applied to the delay after each step.
+        jitter (float): The fraction by which each delay is randomized.
+        timeout (float): Seconds from now until the backoff is exhausted.
+        deadline (float): An absolute point in time (as returned by
+            ``time.monotonic``) after which the backoff is exhausted.
+    """
+
+    def __init__(self, delay=1, max_delay=10, factor=1.5, jitter=0.1,
+                 timeout=None, deadline=None):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        if timeout is not None:
+            timeout = time.monotonic() + timeout
+            deadline = timeout if deadline is None else min(deadline, timeout)
+        self.deadline = deadline
+        self._next = delay
+
+    @property
+    def remaining(self):
+        """Seconds left until the deadline, or None if there is none"""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        remaining = self.remaining
+        if remaining == 0:
+            raise StopIteration
+
+        delay = self._next
+        self._next = min(self._next * self.factor, self.max_delay)
+        delay *= 1 + random.uniform(-self.jitter, self.jitter)
+
+        if remaining is not None:
+            delay = min(delay, remaining)
+        return delay
+
+
+async def wait_for(check, backoff=None, what="resource"):
+    """
+    Wait until a resource reaches the expected state.
+
+    Args:
+        check: A coroutine function without arguments. It returns a true
+            value once the resource is ready, and a false value otherwise.
+            Exceptions raised by check are not caught.
+        backoff (Backoff): The delays between two checks.
+        what (str): A description of the resource for the error message.
+
+    Returns:
+        The first true value returned by check.
+
+    Raises:
+        WaitTimeout if the backoff is exhausted before check succeeds.
+    """
+    if backoff is None:
+        backoff = Backoff()
+
+    result = await check()
+    while not result:
+        try:
+            delay = next(backoff)
+        except StopIteration:
+            raise WaitTimeout("timed out waiting for %s" % what)
+        await asyncio.sleep(delay)
+        result = await check()
+
+    return result
+
+
+def wait_until(check, backoff=None, what="resource"):
+    """
+    Block until a resource reaches the expected state.
+
+    This is the synchronous counterpart of :func:`wait_for`, check is a
+    plain function.
+
+    Raises:
+        WaitTimeout if the backoff is exhausted before check succeeds.
+    """
+    if backoff is None:
+        backoff = Backoff()
+
+    result = check()
+    while not result:
+        try:
+            delay = next(backoff)
+        except StopIteration:
+            raise WaitTimeout("timed out waiting for %s" % what)
+        time.sleep(delay)
+        result = check()
+
+    return result
+
+
+class TaskGraph:
+    """
+    Run coroutines concurrently, respecting the dependencies between them.
+
+    Each task is started as soon as all the tasks it requires are done.
+    The results of the required tasks are passed to the coroutine function
+    as positional arguments, in the order they were given in ``requires``.
+
+    If a task fails, the tasks depending on it are not started, but all
+    independent tasks still run to completion.
+
+    Example:
+        >>> graph = TaskGraph()
+        >>> graph.add("servers", delete_servers)
+        >>> graph.add("ports", delete_ports, requires=("servers",))
+        >>> results = loop.run_until_complete(graph.run())
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    def add(self, name, coro_func, requires=()):
+        """Add a task to the graph.
+
+        Args:
+            name (str): A unique name of the task.
+            coro_func: A coroutine function.
+            requires (tuple): Names of tasks which must finish first.
+        """
+        if name in self._tasks:
+            raise ValueError("Task %s was already added" % name)
+        self._tasks[name] = (coro_func, tuple(requires))
+
+    def _check(self):
+        for name, (_, requires) in self._tasks.items():
+            for req in requires:
+                if req not in self._tasks:
+                    raise ValueError("Task %s requires unknown task %s" % (name, req))
+
+        visited, path = set(), []
+
+        def visit(name):
+            if name in path:
+                raise ValueError("Cycle in tasks: %s" % " -> ".join(path + [name]))
+            if name in visited:
+                return
+            path.append(name)
+            for req in self._tasks[name][1]:
+                visit(req)
+            path.pop()
+            visited.add(name)
+
+        for name in self._tasks:
+            visit(name)
+
+    async def run(self):
+        """Run all tasks.
+
+        Returns:
+            A dictionary with the result of each task.
+
+        Raises:
+            The first exception raised by a task, after all tasks which
+            could run are finished.
+        """
+        self._check()
+        loop = asyncio.get_event_loop()
+        futures = {name: loop.create_future() for name in self._tasks}
+
+        async def run_task(name):
+            coro_func, requires = self._tasks[name]
+            try:
+                args = [await asyncio.shield(futures[req]) for req in requires]
+                result = await coro_func(*args)
+            except Exception as err:  # pylint: disable=broad-except
+                futures[name].set_exception(err)
+            else:
+                futures[name].set_result(result)
+
+        await asyncio.gather(*[run_task(name) for name in self._tasks])
+
+        results, errors = {}, []
+        for name, future in futures.items():
+            if future.exception() is None:
+                results[name] = future.result()
+            elif not any(future.exception() is err for err in errors):
+                errors.append(future.exception())
+
+        if errors:
+            raise errors[0]
+
+        return results
+
+
 class TitleParser(HTMLParser):  # pylint: disable=abstract-method
     """
     parse <title></title> from a given HTML page.
@@ -195,9 +417,19 @@ class TitleParser(HTMLParser):  # pylint: disable=abstract-method
 
 
 class KorisVersionCheck:  # pylint: disable=too-few-public-methods
-    """check the version published in the koris docs"""
+    """check the version published in the koris docs
 
-    def __init__(self, html_string):
+    Args:
+        html_string (str): The koris docs start page.
+        version (str): A version found before, e.g. a cached one. If given,
+            html_string is ignored.
+    """
+
+    def __init__(self, html_string, version=None):
+
+        if version is not None:
+            self.version = version
+            return
 
         parser = TitleParser()
         parser.feed(html_string)
@@ -216,3 +448,90 @@ class KorisVersionCheck:  # pylint: disable=too-few-public-methods
                                                               current_version)):
             print(red("Version {} of Koris was released, you should upgrade!".format(
                 self.version)))
+
+
+# Seconds between two lookups of the latest koris version.
+VERSION_CHECK_INTERVAL = 24 * 60 * 60
+
+# Set this environment variable to 0 to disable the version check.
+VERSION_CHECK_ENV = "KORIS_VERSION_CHECK"
+
+
+def get_cache_dir():
+    """return the directory for files koris caches between invocations"""
+    cache_dir = os.environ.get("XDG_CACHE_HOME",
+                               os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_dir, "koris")
+
+
+def _fetch_latest_version(url, cache_path, timeout):
+    """look up the latest version in the docs and cache it"""
+    # pylint: disable=import-outside-toplevel
+    from urllib.request import urlopen
+
+    try:
+        with urlopen(url, timeout=timeout) as response:
+            html_string = response.read().decode("utf-8", errors="replace")
+    except (OSError, ValueError):
+        html_string = ""
+
+    version = KorisVersionCheck(html_string).version
+    try:
+        cache_dir = os.path.dirname(cache_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        # koris may exit while the file is written, and other invocations
+        # may write it at the same time, thus each writes its own file and
+        # moves it in place, the cache is never read half written
+        with tempfile.NamedTemporaryFile("w", dir=cache_dir, prefix=".version-",
+                                         delete=False) as fh:
+            json.dump({"checked_at": time.time(), "version": version}, fh)
+        os.replace(fh.name, cache_path)
+    except OSError as err:
+        LOGGER.debug("Could not write %s: %s", cache_path, err)
+
+
+def check_latest_version(current_version, url, cache_path=None,
+                         interval=VERSION_CHECK_INTERVAL, timeout=5):
+    """
+    Warn if a newer koris version was released, without blocking.
+
+    The warning is based on the version found by a previous invocation.
+    If that is older than interval, the docs are fetched in a background
+    daemon thread and the result is cached for the next invocation. A
+    command which finishes first doesn't wait for it, the cache is then
+    refreshed by a later invocation. Set the environment variable
+    ``KORIS_VERSION_CHECK=0`` to disable the check.
+
+    Args:
+        current_version (str): The running koris version.
+        url (str): The koris docs start page.
+        cache_path (str): The file caching the latest version.
+        interval (int): Seconds after which the cached version is refreshed.
+        timeout (float): Seconds to wait for the docs.
+
+    Returns:
+        The thread fetching the latest version, or None if the cached
+        version is recent enough or the check is disabled.
+    """
+    if os.environ.get(VERSION_CHECK_ENV, "1") == "0":
+        return None
+
+    cache_path = cache_path or os.path.join(get_cache_dir(), "version.json")
+    try:
+        with open(cache_path) as fh:
+            cached = json.load(fh)
+    except (OSError, ValueError):
+        cached = {}
+
+    if cached.get("version"):
+        KorisVersionCheck("", version=cached["version"]).check_is_latest(
+            current_version)
+
+    if time.time() - cached.get("checked_at", 0) < interval:
+        return None
+
+    thread = threading.Thread(target=_fetch_latest_version,
+                              args=(url, cache_path, timeout),
+                              name="koris-version-check", daemon=True)
+    thread.start()
+    return thread
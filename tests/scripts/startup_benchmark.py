@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+"""
+A script to compare the start up time of koris installations, e.g. the
+wheel install with the PyInstaller bundles:
+
+    $ python3 tests/scripts/startup_benchmark.py koris dist/koris/koris
+
+Each executable is run with the given arguments (``--help`` by default)
+a few times, the first run is discarded since it fills the file system
+cache.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import time
+
+
+def measure(executable, args, runs):
+    """return the wall clock times of running executable runs times"""
+    env = dict(os.environ, KORIS_VERSION_CHECK="0")
+    times = []
+    for _ in range(runs + 1):
+        start = time.perf_counter()
+        subprocess.run([executable] + args, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, env=env, check=True)
+        times.append(time.perf_counter() - start)
+    return times[1:]
+
+
+def main():
+    """run the benchmark and print a table"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("executables", nargs="+")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--args", default="--help",
+                        help="the arguments passed to koris")
+    opts = parser.parse_args()
+
+    print("{:<40} {:>10} {:>10} {:>10}".format(
+        "executable", "min", "median", "max"))
+    for executable in opts.executables:
+        times = measure(executable, opts.args.split(), opts.runs)
+        print("{:<40} {:>9.3f}s {:>9.3f}s {:>9.3f}s".format(
+            executable, min(times), statistics.median(times), max(times)))
+
+
+if __name__ == "__main__":
+    main()
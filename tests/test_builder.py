@@ -12,8 +12,10 @@ from munch import Munch
 
 import koris.cloud.openstack
 
-from koris.cloud.openstack import OSClusterInfo, OSSubnet
-from koris.cloud.builder import NodeBuilder, ControlPlaneBuilder
+from koris.cloud.openstack import OSClusterInfo, OSSubnet, list_cluster_servers
+from koris.cloud.state import ClusterState
+from koris.cloud.builder import (NodeBuilder, ControlPlaneBuilder, ClusterBuilder,
+                                 PKIBuilder)
 from koris.ssl import (create_certs, CertBundle, create_key, create_ca)
 
 from .testdata import CONFIG
@@ -74,6 +76,7 @@ class DummyServer:  # pylint: disable=too-few-public-methods
     """
     def __init__(self, name, ip_address, flavor):
 
+        self.id = name
         self.name = name
         self.ip_address = ip_address
         self.flavor = Flavor(flavor)
@@ -186,6 +189,13 @@ def dummy_ext_network(*args, **kwargs):
     yield out
 
 
+@pytest.fixture(autouse=True)
+def nova_tags_client(monkeypatch):
+    """the mocked nova client also serves the server tag calls"""
+    monkeypatch.setattr(koris.cloud.openstack, "nova_tags_client",
+                        lambda nova: nova)
+
+
 @pytest.fixture
 def dummy_server():  # pylint: disable=redefined-outer-name
     """ dummy server"""
@@ -313,3 +323,117 @@ def test_instance_naming_creation(os_info):
     instance_names = os_info.nodes_names
     for i in range(len(instance_names)):
         assert instance_names[i] == 'test-node-{}'.format(i + 1)
+
+
+def test_cluster_info_snapshot(os_info):
+    """instances are resolved from one list call in snapshot mode"""
+    servers = []
+    for role, num in (("master", CONFIG['n-masters']), ("node", CONFIG['n-nodes'])):
+        for i in range(1, num + 1):
+            server = DummyServer("test-%s-%d" % (role, i), None, 'ECS.C1.4-8')
+            server.addresses = {"test-net": [
+                {"addr": "10.0.0.%d" % i, "OS-EXT-IPS:type": "floating"},
+                {"addr": "192.168.0.%d" % i, "OS-EXT-IPS:type": "fixed"}]}
+            servers.append(server)
+    servers.append(DummyServer("test-other-node-1", None, 'ECS.C1.4-8'))
+
+    NOVA.servers.list = mock.MagicMock(side_effect=[servers[:-1], servers])
+    NOVA.servers.find = mock.MagicMock(side_effect=AssertionError)
+    os_info.snapshot = True
+
+    nodes = list(os_info.get_instances("node"))
+    masters = list(os_info.get_instances("master"))
+
+    assert NOVA.servers.list.call_args_list[0] == mock.call(
+        detailed=True, limit=-1, search_opts={'tags': 'koris-cluster=test'})
+    NOVA.servers.add_tag.assert_not_called()
+    assert sorted(n.name for n in nodes) == sorted(os_info.nodes_names)
+    assert sorted(m.name for m in masters) == sorted(os_info.management_names)
+    assert os_info._get("test-node-1", None, "node").ip_address == "192.168.0.1"
+    assert all(n.exists for n in nodes + masters)
+    assert "test-other-node-1" not in os_info.servers
+
+
+def test_cluster_info_state_keyed_by_name(tmp_path):
+    """a network renamed in the config isn't fetched by its cached ID"""
+    config = copy.deepcopy(CONFIG)
+    config['private_net'] = {'name': "test-net"}
+    state = ClusterState("test", path=str(tmp_path / "state.json"))
+    conn = MagicMock()
+    conn.get_network.side_effect = lambda name: Munch(id=name + "-id", name=name)
+    conn.network.networks = dummy_ext_network
+
+    OSClusterInfo(NOVA, NEUTRON, CINDER, config, conn, state=state)
+    assert state.get("network:test-net") == "test-net-id"
+
+    OSClusterInfo(NOVA, NEUTRON, CINDER, config, conn, state=state)
+    conn.network.get_network.assert_called_once_with("test-net-id")
+
+    config['private_net']['name'] = "other-net"
+    OSClusterInfo(NOVA, NEUTRON, CINDER, config, conn, state=state)
+    conn.network.get_network.assert_called_once()
+    conn.get_network.assert_called_with("other-net")
+
+
+def test_list_untagged_cluster_servers():
+    """untagged servers of older clusters are found by their names and tagged"""
+    servers = [DummyServer(name, None, 'ECS.C1.4-8') for name in
+               ("test-master-1", "test-node-1", "test-node-2",
+                "test-other-node-1")]
+    nova, tags_client = mock.MagicMock(), mock.MagicMock()
+    # test-node-2 was added by a koris version which tags servers
+    tags_client.servers.list.return_value = [servers[2]]
+    nova.servers.list.return_value = servers
+
+    with mock.patch.object(koris.cloud.openstack, "nova_tags_client",
+                           lambda nova: tags_client):
+        found = list_cluster_servers(nova, "test")
+
+    assert [srv.name for srv in found] == ["test-node-2", "test-master-1",
+                                           "test-node-1"]
+    nova.servers.list.assert_called_once_with(
+        detailed=True, limit=-1,
+        search_opts={'name': r"^test-(master|node)-[0-9]+$"})
+    tags_client.servers.add_tag.assert_has_calls(
+        [mock.call(srv, "koris-cluster=test") for srv in servers[:2]])
+    assert tags_client.servers.add_tag.call_count == 2
+
+
+def test_cluster_build_graph():
+    """the LoadBalancer is configured while the instances boot"""
+    builder = ClusterBuilder(CONFIG, MagicMock(), None, None, None, MagicMock())
+    builder.masters_builder.instances = [Munch(ip_address="10.0.0.1"),
+                                         Munch(ip_address="10.0.0.2")]
+    builder.nodes_builder.instances = [Munch(ip_address="10.0.0.3")]
+    builder.deploy_dex = True
+    builder.dex_conf = {'ports': {'listener': 32000, 'service': 32000},
+                        'client': {'ports': {'listener': 5556,
+                                             'service': 32555}}}
+
+    graph = builder.build_graph(CONFIG, MagicMock(), [], [], "kubeconfig")
+    requires = {name: req for name, (_, req) in graph._tasks.items()}
+
+    assert requires['lb_api'] == ()
+    assert requires['ingress_listeners'] == ('lb_api',)
+    assert 'nodes' not in requires['dex'] + requires['oauth2']
+    assert requires['api_ready'] == ('lb_api', 'masters')
+    assert requires['nodes_ready'] == ('api_ready', 'masters', 'nodes')
+    assert set(requires['ingress_members']) == {
+        'addons', 'masters', 'nodes', 'ingress_listeners'}
+    graph._check()
+
+
+def test_pki_builder(tmpdir):
+    pki = PKIBuilder(str(tmpdir), dex=True)
+    pki.start()
+    pki.create(issuer="10.0.0.1")
+
+    ca_subject = pki.ca_bundle.cert.subject
+    assert pki.client_bundle.cert.issuer == ca_subject
+    assert pki.dex_ssl.client_bundle.cert.issuer == \
+        pki.dex_ssl.ca_bundle.cert.subject
+    numbers = {key.private_numbers().d for key in
+               (pki.ca_bundle.key, pki.client_bundle.key, pki.ssh_key,
+                pki.dex_ssl.ca_bundle.key, pki.dex_ssl.client_bundle.key)}
+    assert len(numbers) == 5
+    assert tmpdir.join("dex-ca.pem").check()
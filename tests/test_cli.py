@@ -1,9 +1,16 @@
 import os
 import subprocess
+import sys
+import time
+
+from unittest.mock import MagicMock
 
 import pytest
 
+from munch import Munch
+
 from .testdata import CONFIG
+from koris import cli
 from koris.koris import delete_node
 
 
@@ -55,3 +62,67 @@ def test_delete_node():
     for name in invalid_names:
         with pytest.raises(ValueError):
             delete_node(CONFIG, name)
+
+
+# modules which must not be loaded before a command needs them
+HEAVY_MODULES = ("novaclient", "cinderclient", "neutronclient", "octaviaclient",
+                 "openstack", "kubernetes", "cryptography", "yaml")
+
+# the cumulative import time of koris.koris in microseconds
+IMPORT_BUDGET = 500000
+
+
+def _import_times(module):
+    """import module in a fresh interpreter and parse -X importtime"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import %s" % module],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True,
+        universal_newlines=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_cli_import_time():
+    times = _import_times("koris.koris")
+    loaded = [name for name in times if name.split(".")[0] in HEAVY_MODULES]
+    assert loaded == []
+    assert times["koris.koris"] < IMPORT_BUDGET
+
+
+def test_destroy_imports_only_openstack():
+    times = _import_times("koris.cli")
+    loaded = {name.split(".")[0] for name in times}
+    assert not loaded.intersection({"kubernetes", "cryptography", "octaviaclient"})
+
+
+def test_remove_cluster_deletes_loadbalancer_first(monkeypatch):
+    """the security group is still in use until the LoadBalancer is gone"""
+    calls = []
+
+    class Inventory:  # pylint: disable=too-few-public-methods
+        def __init__(self, conn, cluster_name):
+            self.servers, self.ports, self.volumes = [], [], []
+
+        async def refresh(self):
+            return self
+
+    def delete_lb():
+        time.sleep(0.1)
+        calls.append("loadbalancer")
+
+    monkeypatch.setattr(cli, "ClusterInventory", Inventory)
+    monkeypatch.setattr(cli, "LoadBalancer",
+                        lambda config, conn: Munch(delete=delete_lb))
+    monkeypatch.setattr(cli, "ClusterState", MagicMock())
+    conn = MagicMock()
+    conn.network.security_groups.return_value = []
+    conn.delete_security_group.side_effect = lambda name: calls.append(name)
+
+    cli.remove_cluster(CONFIG, MagicMock(), MagicMock(), conn)
+
+    assert calls == ["loadbalancer", "%s-sec-group" % CONFIG['cluster-name']]
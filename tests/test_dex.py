@@ -364,3 +364,28 @@ def test_dex_conf_remove_optional(default_dex_ssl, default_conf):
     dex_conf = create_dex_conf(config, dex_ssl)
     assert dex_conf["username_claim"] == "email"
     assert dex_conf["groups_claim"] == "groups"
+
+
+def test_create_dex_single_apply():
+    lb = mock.MagicMock()
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(create_dex(lb, members=VALID_MEMBERS))
+
+    lb.apply.assert_called_once()
+    spec, = lb.apply.call_args[0][0]
+    assert spec.name == "dex-listener"
+    assert spec.protocol_port == 32000
+    assert [m.address for m in spec.pool.members] == VALID_MEMBERS
+    lb.add_member.assert_not_called()
+
+
+def test_add_members_bulk(default_pool):
+    lb = mock.MagicMock()
+    lb.bulk_update_members.return_value = True
+    default_pool.id = "pool"
+    default_pool.add_members(lb)
+
+    members, pool_id = lb.bulk_update_members.call_args[0]
+    assert pool_id == "pool"
+    assert [m['address'] for m in members] == VALID_MEMBERS
+    lb.add_member.assert_not_called()
@@ -0,0 +1,50 @@
+import asyncio
+
+from unittest.mock import MagicMock
+
+from munch import Munch
+
+from koris.cloud.inventory import ClusterInventory
+
+
+def test_inventory_refresh():
+    conn = MagicMock()
+    servers = [Munch(id="1", name="test-master-1"), Munch(id="2", name="test-node-12")]
+    conn.compute.servers.side_effect = [iter(servers), iter(servers)]
+    conn.network.ports.return_value = iter([
+        Munch(id="p1", device_id="1"), Munch(id="p2", device_id="2")])
+    conn.block_storage.volumes.return_value = iter([Munch(id="v1")])
+
+    loop = asyncio.new_event_loop()
+    inventory = loop.run_until_complete(ClusterInventory(conn, "test").refresh())
+    loop.close()
+
+    assert [srv.name for srv in inventory.servers] == ["test-master-1", "test-node-12"]
+    conn.compute.servers.assert_any_call(details=True, tags="koris-cluster=test")
+    conn.network.ports.assert_called_once_with(tags="koris-cluster=test")
+    conn.block_storage.volumes.assert_called_once_with(
+        details=True, properties="{'koris-cluster': 'test'}")
+
+    assert inventory.server("test-other-node-1") is None
+    server = inventory.server("test-node-12")
+    assert [port.id for port in inventory.server_ports(server)] == ["p2"]
+
+
+def test_inventory_untagged_servers():
+    """servers of older clusters are found by their names, even if the
+    servers added later are tagged"""
+    conn = MagicMock()
+    conn.compute.servers.side_effect = [iter([Munch(id="2", name="test-node-12")]), iter([
+        Munch(id="1", name="test-master-1"), Munch(id="2", name="test-node-12"),
+        Munch(id="3", name="test-other-node-1"), Munch(id="4", name="test-node-1-old")])]
+    conn.network.ports.return_value = iter([])
+    conn.block_storage.volumes.return_value = iter([])
+
+    loop = asyncio.new_event_loop()
+    inventory = loop.run_until_complete(ClusterInventory(conn, "test").refresh())
+    loop.close()
+
+    assert sorted(srv.name for srv in inventory.servers) == [
+        "test-master-1", "test-node-12"]
+    conn.compute.servers.assert_called_with(
+        details=True, name='^test-(master|node)-[0-9]+$')
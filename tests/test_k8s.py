@@ -1,8 +1,13 @@
+import time
+from unittest.mock import MagicMock
+
 import pytest
+from kubernetes.client.rest import ApiException
 
 from .testdata import ETCD_RESPONSE
 
-from koris.deploy.k8s import parse_etcd_response
+from koris.deploy import k8s as k8s_module
+from koris.deploy.k8s import parse_etcd_response, K8SConfigurator
 
 ETCD_PARSED_EXPECTED = {
     'master-1-ajk-test': {
@@ -33,6 +38,55 @@ def test_parse_etcd_response():
     assert parse_etcd_response(ETCD_RESPONSE) == ETCD_PARSED_EXPECTED
 
 
+def _node(addr, ready=True, version="1"):
+    node = MagicMock()
+    node.status.addresses = [MagicMock(type="InternalIP", address=addr)]
+    node.status.conditions = [MagicMock(type="Ready",
+                                        status=str(ready))]
+    node.metadata.resource_version = version
+    return node
+
+
+def test_watch_nodes_relists_expired_version(monkeypatch):
+    configurator = K8SConfigurator()
+    configurator.api = MagicMock()
+    first, second = MagicMock(items=[_node("10.0.0.1")]), MagicMock(items=[])
+    first.metadata.resource_version = "1"
+    second.metadata.resource_version = "5"
+    configurator.api.list_node.side_effect = [first, second]
+
+    # kubernetes reports an expired resource version as an ERROR event
+    # with a Status object, which has no resource version
+    expired = MagicMock(metadata=None)
+    watchers = [MagicMock(), MagicMock()]
+    watchers[0].stream.return_value = iter([
+        {'type': 'ERROR', 'object': expired,
+         'raw_object': {'kind': 'Status', 'code': 410, 'message': 'too old'}}])
+    watchers[1].stream.return_value = iter([
+        {'type': 'ADDED', 'object': _node("10.0.0.2", version="6")}])
+    monkeypatch.setattr(k8s_module.watch, "Watch", lambda: watchers.pop(0))
+
+    events = configurator._watch_nodes(time.monotonic() + 60)
+    assert [next(events)[0] for _ in range(2)] == ['ADDED', 'ADDED']
+    assert configurator.api.list_node.call_count == 2
+    events.close()
+
+
+def test_watch_nodes_error_event(monkeypatch):
+    configurator = K8SConfigurator()
+    configurator.api = MagicMock()
+    configurator.api.list_node.return_value = MagicMock(items=[])
+    watcher = MagicMock()
+    watcher.stream.return_value = iter([
+        {'type': 'ERROR', 'object': MagicMock(metadata=None),
+         'raw_object': {'kind': 'Status', 'code': 500, 'message': 'boom'}}])
+    monkeypatch.setattr(k8s_module.watch, "Watch", lambda: watcher)
+
+    with pytest.raises(ApiException):
+        list(configurator._watch_nodes(time.monotonic() + 60))
+    watcher.stop.assert_called_once()
+
+
 # (aknipping) If someone figures out how to mock this bloody
 # kubernetes python client PLEASE let me know.
 # def test_etcd_members_ips():
@@ -46,3 +100,109 @@ def test_parse_etcd_response():
 #     for ip in INVALID_IPV4:
 #         with pytest.raises(RuntimeError):
 #             k8s.etcd_members("test", ip)
+
+
+def test_credentials_computed_once(monkeypatch):
+    read_cert = MagicMock()
+    discovery_hash = MagicMock(return_value="abc")
+    monkeypatch.setattr(k8s_module, "read_cert", read_cert)
+    monkeypatch.setattr(k8s_module, "ssl_discovery_hash", discovery_hash)
+
+    configurator = K8SConfigurator()
+    configurator.api = MagicMock()
+    configurator.get_bootstrap_token = MagicMock(return_value="abcdef.0123")
+
+    for _ in range(3):
+        assert configurator.ca_info == {"ca_cert": read_cert.return_value,
+                                        "discovery_hash": "abc"}
+        assert configurator.credentials.bootstrap_token == "abcdef.0123"
+    assert configurator.ca_cert is read_cert.return_value
+    assert configurator.discovery_hash == "abc"
+
+    read_cert.assert_called_once()
+    discovery_hash.assert_called_once()
+    configurator.get_bootstrap_token.assert_called_once()
+
+
+def test_wait_for_nodes(monkeypatch):
+    configurator = K8SConfigurator()
+    configurator.api = MagicMock()
+
+    def node(name, master=False, ready=True, version="1"):
+        out = _node("10.0.0.1", ready=ready, version=version)
+        out.metadata.name = name
+        out.metadata.labels = {k8s_module.MASTER_ROLE_LABEL: ""} if master else {}
+        return out
+
+    nodes = MagicMock(items=[node("master-1", master=True),
+                             node("node-1", ready=False)])
+    nodes.metadata.resource_version = "1"
+    configurator.api.list_node.return_value = nodes
+    events = [{'type': 'MODIFIED', 'object': node("node-1", version="2")},
+              {'type': 'ADDED', 'object': node("master-2", master=True,
+                                               version="3")},
+              {'type': 'ADDED', 'object': node("node-2", version="4")}]
+    watcher = MagicMock()
+    watcher.stream.return_value = iter(events)
+    monkeypatch.setattr(k8s_module.watch, "Watch", lambda: watcher)
+    info = MagicMock()
+    monkeypatch.setattr(k8s_module.LOGGER, "info", info)
+
+    configurator.wait_for_nodes(2, 1, time.monotonic() + 60)
+
+    assert [c[0][1:] for c in info.call_args_list] == [
+        (1, 2, 0, 1), (1, 2, 1, 1), (2, 2, 1, 1)]
+    watcher.stop.assert_called_once()
+
+
+def test_wait_for_nodes_expired_version(monkeypatch):
+    """nodes which became Ready while the watch expired are counted"""
+    configurator = K8SConfigurator()
+    configurator.api = MagicMock()
+
+    def node(name, master=False):
+        out = _node("10.0.0.1")
+        out.metadata.name = name
+        out.metadata.labels = {k8s_module.MASTER_ROLE_LABEL: ""} if master else {}
+        return out
+
+    first = MagicMock(items=[node("master-1", master=True)])
+    second = MagicMock(items=[node("master-1", master=True), node("node-1")])
+    configurator.api.list_node.side_effect = [first, second]
+    watcher = MagicMock()
+    watcher.stream.return_value = iter([
+        {'type': 'ERROR', 'object': MagicMock(metadata=None),
+         'raw_object': {'kind': 'Status', 'code': 410, 'message': 'too old'}}])
+    monkeypatch.setattr(k8s_module.watch, "Watch", lambda: watcher)
+
+    configurator.wait_for_nodes(1, 1, time.monotonic() + 60)
+
+    assert configurator.api.list_node.call_count == 2
+
+
+def test_api_ready_falls_back_to_healthz():
+    configurator = K8SConfigurator()
+    configurator.api = MagicMock()
+    call_api = configurator.api.api_client.call_api
+    call_api.side_effect = [ApiException(status=404), None, None]
+
+    assert configurator._api_ready()
+    assert configurator._api_ready()
+    assert [c[0][0] for c in call_api.call_args_list] == [
+        "/readyz", "/healthz", "/healthz"]
+    assert all(c[1]['auth_settings'] == ['BearerToken']
+               for c in call_api.call_args_list)
+
+
+def test_api_ready_rejected_credentials():
+    """an API server which answers 401 or 403 is up, the probe stops"""
+    configurator = K8SConfigurator()
+    configurator.api = MagicMock()
+    configurator.api.api_client.configuration.host = "https://10.0.0.1:6443"
+    call_api = configurator.api.api_client.call_api
+
+    for status in (401, 403):
+        call_api.side_effect = ApiException(status=status)
+        assert configurator._api_ready()
+    call_api.side_effect = ApiException(status=500)
+    assert not configurator._api_ready()
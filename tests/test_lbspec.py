@@ -0,0 +1,113 @@
+from unittest.mock import MagicMock
+
+from munch import Munch
+
+from koris.cloud.lbspec import (LoadBalancerPlanner, api_server_listener,
+                                ingress_listeners)
+from koris.cloud.openstack import LoadBalancer
+
+from .testdata import CONFIG, default_data
+
+
+def get_lb():
+    conn = MagicMock()
+    lb = LoadBalancer(CONFIG, conn)
+    lb._data = default_data()
+    lb._id = lb._data.id
+    lb._subnet_id = "subnet"
+    conn.load_balancer.get_load_balancer.return_value.provisioning_status = 'ACTIVE'
+    conn.load_balancer.post.return_value.status_code = 201
+    return conn, lb
+
+
+def test_create_listener_graph():
+    """a missing listener is created with its pool and members at once"""
+    conn, lb = get_lb()
+    conn.load_balancer.listeners.return_value = iter([])
+
+    steps = lb.apply([api_server_listener("test", ["10.0.0.1", "10.0.0.2"])])
+
+    assert [s.action for s in steps] == ["create_listener"]
+    conn.load_balancer.post.assert_called_once()
+    url, = conn.load_balancer.post.call_args[0]
+    body = conn.load_balancer.post.call_args[1]['json']['listener']
+    assert url == '/lbaas/listeners'
+    assert body['loadbalancer_id'] == lb.id
+    assert body['protocol_port'] == 6443
+    pool = body['default_pool']
+    assert [m['address'] for m in pool['members']] == ["10.0.0.1", "10.0.0.2"]
+    assert all(m['subnet_id'] == "subnet" for m in pool['members'])
+    assert pool['healthmonitor']['type'] == 'TCP'
+    conn.network.create_pool_member.assert_not_called()
+
+
+def test_update_members_in_one_request():
+    conn, lb = get_lb()
+    spec = api_server_listener("test", ["10.0.0.1", "10.0.0.2"])
+    conn.load_balancer.listeners.return_value = iter([
+        Munch(name=spec.name, id="l1", protocol="HTTPS", protocol_port=6443,
+              default_pool_id="p1")])
+    conn.load_balancer.get_pool.return_value = Munch(id="p1",
+                                                     health_monitor_id="h1")
+    conn.load_balancer.members.return_value = iter([
+        Munch(id="m1", address="10.0.0.1", protocol_port=6443)])
+    lb.bulk_update_members = MagicMock(return_value=True)
+
+    steps = lb.apply([spec])
+
+    assert [s.action for s in steps] == ["update_members"]
+    members, pool_id = lb.bulk_update_members.call_args[0]
+    assert pool_id == "p1"
+    assert [m['address'] for m in members] == ["10.0.0.1", "10.0.0.2"]
+    conn.load_balancer.post.assert_not_called()
+
+
+def test_nothing_to_do():
+    conn, lb = get_lb()
+    spec = api_server_listener("test", ["10.0.0.1"])
+    conn.load_balancer.listeners.return_value = iter([
+        Munch(name=spec.name, id="l1", protocol="HTTPS", protocol_port=6443,
+              default_pool_id="p1")])
+    conn.load_balancer.get_pool.return_value = Munch(id="p1",
+                                                     health_monitor_id="h1")
+    conn.load_balancer.members.return_value = iter([
+        Munch(id="m1", address="10.0.0.1", protocol_port=6443)])
+
+    assert LoadBalancerPlanner(lb, [spec]).plan() == []
+
+
+def test_replace_listener_on_port_change():
+    """a listener on another port is deleted with its pool and created again"""
+    conn, lb = get_lb()
+    spec = api_server_listener("test", ["10.0.0.1"], port=8443)
+    conn.load_balancer.listeners.return_value = iter([
+        Munch(name=spec.name, id="l1", protocol="HTTPS", protocol_port=6443,
+              default_pool_id="p1")])
+
+    steps = lb.apply([spec])
+
+    assert [s.action for s in steps] == ["replace_listener"]
+    conn.load_balancer.delete_pool.assert_called_once_with("p1")
+    conn.load_balancer.delete_listener.assert_called_once_with("l1")
+    body = conn.load_balancer.post.call_args[1]['json']['listener']
+    assert body['protocol_port'] == 8443
+    assert body['default_pool']['members'][0]['protocol_port'] == 8443
+
+
+def test_create_loadbalancer_graph():
+    """a missing LoadBalancer is created with all its listeners"""
+    conn = MagicMock()
+    lb = LoadBalancer(CONFIG, conn)
+    conn.load_balancer.find_load_balancer.return_value = None
+    ports = {'HTTP': Munch(node_port=30080), 'HTTPS': Munch(node_port=30443)}
+    spec = ingress_listeners("test", ports, [{'name': 'node-1',
+                                              'address': '10.0.0.3'}])
+
+    steps = lb.apply(spec)
+
+    assert [s.action for s in steps] == ["create_loadbalancer"]
+    listeners = conn.load_balancer.create_load_balancer.call_args[1]['listeners']
+    assert [li['protocol_port'] for li in listeners] == [80, 443]
+    assert listeners[0]['default_pool']['members'][0]['protocol_port'] == 30080
+    assert 'healthmonitor' not in listeners[0]['default_pool']
+    conn.load_balancer.post.assert_not_called()
@@ -1,12 +1,27 @@
+import asyncio
 import copy
+import os
+import threading
+import time
 
 from unittest.mock import MagicMock, patch
 
 import pytest
 
+import koris.cloud.openstack
+
 from koris.cloud.openstack import (OSNetwork, get_connection, LoadBalancer,
-                                   distribute_host_zones, get_clients)
+                                   distribute_host_zones, get_clients,
+                                   get_session, get_cloud_region,
+                                   _save_auth_state,
+                                   _load_auth_state,
+                                   ProvisioningEngine, get_engine,
+                                   StatusPoller, BuilderError)
+from koris.util.util import WaitTimeout
 from koris.cloud import OpenStackAPI
+from openstack.exceptions import ResourceNotFound as OSNotFound
+from munch import Munch
+
 from .testdata import (CONFIG, default_data, mock_listener,
                        mock_pool, mock_member, mock_pool_info)
 from koris import MASTER_LISTENER_NAME, MASTER_POOL_NAME
@@ -79,30 +94,65 @@ def test_get_connection():
     get_clients()
     conn = get_connection()
     assert conn
+    # the clients and the connection share one session
+    assert conn.session is get_session()
+    assert get_clients()[0].client.session is get_session()
 
     # RC file not sourced
-    with patch.object(OpenStackAPI,
-                      'connect',
+    with patch.object(OpenStackAPI.connection,
+                      'Connection',
                       side_effect=OpenStackAPI.exceptions.ConfigException):
 
         with pytest.raises(SystemExit):
             conn = get_connection()
 
     # Other error
-    with patch.object(OpenStackAPI,
-                      'connect',
+    with patch.object(OpenStackAPI.connection,
+                      'Connection',
                       return_value=None):
 
         with pytest.raises(SystemExit):
             conn = get_connection()
 
 
+def test_get_cloud_region_from_clouds_yaml(tmp_path, monkeypatch):
+    clouds = tmp_path / "clouds.yaml"
+    clouds.write_text("""
+clouds:
+  koris:
+    region_name: de-nbg-6
+    auth:
+      auth_url: https://de-nbg6-1.noris.cloud:5000/v3
+      username: cloudsuser
+      password: cloudspassword
+      project_name: PI
+      user_domain_name: noris.de
+""")
+    monkeypatch.setenv("OS_CLIENT_CONFIG_FILE", str(clouds))
+    monkeypatch.setenv("OS_CLOUD", "koris")
+    monkeypatch.setattr(koris.cloud.openstack, "CLOUD", None)
+    monkeypatch.setattr(koris.cloud.openstack, "SESSION", None)
+
+    assert get_cloud_region().get_auth_args()['username'] == "cloudsuser"
+    assert get_session().auth is get_cloud_region().get_auth()
+    assert get_connection().session is get_session()
+
+
+def test_get_cloud_region_unknown_cloud(monkeypatch):
+    monkeypatch.setenv("OS_CLOUD", "no-such-cloud")
+    monkeypatch.setattr(koris.cloud.openstack, "CLOUD", None)
+
+    with pytest.raises(SystemExit):
+        get_cloud_region()
+
+
 @pytest.fixture
 def get_os(scope="function"):
     conn = MagicMock()
     lb = LoadBalancer(CONFIG, conn)
     lb._data = default_data()
     lb._id = lb._data.id
+    conn.load_balancer.get_load_balancer.return_value.provisioning_status = 'ACTIVE'
     return conn, lb
 
 
@@ -138,40 +188,7 @@ def test_get_master_listener_lb_not_found(get_os):
 
     conn, lb = get_os
 
-    conn.load_balancer.find_load_balancer.return_value = None
-    assert lb._get_master_listener() is None
-
-
-def test_get_master_listener_no_listener_ids(get_os):
-    """If a returned LB has no listeners, return None"""
-
-    conn, lb = get_os
-
-    mock_lb = default_data()
-    mock_lb.listeners = []
-    conn.load_balancer.find_load_balancer.return_value = mock_lb
-    assert lb._get_master_listener() is None
-
-    mock_lb.listeners = None
-    assert lb._get_master_listener() is None
-
-
-def test_get_master_listener_invalid_listeners(get_os):
-    """If the structure of the lb.listeners dict changes, return None"""
-
-    conn, lb = get_os
-    mock_lb = default_data()
-    mock_lb.listeners = ["a", "b", "c"]
-    conn.load_balancer.find_load_balancer.return_value = mock_lb
-    assert lb._get_master_listener() is None
-
-    mock_lb.listeners = "test"
-    assert lb._get_master_listener() is None
-
-    mock_lb.listeners = {}
-    assert lb._get_master_listener() is None
-
-    mock_lb.listeners = None
+    conn.load_balancer.listeners.side_effect = OSNotFound
     assert lb._get_master_listener() is None
 
 
@@ -179,8 +196,7 @@ def test_get_master_listener_no_master_listener(get_os):
     """If there are no Listeners with name master-listener, return None"""
 
     conn, lb = get_os
-    conn.load_balancer.find_load_balancer.return_value = default_data()
-    conn.load_balancer.find_listener.return_value = None
+    conn.load_balancer.listeners.return_value = iter([])
     assert lb._get_master_listener() is None
 
 
@@ -191,27 +207,22 @@ def test_get_master_listener_multiple_master_listeners(get_os):
     """
 
     conn, lb = get_os
-    conn.load_balancer.find_load_balancer.return_value = default_data()
-    conn.load_balancer.find_listener.side_effect = [mock_listener(),
-                                                    mock_listener(),
-                                                    mock_listener()]
+    conn.load_balancer.listeners.return_value = iter([mock_listener(),
+                                                      mock_listener()])
     assert lb._get_master_listener() is None
 
 
 def test_get_master_listener_found_master_listener(get_os):
-    """The correct case is returned"""
+    """The correct case is returned with a single request"""
 
     conn, lb = get_os
 
-    l1, l2, l3 = mock_listener(), mock_listener(), mock_listener()
-    l2.name, l3.name = "dex-listener", "oauth-listener"
-
-    conn.load_balancer.find_load_balancer.return_value = default_data()
-    conn.load_balancer.find_listener.side_effect = [l1, l2, l3]
-    assert lb._get_master_listener() is not None
-    assert l1.default_pool_id is not None
-    assert l2.default_pool_id is not None
-    assert l3.default_pool_id is not None
+    listener = mock_listener()
+    conn.load_balancer.listeners.return_value = iter([listener])
+    assert lb._get_master_listener() is listener
+    conn.load_balancer.listeners.assert_called_once_with(
+        load_balancer_id=lb._id, name=MASTER_LISTENER_NAME + '-' + 'test')
+    conn.load_balancer.find_listener.assert_not_called()
 
 
 def test_pool_info_no_pool(get_os):
@@ -223,13 +234,13 @@ def test_pool_info_no_pool(get_os):
 
 
 def test_pool_info_no_member(get_os):
-    """A Pool has members assigned but they can't be retrieved."""
+    """A Pool has no members."""
 
     conn, lb = get_os
     mp = mock_pool()
 
     conn.load_balancer.find_pool.return_value = mock_pool()
-    conn.load_balancer.find_member.side_effect = [None, None, None]
+    conn.load_balancer.members.return_value = iter([])
 
     pool = lb._pool_info(mp.id)
     assert pool['name'] == mp.name
@@ -245,7 +256,7 @@ def test_pool_info_pool_unhappy_names(get_os):
     conn.load_balancer.find_pool.return_value = mp
 
     for name in ['', None, '-1', 'False', 'True', 'ヽ༼ຈل͜ຈ༽ﾉ ヽ༼ຈل͜ຈ༽ﾉ', '🐵 🙈']:
-        conn.load_balancer.find_member.side_effect = [None, None, None]
+        conn.load_balancer.members.return_value = iter([])
         mp.name = name
         pool = lb._pool_info(mp.id)
         assert pool['name'] == mp.name
@@ -258,7 +269,7 @@ def test_pool_info_single_member(get_os):
     mp = mock_pool()
     mem = mock_member(1)
     conn.load_balancer.find_pool.return_value = mock_pool()
-    conn.load_balancer.find_member.side_effect = [mem, None, None]
+    conn.load_balancer.members.return_value = iter([mem])
 
     pool = lb._pool_info(mp.id)
     assert pool['name'] == mp.name
@@ -271,13 +282,13 @@ def test_pool_info_single_member(get_os):
 
 
 def test_pool_all_members(get_os):
-    """Default behaviour, all members are returned"""
+    """Default behaviour, all members are returned with one request"""
 
     conn, lb = get_os
     mp = mock_pool()
     mem = [mock_member(1), mock_member(2), mock_member(3)]
     conn.load_balancer.find_pool.return_value = mock_pool()
-    conn.load_balancer.find_member.side_effect = mem
+    conn.load_balancer.members.return_value = iter(mem)
 
     pool = lb._pool_info(mp.id)
     assert pool['name'] == mp.name
@@ -287,6 +298,8 @@ def test_pool_all_members(get_os):
         assert pool['members'][i]['id'] == mem[i].id
         assert pool['members'][i]['name'] == mem[i].name
         assert pool['members'][i]['address'] == mem[i].address
+    conn.load_balancer.members.assert_called_once()
+    conn.load_balancer.find_member.assert_not_called()
 
 
 def test_master_listener_no_listener(get_os):
@@ -356,6 +369,101 @@ def test_master_multiple_members(get_os):
             assert master_listener['pool']['members'][i]['id'] == mpi['members'][i]['id']
 
 
+def test_master_listener_cached(get_os):
+    """The master listener is cached until the members change"""
+    conn, lb = get_os
+    lb._get_master_listener = MagicMock(return_value=mock_listener())
+    lb._pool_info = MagicMock(return_value=mock_pool_info())
+
+    assert lb.master_listener is lb.master_listener
+    assert lb._get_master_listener.call_count == 1
+
+    lb.add_member(mock_pool_info()['id'], '192.168.0.106')
+    lb.master_listener
+    assert lb._get_master_listener.call_count == 2
+
+    lb._master_listener_at -= lb.TOPOLOGY_TTL
+    lb.master_listener
+    assert lb._get_master_listener.call_count == 3
+
+
+def test_wait_until_active(get_os, monkeypatch):
+    """Changes are sent as soon as the LB is ACTIVE again"""
+    conn, lb = get_os
+    monkeypatch.setattr(time, "sleep", lambda _: None)
+    states = [MagicMock(provisioning_status=status) for status in
+              ('PENDING_CREATE', 'PENDING_UPDATE', 'ACTIVE')]
+    conn.load_balancer.get_load_balancer.side_effect = states
+
+    lb.add_member('pool', '192.168.0.106')
+    assert conn.load_balancer.get_load_balancer.call_count == 3
+    conn.network.create_pool_member.assert_called_once()
+
+
+def test_wait_until_active_error(get_os, monkeypatch):
+    conn, lb = get_os
+    monkeypatch.setattr(time, "sleep", lambda _: None)
+    conn.load_balancer.get_load_balancer.return_value.provisioning_status = 'ERROR'
+
+    with pytest.raises(BuilderError):
+        lb.wait_until_active()
+
+    conn.load_balancer.get_load_balancer.return_value.provisioning_status = \
+        'PENDING_UPDATE'
+    with pytest.raises(BuilderError):
+        lb.wait_until_active(timeout=0.01)
+
+
+def test_lb_changes_are_serialized():
+    """threads changing one LB wait for ACTIVE and change it in turn"""
+    calls = []
+
+    def get_load_balancer(_):
+        calls.append("wait")
+        time.sleep(0.05)
+        return MagicMock(provisioning_status='ACTIVE')
+
+    def change(**_):
+        calls.append("change")
+
+    conn = MagicMock()
+    conn.load_balancer.get_load_balancer.side_effect = get_load_balancer
+    conn.network.create_pool_member.side_effect = change
+    conn.network.create_listener.side_effect = change
+    # e.g. the dex and master tasks each use their own instance
+    first, second = LoadBalancer(CONFIG, conn), LoadBalancer(CONFIG, conn)
+
+    threads = [threading.Thread(target=first.add_member,
+                                args=('pool', '192.168.0.106')),
+               threading.Thread(target=second.add_listener, args=("dex",))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["wait", "change", "wait", "change"]
+
+
+def test_bulk_update_members(get_os, monkeypatch):
+    """one PUT per pool, sent again while the LB is busy"""
+    conn, lb = get_os
+    monkeypatch.setattr(time, "sleep", lambda _: None)
+    conn.load_balancer.put.side_effect = [MagicMock(status_code=409),
+                                          MagicMock(status_code=202)]
+    members = [{"address": "10.0.0.1", "protocol_port": 6443}]
+
+    assert lb.bulk_update_members(members, "pool")
+    assert conn.load_balancer.put.call_count == 2
+    url, = conn.load_balancer.put.call_args[0]
+    assert url == '/lbaas/pools/pool/members'
+    assert conn.load_balancer.put.call_args[1]['json'] == {"members": members}
+
+    conn.load_balancer.put.side_effect = None
+    conn.load_balancer.put.return_value = MagicMock(status_code=400)
+    with pytest.raises(BuilderError):
+        lb.bulk_update_members(members, "pool")
+
+
 def test_distribute_host_zones():
 
     assert distribute_host_zones(['foo', 'bar'], ['a', 'b']) == [
@@ -404,3 +512,111 @@ def test_create_loadbalancer_with_floating():
     lb = LoadBalancer(config, MagicMock())
     assert lb
     assert lb.floatingip == fip
+
+
+def test_provisioning_engine_runs_calls_concurrently():
+    """blocking calls handed to the engine should not run one after another"""
+    engine = ProvisioningEngine(max_workers=4)
+
+    def blocking_call(value):
+        time.sleep(0.2)
+        return value
+
+    async def run_all():
+        return await asyncio.gather(*[engine.run(blocking_call, i)
+                                      for i in range(4)])
+
+    loop = asyncio.new_event_loop()
+    start = time.monotonic()
+    assert loop.run_until_complete(run_all()) == [0, 1, 2, 3]
+    assert time.monotonic() - start < 0.6
+    loop.close()
+    engine.shutdown()
+
+
+def test_get_engine_concurrency_limit():
+    engine = get_engine()
+    assert get_engine() is engine
+
+    engine = get_engine(max_workers=3)
+    assert engine.max_workers == 3
+    assert get_engine() is engine
+
+
+def test_status_poller_one_list_call_per_tick():
+    """all pending resources are refreshed with a single list call"""
+    calls = []
+
+    def list_servers():
+        calls.append(1)
+        status = 'BUILD' if len(calls) < 3 else 'ACTIVE'
+        return [Munch(id=str(i), status=status) for i in range(10)]
+
+    poller = StatusPoller(list_servers, "instance", delay=0.01, max_delay=0.01)
+
+    async def wait_all():
+        return await asyncio.gather(*[
+            poller.wait(str(i), lambda s: s.status == 'ACTIVE', timeout=5)
+            for i in range(10)])
+
+    loop = asyncio.new_event_loop()
+    servers = loop.run_until_complete(wait_all())
+    loop.close()
+
+    assert [s.id for s in servers] == [str(i) for i in range(10)]
+    assert len(calls) == 3
+
+
+def test_status_poller_error_and_timeout():
+    def list_volumes():
+        return [Munch(id="a", status="error"), Munch(id="b", status="creating")]
+
+    poller = StatusPoller(list_volumes, "volume", delay=0.01, max_delay=0.01)
+    loop = asyncio.new_event_loop()
+
+    with pytest.raises(BuilderError):
+        loop.run_until_complete(
+            poller.wait("a", lambda v: v.status == 'available', timeout=5))
+
+    with pytest.raises(WaitTimeout):
+        loop.run_until_complete(
+            poller.wait("b", lambda v: v.status == 'available', timeout=0.05))
+    loop.close()
+
+
+def test_status_poller_wait_after_last_waiter_left():
+    """a waiter which registers right after the last one left is served"""
+    statuses = {"a": "ACTIVE", "b": "BUILD"}
+
+    def list_servers():
+        return [Munch(id=key, status=val) for key, val in statuses.items()]
+
+    poller = StatusPoller(list_servers, "instance", delay=0.01, max_delay=0.01)
+
+    async def wait_both():
+        await poller.wait("a", lambda s: s.status == 'ACTIVE', timeout=5)
+        statuses["b"] = "ACTIVE"
+        return await poller.wait("b", lambda s: s.status == 'ACTIVE',
+                                 timeout=1)
+
+    loop = asyncio.new_event_loop()
+    assert loop.run_until_complete(wait_both()).id == "b"
+    loop.close()
+
+
+def test_token_cache(tmp_path):
+    path = str(tmp_path / "koris" / "token.json")
+    auth = MagicMock()
+    auth.get_auth_state.return_value = '{"auth_token": "secret"}'
+
+    _save_auth_state(auth, path, None)
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    restored = MagicMock()
+    _load_auth_state(restored, path)
+    restored.set_auth_state.assert_called_once_with('{"auth_token": "secret"}')
+
+    # an unchanged token is not written again
+    os.remove(path)
+    _save_auth_state(auth, path, '{"auth_token": "secret"}')
+    assert not os.path.exists(path)
@@ -0,0 +1,102 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+
+from koris.deploy import rotate
+from koris.deploy.rotate import CONTROL_PLANE_CERTS, CertRotation
+from koris.ssl import (CertBundle, create_ca, create_key, pem_cert, pem_key)
+
+
+def _pki():
+    files = {}
+    for ca_name in {ca_name for _, ca_name in CONTROL_PLANE_CERTS}:
+        key = create_key(algorithm="ECDSA")
+        ca_bundle = CertBundle(key, create_ca(key, key.public_key(), "DE",
+                                              "BY", "NUE", "Kubernetes",
+                                              "CDA-RT", ca_name))
+        files[ca_name + ".key"] = pem_key(ca_bundle.key)
+        files[ca_name + ".crt"] = pem_cert(ca_bundle.cert)
+        for cert, cert_ca in CONTROL_PLANE_CERTS:
+            if cert_ca == ca_name:
+                bundle = CertBundle.create_signed(
+                    ca_bundle, "DE", "BY", "NUE", "Kubernetes", "CDA-RT",
+                    cert, ["master-1"], ["10.0.0.1"])
+                files[cert + ".crt"] = pem_cert(bundle.cert)
+    return files
+
+
+def test_cert_rotation(monkeypatch):
+    pki = _pki()
+    calls = []
+
+    def run(channel, command, data=None, timeout=600):
+        calls.append((channel.host, command.split()[1]))
+        if command.startswith("sudo tar -c"):
+            return rotate._pack(pki)
+        if command.startswith("sudo cp"):
+            channel.pushed = rotate._unpack(data)
+            channel.push_command = command
+        return b""
+
+    monkeypatch.setattr(rotate.SSHChannel, "run", run)
+    monkeypatch.setattr(rotate.SSHChannel, "close", MagicMock())
+
+    rotation = CertRotation([("master-1", "10.0.0.1"),
+                             ("master-2", "10.0.0.2")],
+                            algorithm="ECDSA", grace=0)
+    rotation.run()
+
+    # the restarts come last and one master after the other
+    assert calls[-2:] == [("10.0.0.1", "sh"), ("10.0.0.2", "sh")]
+    for master, channel in rotation.channels.items():
+        old = x509.load_pem_x509_certificate(pki["apiserver.crt"],
+                                             default_backend())
+        new = x509.load_pem_x509_certificate(channel.pushed["apiserver.crt"],
+                                             default_backend())
+        assert new.subject == old.subject
+        assert new.serial_number != old.serial_number
+        assert new.extensions.get_extension_for_class(
+            x509.SubjectAlternativeName) == \
+            old.extensions.get_extension_for_class(x509.SubjectAlternativeName)
+        # the backup is renamed only after the copy is complete
+        backup = rotation.backups[master]
+        assert channel.push_command.startswith(
+            "sudo cp -a /etc/kubernetes/pki %s.tmp && sudo mv %s.tmp %s && " % (
+                backup, backup, backup))
+        assert set(channel.pushed) == {
+            name + ext for name, _ in CONTROL_PLANE_CERTS
+            for ext in (".crt", ".key")}
+    assert all(set(t) == {"fetch", "issue", "push", "restart"}
+               for t in rotation.timings.values())
+
+
+def test_cert_rotation_rollback(monkeypatch):
+    """a failed push restores the backups, nothing is restarted"""
+    pki = _pki()
+    calls = []
+    restored = []
+
+    def run(channel, command, data=None, timeout=600):
+        calls.append((channel.host, command.split()[1]))
+        if command.startswith("sudo tar -c"):
+            return rotate._pack(pki)
+        if command.startswith("if sudo test -d /etc/kubernetes/pki.bak-"):
+            restored.append(channel.host)
+        if command.startswith("sudo cp") and channel.host == "10.0.0.2":
+            raise RuntimeError("disk full")
+        return b""
+
+    monkeypatch.setattr(rotate.SSHChannel, "run", run)
+    monkeypatch.setattr(rotate.SSHChannel, "close", MagicMock())
+
+    rotation = CertRotation([("master-1", "10.0.0.1"),
+                             ("master-2", "10.0.0.2")],
+                            algorithm="ECDSA", grace=0)
+    with pytest.raises(RuntimeError, match="disk full"):
+        rotation.run()
+
+    assert sorted(restored) == ["10.0.0.1", "10.0.0.2"]
+    assert not [host for host, cmd in calls if cmd == "sh"]
@@ -1,9 +1,15 @@
 """Tests for the koris.ssl class functionality"""
 
 from shutil import rmtree
+
+import pytest
 from cryptography.x509.oid import ExtensionOID
-from cryptography.x509 import DNSName, IPAddress
-from koris.ssl import create_certs, read_cert
+from cryptography.x509 import (DNSName, IPAddress, KeyUsage,
+                               SubjectAlternativeName)
+from koris.ssl import (create_certs, read_cert, create_key, create_ca,
+                       CertBundle, b64_key, discovery_hash, key_algorithm,
+                       load_key, serialized_key, KeyPool, reissue, pem_cert,
+                       pem_key)
 
 
 def test_sslcertcreation():
@@ -56,3 +62,76 @@ def test_sslcertcreation():
     ##########################################################
     assert set(san_names).issuperset(set(cluster_host_names))
     assert set(san_ips).issuperset(set(ips))
+
+
+@pytest.mark.parametrize("algorithm", ["RSA", "ECDSA", "ED25519"])
+def test_key_algorithms(algorithm):
+    ca_key = create_key(algorithm=algorithm)
+    ca_cert = create_ca(ca_key, ca_key.public_key(), "DE", "BY", "NUE",
+                        "Kubernetes", "CDA-RT", "kubernetes-ca")
+    ca_bundle = CertBundle(ca_key, ca_cert)
+    bundle = CertBundle.create_signed(ca_bundle, "DE", "BY", "NUE",
+                                      "system:masters", "system:masters",
+                                      "kubernetes-admin", "", "")
+
+    assert key_algorithm(bundle.key) == algorithm
+    assert bundle.cert.issuer == ca_cert.subject
+    assert len(discovery_hash(ca_cert)) == 64
+    assert b64_key(bundle.key)
+    assert key_algorithm(load_key(serialized_key(algorithm=algorithm))) == \
+        algorithm
+
+
+def test_unknown_key_algorithm():
+    with pytest.raises(ValueError):
+        create_key(algorithm="DSA")
+
+
+def test_key_pool():
+    with KeyPool(capacity=2, algorithm="ECDSA") as pool:
+        keys = [pool.get() for _ in range(3)]
+        certs = create_certs({"cluster-name": "test"}, ["kubernetes"],
+                             ["10.32.0.1"], write=False, key_pool=pool)
+
+    assert pool.issued == 8
+    assert all(key_algorithm(key) == "ECDSA" for key in keys)
+    assert len({key.private_numbers().private_value for key in keys}) == 3
+    assert key_algorithm(certs['ca'].key) == "ECDSA"
+    assert certs['admin'].cert.issuer == certs['ca'].cert.subject
+
+
+def test_key_pool_algorithm_mismatch():
+    with KeyPool(capacity=1, algorithm="ECDSA") as pool:
+        with pytest.raises(ValueError):
+            create_certs({"key_algorithm": "RSA"}, ["kubernetes"],
+                         ["10.32.0.1"], write=False, key_pool=pool)
+
+        ca_key = create_key()
+        ca_bundle = CertBundle(ca_key, create_ca(
+            ca_key, ca_key.public_key(), "DE", "BY", "NUE", "Kubernetes",
+            "CDA-RT", "kubernetes-ca"))
+        with pytest.raises(ValueError):
+            create_certs({}, ["kubernetes"], ["10.32.0.1"], write=False,
+                         ca_bundle=ca_bundle, key_pool=pool)
+        assert pool.issued == 0
+
+
+def test_reissue():
+    ca_key = create_key(algorithm="ECDSA")
+    ca_bundle = CertBundle(ca_key, create_ca(ca_key, ca_key.public_key(),
+                                             "DE", "BY", "NUE", "Kubernetes",
+                                             "CDA-RT", "kubernetes-ca"))
+    old = CertBundle.create_signed(ca_bundle, "DE", "BY", "NUE", "Kubernetes",
+                                   "CDA-RT", "kube-apiserver", ["kubernetes"],
+                                   ["10.96.0.1"])
+
+    new = reissue(old.cert, ca_bundle)
+
+    assert new.cert.subject == old.cert.subject
+    assert new.cert.issuer == ca_bundle.cert.subject
+    assert new.key.private_numbers() != old.key.private_numbers()
+    for ext in (SubjectAlternativeName, KeyUsage):
+        assert new.cert.extensions.get_extension_for_class(ext) == \
+            old.cert.extensions.get_extension_for_class(ext)
+    assert CertBundle.from_pem(pem_key(new.key), pem_cert(new.cert)).cert == \
+        new.cert
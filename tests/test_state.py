@@ -0,0 +1,54 @@
+from unittest.mock import MagicMock
+
+from munch import Munch
+
+from koris.cloud.state import ClusterState
+
+
+def test_state_resolve_uses_cached_id(tmp_path):
+    path = str(tmp_path / "state.json")
+    lookup = MagicMock(return_value=Munch(id="net-1", name="test"))
+    get_by_id = MagicMock(return_value=Munch(id="net-1", name="test"))
+
+    state = ClusterState("test", path=path)
+    assert state.resolve("network", get_by_id, lookup).id == "net-1"
+    lookup.assert_called_once()
+    get_by_id.assert_not_called()
+    state.save()
+
+    state = ClusterState("test", path=path)
+    assert state.resolve("network", get_by_id, lookup).id == "net-1"
+    get_by_id.assert_called_once_with("net-1")
+    assert lookup.call_count == 1
+
+
+def test_state_revalidates_expired_and_missing_ids(tmp_path):
+    path = str(tmp_path / "state.json")
+    state = ClusterState("test", path=path)
+    state.set("network", "net-1")
+    state.save()
+
+    lookup = MagicMock(return_value=Munch(id="net-2"))
+    get_by_id = MagicMock(side_effect=Exception("not found"))
+
+    expired = ClusterState("test", path=path, ttl=0)
+    assert expired.get("network") is None
+    assert expired.resolve("network", get_by_id, lookup).id == "net-2"
+    get_by_id.assert_not_called()
+
+    gone = ClusterState("test", path=path)
+    assert gone.resolve("network", get_by_id, lookup).id == "net-2"
+    get_by_id.assert_called_once_with("net-1")
+    assert gone.get("network") == "net-2"
+
+
+def test_state_remove(tmp_path):
+    path = tmp_path / "state.json"
+    state = ClusterState("test", path=str(path))
+    state.set("router", "rt-1")
+    state.save()
+    assert path.exists()
+
+    state.remove()
+    assert not path.exists()
+    assert ClusterState("test", path=str(path)).get("router") is None
@@ -1,8 +1,18 @@
+import asyncio
+import http.server
 import io
+import itertools
+import json
+import os
+import threading
+import time
 import unittest.mock
 
+import pytest
+
 from koris.util.util import (KorisVersionCheck, name_validation,
-                             k8s_version_validation)
+                             k8s_version_validation, Backoff, WaitTimeout,
+                             wait_for, TaskGraph, check_latest_version)
 from koris.util.hue import red
 
 phtml = """
@@ -82,3 +92,172 @@ def test_k8s_version_validation():
     for vers in INVALID_VERSIONS:
         print(f"NOK: {vers}")
         assert k8s_version_validation(vers) is False
+
+
+def test_backoff_grows_to_max_delay():
+    backoff = Backoff(delay=1, max_delay=8, factor=2, jitter=0)
+    assert list(itertools.islice(backoff, 5)) == [1, 2, 4, 8, 8]
+
+
+def test_backoff_jitter():
+    for delay in itertools.islice(Backoff(delay=1, factor=1, jitter=0.1), 50):
+        assert 0.9 <= delay <= 1.1
+
+
+def test_backoff_deadline():
+    backoff = Backoff(delay=10, timeout=60, deadline=time.monotonic() + 0.05)
+    assert next(backoff) <= 0.05
+    time.sleep(0.06)
+    with pytest.raises(StopIteration):
+        next(backoff)
+
+
+def test_wait_for():
+    states = iter(["BUILD", "BUILD", "ACTIVE"])
+
+    async def check():
+        return next(states) == "ACTIVE"
+
+    loop = asyncio.new_event_loop()
+    assert loop.run_until_complete(
+        wait_for(check, Backoff(delay=0.01, jitter=0)))
+
+    async def never():
+        return None
+
+    with pytest.raises(WaitTimeout):
+        loop.run_until_complete(
+            wait_for(never, Backoff(delay=0.01, timeout=0.05), what="test"))
+    loop.close()
+
+
+def test_task_graph_runs_independent_tasks_concurrently():
+    order = []
+
+    def task(name, delay, result=None):
+        async def run(*args):
+            order.append(("start", name, args))
+            await asyncio.sleep(delay)
+            order.append(("end", name))
+            return result
+        return run
+
+    graph = TaskGraph()
+    graph.add("servers", task("servers", 0.05, "s"))
+    graph.add("lb", task("lb", 0.01, "l"))
+    graph.add("ports", task("ports", 0, "p"), requires=("servers",))
+    graph.add("secgroup", task("secgroup", 0), requires=("ports", "lb"))
+
+    loop = asyncio.new_event_loop()
+    start = time.monotonic()
+    results = loop.run_until_complete(graph.run())
+    loop.close()
+
+    assert time.monotonic() - start < 0.1
+    assert results == {"servers": "s", "lb": "l", "ports": "p", "secgroup": None}
+    assert order.index(("start", "lb", ())) < order.index(("end", "servers"))
+    assert order.index(("end", "servers")) < order.index(("start", "ports", ("s",)))
+    assert ("start", "secgroup", ("p", "l")) in order
+
+
+def test_task_graph_failure_skips_dependent_tasks():
+    done = []
+
+    async def fail():
+        raise ValueError("boom")
+
+    async def record(*args):
+        done.append(args)
+
+    graph = TaskGraph()
+    graph.add("servers", fail)
+    graph.add("ports", record, requires=("servers",))
+    graph.add("keypair", record)
+
+    loop = asyncio.new_event_loop()
+    with pytest.raises(ValueError):
+        loop.run_until_complete(graph.run())
+    loop.close()
+
+    assert done == [()]
+
+
+def test_task_graph_detects_cycles():
+    async def noop(*args):
+        pass
+
+    graph = TaskGraph()
+    graph.add("a", noop, requires=("b",))
+    graph.add("b", noop, requires=("a",))
+
+    loop = asyncio.new_event_loop()
+    with pytest.raises(ValueError):
+        loop.run_until_complete(graph.run())
+    loop.close()
+
+
+@pytest.fixture
+def docs_server():
+    """a local stand-in for the koris docs"""
+    requests = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            requests.append(self.path)
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(phtml.encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d/" % server.server_port, requests
+    server.shutdown()
+    server.server_close()
+
+
+def test_check_latest_version(docs_server, tmp_path, monkeypatch):
+    url, requests = docs_server
+    cache = str(tmp_path / "version.json")
+    monkeypatch.delenv("KORIS_VERSION_CHECK", raising=False)
+
+    # nothing cached yet: no warning, the docs are fetched in the background
+    with unittest.mock.patch('sys.stdout', new_callable=io.StringIO) as out:
+        thread = check_latest_version("0.9.1", url, cache_path=cache)
+        # koris never waits for the check before it exits
+        assert thread.daemon
+        thread.join(5)
+        assert out.getvalue() == ""
+    assert requests == ["/"]
+    with open(cache) as fh:
+        assert json.load(fh)["version"] == "0.9.2"
+    # the cache is written to a temporary file and moved in place
+    assert os.listdir(str(tmp_path)) == ["version.json"]
+
+    # the cached version is used, the docs aren't fetched again
+    with unittest.mock.patch('sys.stdout', new_callable=io.StringIO) as out:
+        assert check_latest_version("0.9.1", url, cache_path=cache) is None
+        assert "0.9.2" in out.getvalue()
+    assert requests == ["/"]
+
+    # once the cache is too old, it is refreshed
+    check_latest_version("0.9.2", url, cache_path=cache, interval=0).join(5)
+    assert requests == ["/", "/"]
+
+    monkeypatch.setenv("KORIS_VERSION_CHECK", "0")
+    assert check_latest_version("0.9.1", url, cache_path=cache, interval=0) is None
+    assert requests == ["/", "/"]
+
+
+def test_check_latest_version_unreachable(tmp_path, monkeypatch):
+    monkeypatch.delenv("KORIS_VERSION_CHECK", raising=False)
+    cache = str(tmp_path / "version.json")
+    start = time.monotonic()
+    thread = check_latest_version("0.9.1", "http://127.0.0.1:1/", cache_path=cache)
+    assert time.monotonic() - start < 0.5
+    thread.join(5)
+    with open(cache) as fh:
+        assert json.load(fh)["version"] == "0.0.0"